@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # lookups pg_trgm (pharmacie/recherche.py)
      'corsheaders',
     'rest_framework',
     'rest_framework.authtoken', 
@@ -8,14 +8,29 @@ export async function POST(request: Request) {
   const body = await request.json();
   const direction = body.direction;
   const debug = body.debug ?? false;
+  const dryRun = body.dryRun ?? false;
 
   if (direction !== 'remote_to_local' && direction !== 'local_to_remote') {
     return NextResponse.json({ error: 'Direction invalide' }, { status: 400 });
   }
 
-  const command = direction === 'remote_to_local'
-    ? 'docker compose exec backend python hopitalsage_front/sync_remote_to_local.py'
-    : 'docker compose exec backend python hopitalsage_front/sync_local_to_remote.py';
+  const script = direction === 'remote_to_local'
+    ? 'hopitalsage_front/sync_remote_to_local.py'
+    : 'hopitalsage_front/sync_local_to_remote.py';
+  const command = `docker compose exec backend python ${script}${dryRun ? ' --dry-run' : ''}`;
+
+  // Rapport JSON écrit par le script à côté de last_sync.json
+  const lireRapport = async () => {
+    try {
+      const { stdout } = await execAsync(
+        'docker compose exec backend cat hopitalsage_front/last_sync_report.json',
+        { maxBuffer: 1024 * 1024 * 10 }
+      );
+      return JSON.parse(stdout);
+    } catch {
+      return null;
+    }
+  };
 
   try {
     let stdout = '';
@@ -46,7 +61,10 @@ export async function POST(request: Request) {
 
     return NextResponse.json({
       success: true,
-      message: `✅ Synchronisation terminée avec succès le ${now}`,
+      message: dryRun
+        ? `🧪 Simulation terminée le ${now} (aucune écriture)`
+        : `✅ Synchronisation terminée avec succès le ${now}`,
+      rapport: await lireRapport(),
       ...(debug && { logs: stdout || stderr || 'Aucun log disponible.' }),
     });
   } catch (error: any) {
@@ -55,6 +73,7 @@ export async function POST(request: Request) {
       {
         success: false,
         error: '❌ Une erreur est survenue pendant la synchronisation.',
+        rapport: await lireRapport(),
         ...(debug && { logs: error.stderr || error.message }),
       },
       { status: 500 }
@@ -23,11 +23,13 @@ export default function HistoriqueMouvements() {
   const [mouvements, setMouvements] = useState<Mouvement[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [suivant, setSuivant] = useState<string | null>(null); // Page suivante (commandes plus anciennes)
 
-  useEffect(() => {
+  const chargerMouvements = (url: string, ajouter: boolean) => {
     const token = localStorage.getItem('accessToken');
     if (token) {
-      fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/historique-mouvements/`, {
+      setLoading(true);
+      fetch(url, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
@@ -37,7 +39,8 @@ export default function HistoriqueMouvements() {
           return res.json();
         })
         .then((data) => {
-          setMouvements(data);
+          setMouvements((prev) => (ajouter ? [...prev, ...data.results] : data.results));
+          setSuivant(data.next);
           setLoading(false);
         })
         .catch((err) => {
@@ -46,13 +49,17 @@ export default function HistoriqueMouvements() {
           setLoading(false);
         });
     }
+  };
+
+  useEffect(() => {
+    chargerMouvements(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/historique-mouvements/`, false);
   }, []);
 
   return (
     <div className="p-6">
       <h2 className="text-2xl font-bold mb-4">Historique des Commandes et Réceptions</h2>
 
-      {loading && <p className="text-gray-600">Chargement...</p>}
+      {loading && mouvements.length === 0 && <p className="text-gray-600">Chargement...</p>}
       {error && <p className="text-red-500">{error}</p>}
 
       {mouvements.map((mouvement) => (
@@ -91,6 +98,18 @@ export default function HistoriqueMouvements() {
           </table>
         </div>
       ))}
+
+      {suivant && (
+        <div className="flex justify-center mt-6">
+          <button
+            className="px-4 py-2 bg-gray-200 rounded hover:bg-gray-300 disabled:opacity-50"
+            onClick={() => chargerMouvements(suivant, true)}
+            disabled={loading}
+          >
+            Charger plus
+          </button>
+        </div>
+      )}
     </div>
   );
 }
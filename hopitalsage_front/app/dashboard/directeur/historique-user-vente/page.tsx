@@ -39,37 +39,43 @@ export default function HistoriqueVentes() {
   const [dateDebut, setDateDebut] = useState('');
   const [dateFin, setDateFin] = useState('');
 
-  const fetchVentes = () => {
+  // Les totaux par utilisateur et par mois portent sur toute la période :
+  // on suit les curseurs (suivant_ventes) jusqu'à la dernière page
+  const fetchVentes = async () => {
     const token = localStorage.getItem('accessToken');
     if (!token) return;
 
-    let url = `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/historique-ventes/`;
-    const params = new URLSearchParams();
-
+    const params = new URLSearchParams({ flux: 'ventes', page_size: '500' });
     if (dateDebut) params.append('date_debut', dateDebut);
     if (dateFin) params.append('date_fin', dateFin);
 
-    if (params.toString()) url += `?${params.toString()}`;
-
     setLoading(true);
-    fetch(url, {
-      headers: {
-        Authorization: `Bearer ${token}`,
-      },
-    })
-      .then((res) => {
+    setError(null);
+    try {
+      const toutes: Vente[] = [];
+      let curseur: string | null = null;
+      do {
+        const pageParams = new URLSearchParams(params);
+        if (curseur) pageParams.set('curseur_ventes', curseur);
+
+        const res = await fetch(
+          `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/historique-ventes/?${pageParams.toString()}`,
+          { headers: { Authorization: `Bearer ${token}` } },
+        );
         if (!res.ok) throw new Error('Erreur lors du chargement');
-        return res.json();
-      })
-      .then((data) => {
-        setVentes(data);
-        setLoading(false);
-      })
-      .catch((err) => {
-        console.error(err);
-        setError('Erreur de chargement');
-        setLoading(false);
-      });
+        const data = await res.json();
+
+        toutes.push(...(data.ventes || []));
+        curseur = data.suivant_ventes ?? null;
+      } while (curseur);
+
+      setVentes(toutes);
+    } catch (err) {
+      console.error(err);
+      setError('Erreur de chargement');
+    } finally {
+      setLoading(false);
+    }
   };
 
   useEffect(() => {
@@ -36,6 +36,43 @@ export default function HistoriqueVentesDepenses() {
   const [error, setError] = useState<string | null>(null);
   const [dateDebut, setDateDebut] = useState('');
   const [dateFin, setDateFin] = useState('');
+  // Curseurs des pages suivantes (null = fin de liste) et totaux de la période
+  const [suivantVentes, setSuivantVentes] = useState<string | null>(null);
+  const [suivantDepenses, setSuivantDepenses] = useState<string | null>(null);
+  const [totaux, setTotaux] = useState<{ ventes: number; depenses: number }>({ ventes: 0, depenses: 0 });
+
+  const buildUrl = (extra: Record<string, string> = {}) => {
+    const params = new URLSearchParams();
+    if (dateDebut) params.append('date_debut', dateDebut);
+    if (dateFin) params.append('date_fin', dateFin);
+    Object.entries(extra).forEach(([cle, valeur]) => params.append(cle, valeur));
+    const query = params.toString();
+    return `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/historique-ventes/${query ? `?${query}` : ''}`;
+  };
+
+  const chargerPlus = (flux: 'ventes' | 'depenses') => {
+    const token = localStorage.getItem('accessToken');
+    const curseur = flux === 'ventes' ? suivantVentes : suivantDepenses;
+    if (!token || !curseur) return;
+
+    fetch(buildUrl({ flux, [`curseur_${flux}`]: curseur }), {
+      headers: { Authorization: `Bearer ${token}` },
+    })
+      .then((res) => {
+        if (!res.ok) throw new Error(`Erreur ${res.status}`);
+        return res.json();
+      })
+      .then((data) => {
+        if (flux === 'ventes') {
+          setVentes((prev) => [...prev, ...(data.ventes || [])]);
+          setSuivantVentes(data.suivant_ventes ?? null);
+        } else {
+          setDepenses((prev) => [...prev, ...(data.depenses || [])]);
+          setSuivantDepenses(data.suivant_depenses ?? null);
+        }
+      })
+      .catch((err) => setError(err.message || 'Impossible de charger la suite.'));
+  };
 
   const fetchData = () => {
     const token = localStorage.getItem('accessToken');
@@ -45,13 +82,7 @@ export default function HistoriqueVentesDepenses() {
       return;
     }
 
-    let url = `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/historique-ventes/`;
-    const params = new URLSearchParams();
-
-    if (dateDebut) params.append('date_debut', dateDebut);
-    if (dateFin) params.append('date_fin', dateFin);
-
-    if (params.toString()) url += `?${params.toString()}`;
+    const url = buildUrl();
 
     setLoading(true);
     setError(null);
@@ -72,6 +103,12 @@ export default function HistoriqueVentesDepenses() {
       .then((data) => {
         setVentes(data.ventes || []);
         setDepenses(data.depenses || []);
+        setSuivantVentes(data.suivant_ventes ?? null);
+        setSuivantDepenses(data.suivant_depenses ?? null);
+        setTotaux({
+          ventes: parseFloat(data.totaux?.ventes ?? 0),
+          depenses: parseFloat(data.totaux?.depenses ?? 0),
+        });
         setLoading(false);
       })
       .catch((err) => {
@@ -85,16 +122,9 @@ export default function HistoriqueVentesDepenses() {
     fetchData();
   }, []);
 
-  // Calcul des totaux
-  const totalVentes = ventes.reduce(
-    (acc, vente) => acc + parseFloat(vente.montant_total),
-    0
-  );
-
-  const totalDepenses = depenses.reduce(
-    (acc, depense) => acc + parseFloat(depense.montant),
-    0
-  );
+  // Totaux calculés par l'API sur toute la période (les listes sont paginées)
+  const totalVentes = totaux.ventes;
+  const totalDepenses = totaux.depenses;
 
   const solde = totalVentes - totalDepenses;
 
@@ -248,6 +278,14 @@ export default function HistoriqueVentesDepenses() {
               </div>
             ))
           )}
+          {suivantVentes && (
+            <button
+              onClick={() => chargerPlus('ventes')}
+              className="bg-white border px-4 py-2 rounded hover:bg-gray-100 mb-6"
+            >
+              Charger plus de ventes
+            </button>
+          )}
 
           {/* Section Dépenses */}
           <h3 className="text-xl font-semibold mb-2 text-gray-700 mt-8">Dépenses</h3>
@@ -279,6 +317,14 @@ export default function HistoriqueVentesDepenses() {
               </div>
             ))
           )}
+          {suivantDepenses && (
+            <button
+              onClick={() => chargerPlus('depenses')}
+              className="bg-white border px-4 py-2 rounded hover:bg-gray-100"
+            >
+              Charger plus de dépenses
+            </button>
+          )}
         </>
       )}
     </div>
@@ -18,8 +18,9 @@ export default function AlertesRupturePage() {
   const [produits, setProduits] = useState<Produit[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null); // Nouvel état pour les erreurs
+  const [suivant, setSuivant] = useState<string | null>(null); // Page suivante (les plus urgents d'abord)
 
-  useEffect(() => {
+  const chargerAlertes = (url: string, ajouter: boolean) => {
     const accessToken = localStorage.getItem('accessToken');
 
     if (!accessToken) {
@@ -28,7 +29,8 @@ export default function AlertesRupturePage() {
       return;
     }
 
-    fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/produits-alerte/`, {
+    setLoading(true);
+    fetch(url, {
       headers: {
         Authorization: `Bearer ${accessToken}`,
       },
@@ -50,7 +52,8 @@ export default function AlertesRupturePage() {
         return JSON.parse(text);
       })
       .then((data) => {
-        setProduits(data);
+        setProduits((prev) => (ajouter ? [...prev, ...data.results] : data.results));
+        setSuivant(data.next);
         setError(null); // Réinitialise l'erreur en cas de succès
       })
       .catch((err) => {
@@ -60,6 +63,10 @@ export default function AlertesRupturePage() {
       .finally(() => {
         setLoading(false);
       });
+  };
+
+  useEffect(() => {
+    chargerAlertes(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/produits-alerte/`, false);
   }, []);
 
   return (
@@ -81,7 +88,7 @@ export default function AlertesRupturePage() {
         )}
 
         {/* Loader */}
-        {loading ? (
+        {loading && produits.length === 0 ? (
           <p className="text-gray-500 animate-pulse">Chargement des alertes...</p>
         ) : produits.length === 0 ? (
           <motion.p
@@ -98,7 +105,7 @@ export default function AlertesRupturePage() {
                 key={produit.id}
                 initial={{ opacity: 0, y: 30 }}
                 animate={{ opacity: 1, y: 0 }}
-                transition={{ delay: index * 0.1 }}
+                transition={{ delay: Math.min(index, 10) * 0.1 }}
               >
                 <Card
                   className={`rounded-2xl shadow-md border-2 hover:shadow-xl transition duration-300 ${
@@ -140,6 +147,18 @@ export default function AlertesRupturePage() {
             ))}
           </div>
         )}
+
+        {suivant && (
+          <div className="flex justify-center mt-6">
+            <button
+              className="px-4 py-2 bg-gray-200 rounded hover:bg-gray-300 disabled:opacity-50"
+              onClick={() => chargerAlertes(suivant, true)}
+              disabled={loading}
+            >
+              Charger plus
+            </button>
+          </div>
+        )}
       </div>
     </PharmacieLayout>
   );
@@ -13,89 +13,69 @@ interface Lot {
   pharmacie_id: string
 }
 
-function addDays(days: number) {
-  const date = new Date()
-  date.setDate(date.getDate() + days)
-  return date.toISOString().split('T')[0]
+interface Tranche {
+  tranche: 'perimes' | 'j7' | 'j30' | 'j60'
+  libelle: string
+  debut: string | null
+  fin: string
+  lots: number
+  quantite: number
+  valeur_achat: number
+  valeur_vente: number
+}
+
+const COULEURS_TRANCHES: Record<Tranche['tranche'], string> = {
+  perimes: 'bg-red-600 hover:bg-red-700 text-white',
+  j7: 'bg-yellow-400 hover:bg-yellow-500 text-black',
+  j30: 'bg-orange-400 hover:bg-orange-500 text-black',
+  j60: 'bg-red-500 hover:bg-red-600 text-white',
 }
 
 export default function PageLotsExpire() {
   const [lots, setLots] = useState<Lot[]>([])
-  const [periode, setPeriode] = useState<'expired' | 'week' | 'month' | 'two_months'>('week')
+  const [tranches, setTranches] = useState<Tranche[]>([])
+  const [periode, setPeriode] = useState<Tranche['tranche']>('j7')
+  const [suivant, setSuivant] = useState<string | null>(null)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
 
-  // 🔍 Debug Logs (tu peux les supprimer plus tard)
-  const [debugData, setDebugData] = useState<{
-    token?: string
-    pharmacieId?: string
-    rawData?: any
-    filteredData?: Lot[]
-  }>({})
+  const headers = () => {
+    const token = localStorage.getItem('accessToken')
+    if (!token) throw new Error("Token introuvable.")
+    return { Authorization: `Bearer ${token}` }
+  }
 
+  // Résumé par tranche (une requête groupée côté serveur)
   useEffect(() => {
-    const fetchLots = async () => {
-      try {
-        // Étape 1 : Récupérer le token
-        const token = localStorage.getItem('accessToken')
-        if (!token) throw new Error("Token introuvable.")
-
-        // Sauvegarder dans debug
-        setDebugData(prev => ({ ...prev, token }))
-
-        // Étape 2 : Récupérer utilisateur
-        const userRes = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/user/me/`, {
-          headers: { Authorization: `Bearer ${token}` }
-        })
-
-        if (!userRes.ok) throw new Error("Échec lors de la récupération de l'utilisateur.")
-        const user = await userRes.json()
-
-        const pharmacieId = user.pharmacie
-        setDebugData(prev => ({ ...prev, pharmacieId }))
-        console.log('Pharmacie ID:', pharmacieId)
-
-        // Étape 3 : Récupérer les lots selon la période
-        const periodMap = {
-          expired: 'expired',
-          week: 'week',
-          month: 'month',
-          two_months: 'two_months'
-        }
-
-        const url = `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/lotss/expires/?period=${periodMap[periode]}`
-        console.log('URL appelée:', url)
-
-        const res = await fetch(url, {
-          headers: { Authorization: `Bearer ${token}` }
-        })
-
-        if (!res.ok) {
-          const errText = await res.text()
-          console.error('Erreur API:', errText)
-          throw new Error(`Échec lors de la récupération des lots. Code: ${res.status}`)
-        }
-
-        const data = await res.json()
-        setDebugData(prev => ({ ...prev, rawData: data }))
-        console.log('Données brutes reçues:', data)
-
-        // Étape 4 : Filtrer par pharmacie
-        const filtered = data.filter((lot: Lot) => lot.pharmacie_id === pharmacieId.id)
-        setDebugData(prev => ({ ...prev, filteredData: filtered }))
-        console.log('Lots filtrés:', filtered)
-
-        setLots(filtered)
-        setError(null)
-      } catch (err: any) {
-        console.error('Erreur détaillée:', err)
-        setError(err.message || "Erreur inconnue")
-      } finally {
-        setLoading(false)
-      }
+    fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/lotss/peremption/`, { headers: headers() })
+      .then((res) => {
+        if (!res.ok) throw new Error(`Échec lors de la récupération du rapport. Code: ${res.status}`)
+        return res.json()
+      })
+      .then((data) => setTranches(data.tranches))
+      .catch((err) => setError(err.message || "Erreur inconnue"))
+  }, [])
+
+  // Lots de la tranche choisie, page par page (déjà limités à la pharmacie de l'utilisateur)
+  const chargerLots = async (url: string, ajouter: boolean) => {
+    try {
+      setLoading(true)
+      const res = await fetch(url, { headers: headers() })
+      if (!res.ok) throw new Error(`Échec lors de la récupération des lots. Code: ${res.status}`)
+      const data = await res.json()
+      setLots((prev) => (ajouter ? [...prev, ...data.results] : data.results))
+      setSuivant(data.next)
+      setError(null)
+    } catch (err: any) {
+      console.error('Erreur détaillée:', err)
+      setError(err.message || "Erreur inconnue")
+    } finally {
+      setLoading(false)
     }
+  }
 
-    fetchLots()
+  useEffect(() => {
+    chargerLots(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/lotss/peremption/${periode}/`, false)
   }, [periode])
 
   const getUrgencyColor = (dateStr: string) => {
@@ -129,40 +109,24 @@ export default function PageLotsExpire() {
           Produits proches de péremption
         </h1>
 
-        {/* Boutons de filtrage */}
+        {/* Tranches de péremption : nombre de lots et valeur du stock */}
         <div className="flex gap-4 mb-8 flex-wrap">
-          <button
-            onClick={() => setPeriode('expired')}
-            className="bg-red-600 hover:bg-red-700 text-white font-semibold px-4 py-2 rounded shadow"
-          >
-            Périmés
-          </button>
-          <button
-            onClick={() => setPeriode('week')}
-            className="bg-yellow-400 hover:bg-yellow-500 text-black font-semibold px-4 py-2 rounded shadow"
-          >
-            Dans 7 jours
-          </button>
-          <button
-            onClick={() => setPeriode('month')}
-            className="bg-orange-400 hover:bg-orange-500 text-black font-semibold px-4 py-2 rounded shadow"
-          >
-            Dans 30 jours
-          </button>
-          <button
-            onClick={() => setPeriode('two_months')}
-            className="bg-red-500 hover:bg-red-600 text-white font-semibold px-4 py-2 rounded shadow"
-          >
-            Dans 60 jours
-          </button>
+          {tranches.map((t) => (
+            <button
+              key={t.tranche}
+              onClick={() => setPeriode(t.tranche)}
+              className={`${COULEURS_TRANCHES[t.tranche]} font-semibold px-4 py-2 rounded shadow text-left ${
+                periode === t.tranche ? 'ring-4 ring-offset-2 ring-gray-400' : ''
+              }`}
+            >
+              <div>{t.libelle} ({t.lots})</div>
+              <div className="text-xs font-normal">
+                {t.quantite} unités — {Number(t.valeur_achat).toLocaleString('fr-FR')} Fc
+              </div>
+            </button>
+          ))}
         </div>
 
-        {/* Debug info (optionnel) */}
-        <details className="mb-6 text-xs text-gray-500">
-          <summary>Voir les données de débogage</summary>
-          <pre>{JSON.stringify(debugData, null, 2)}</pre>
-        </details>
-
         {/* Erreur */}
         {error && (
           <div className="bg-red-100 border-l-4 border-red-500 text-red-700 p-4 mb-6 rounded">
@@ -171,7 +135,7 @@ export default function PageLotsExpire() {
         )}
 
         {/* Chargement */}
-        {loading ? (
+        {loading && lots.length === 0 ? (
           <p className="text-gray-500">Chargement...</p>
         ) : lots.length === 0 ? (
           <div className="text-gray-600 text-center mt-16">
@@ -206,6 +170,18 @@ export default function PageLotsExpire() {
             ))}
           </div>
         )}
+
+        {suivant && (
+          <div className="flex justify-center mt-6">
+            <button
+              className="px-4 py-2 bg-gray-200 rounded hover:bg-gray-300 disabled:opacity-50"
+              onClick={() => chargerLots(suivant, true)}
+              disabled={loading}
+            >
+              Charger plus
+            </button>
+          </div>
+        )}
       </div>
     </PharmacieLayout>
   )
@@ -79,13 +79,76 @@ export default function VentePage() {
     }
   }, [accessToken]);
 
-  const loadProduits = (pharmacieId: number) => {
-    axios
-      .get(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/produits-pharmacie/?pharmacie=${pharmacieId}`, {
+  // Catalogue caisse mis en cache localement : seuls les changements depuis la
+  // dernière version sont téléchargés (/api/produits-pharmacie/catalogue/)
+  const loadProduits = async (pharmacieId: number) => {
+    const cle = `catalogue-caisse-${pharmacieId}`;
+    let cache: { version: number; produits: ProduitPharmacie[] } | null = null;
+    try {
+      cache = JSON.parse(localStorage.getItem(cle) || 'null');
+    } catch {
+      cache = null;
+    }
+    if (cache) setProduits(cache.produits);
+
+    const charger = (version?: number) =>
+      axios.get(`${process.env.NEXT_PUBLIC_API_BASE_URL}/api/produits-pharmacie/catalogue/`, {
         headers: { Authorization: `Bearer ${accessToken}` },
-      })
-      .then((res) => setProduits(res.data))
-      .catch(() => setError("Erreur lors du chargement des produits"));
+        params: version !== undefined ? { version } : {},
+      });
+
+    try {
+      let res;
+      try {
+        res = await charger(cache?.version);
+      } catch (err: any) {
+        // Version refusée (base restaurée...) : catalogue complet
+        if (err.response?.status !== 400 || !cache) throw err;
+        cache = null;
+        res = await charger();
+      }
+
+      const { version, complet, produits: modifies, supprimes } = res.data;
+      let catalogue: ProduitPharmacie[];
+      if (complet || !cache) {
+        catalogue = modifies;
+      } else {
+        const retires = new Set([...supprimes, ...modifies.map((p: ProduitPharmacie) => p.id)]);
+        catalogue = [...cache.produits.filter((p) => !retires.has(p.id)), ...modifies];
+      }
+      setProduits(catalogue);
+      localStorage.setItem(cle, JSON.stringify({ version, produits: catalogue }));
+    } catch {
+      if (!cache) setError("Erreur lors du chargement des produits");
+    }
+  };
+
+  // Lecteur code-barre : il tape le code puis Entrée
+  const scanProduit = async (code: string) => {
+    try {
+      const res = await axios.get(
+        `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/produits-pharmacie/scan/${encodeURIComponent(code)}/`,
+        { headers: { Authorization: `Bearer ${accessToken}` } }
+      );
+      const produit: ProduitPharmacie = res.data;
+      setProduits((prev) => [...prev.filter((p) => p.id !== produit.id), produit]);
+      if (lignes.some((l) => l.produit?.id === produit.id)) {
+        alert('Ce produit a déjà été sélectionné dans la commande.');
+        return;
+      }
+      const emptyIndex = lignes.findIndex((l) => l.produit === null);
+      const ligne = { produit, quantite: 1, prix_unitaire: produit.prix_vente, total: produit.prix_vente * 1 };
+      if (emptyIndex >= 0) {
+        const copy = [...lignes];
+        copy[emptyIndex] = ligne;
+        setLignes(copy);
+      } else {
+        setLignes([...lignes, ligne]);
+      }
+      setSearchTerm('');
+    } catch {
+      alert('Aucun produit avec ce code-barre.');
+    }
   };
 
   const loadClients = (pharmacieId: number) => {
@@ -237,7 +300,8 @@ export default function VentePage() {
     return <div className="p-6 text-red-500 text-center">{error}</div>;
 
   const filteredProduits = produits.filter((p) =>
-    p.nom_medicament.toLowerCase().includes(searchTerm.toLowerCase())
+    p.nom_medicament.toLowerCase().includes(searchTerm.toLowerCase()) ||
+    p.code_barre.startsWith(searchTerm)
   );
 
   const filteredClients = clients.filter((c) =>
@@ -258,10 +322,13 @@ export default function VentePage() {
 
             <input
               type="text"
-              placeholder="Rechercher un médicament..."
+              placeholder="Rechercher un médicament ou scanner un code-barre..."
               className="w-full p-3 border rounded-lg"
               value={searchTerm}
               onChange={(e) => setSearchTerm(e.target.value)}
+              onKeyDown={(e) => {
+                if (e.key === 'Enter' && searchTerm.trim()) scanProduit(searchTerm.trim());
+              }}
             />
 
             {searchTerm && (
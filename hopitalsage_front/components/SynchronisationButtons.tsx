@@ -2,10 +2,44 @@
 
 import { useEffect, useState } from 'react';
 
+// Rapport écrit par les scripts de synchro (hopitalsage_front/last_sync_report.json)
+interface MesuresModele {
+  modele: string;
+  lus: number;
+  crees: number;
+  mis_a_jour: number;
+  supprimes: number;
+  inchanges: number;
+  conflits: number;
+  duree: number;
+  requetes: Record<string, number>;
+  octets_envoyes: Record<string, number>;
+}
+
+interface RapportSync {
+  debut: string;
+  fin: string;
+  duree: number;
+  dry_run: boolean;
+  erreur?: string;
+  directions: {
+    source: string;
+    cible: string;
+    depuis: number | null;
+    jusqua: number;
+    modeles: MesuresModele[];
+  }[];
+}
+
+const somme = (valeurs: Record<string, number>) =>
+  Object.values(valeurs || {}).reduce((total, n) => total + n, 0);
+
 export default function SynchronisationButtons() {
   const [syncLoading, setSyncLoading] = useState(false);
   const [syncLog, setSyncLog] = useState<string | null>(null);
   const [progress, setProgress] = useState<number>(0);
+  const [dryRun, setDryRun] = useState(false);
+  const [rapport, setRapport] = useState<RapportSync | null>(null);
 
   useEffect(() => {
     let interval: NodeJS.Timeout;
@@ -29,22 +63,24 @@ export default function SynchronisationButtons() {
         ? 'Confirmez-vous la synchronisation de Render vers Local ?'
         : 'Confirmez-vous la synchronisation de Local vers Render ?';
 
-    const confirmed = window.confirm(confirmationMessage);
-    if (!confirmed) return;
+    // Une simulation n'écrit rien : pas de confirmation
+    if (!dryRun && !window.confirm(confirmationMessage)) return;
 
     setSyncLoading(true);
     setSyncLog(null);
+    setRapport(null);
     setProgress(0);
 
     try {
       const res = await fetch('/api/sync', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ direction, debug: true }),
+        body: JSON.stringify({ direction, debug: true, dryRun }),
       });
 
       const data = await res.json();
       setProgress(100);
+      setRapport(data.rapport ?? null);
 
       if (data.success) {
         setSyncLog(`✅ ${data.message || 'Synchronisation terminée avec succès.'}`);
@@ -79,6 +115,16 @@ export default function SynchronisationButtons() {
         >
           🔼 Local ➝ Render
         </button>
+
+        <label className="flex items-center gap-2 text-sm text-gray-700">
+          <input
+            type="checkbox"
+            checked={dryRun}
+            onChange={(e) => setDryRun(e.target.checked)}
+            disabled={syncLoading}
+          />
+          🧪 Simulation (aucune écriture)
+        </label>
       </div>
 
       {/* Barre de progression et messages */}
@@ -107,12 +153,64 @@ export default function SynchronisationButtons() {
               : syncLog}
           </div>
 
+          {/* Détail par modèle */}
+          {!syncLoading && rapport && (
+            <div className="space-y-3 text-xs">
+              <div className="text-gray-600">
+                {rapport.dry_run ? '🧪 Simulation' : '📊 Rapport'} — durée totale {rapport.duree}s
+                {rapport.erreur && <span className="text-red-600"> — {rapport.erreur}</span>}
+              </div>
+              {rapport.directions.map((direction) => (
+                <div key={`${direction.source}-${direction.cible}`} className="overflow-x-auto">
+                  <div className="font-semibold text-gray-800 mb-1">
+                    {direction.source} ➝ {direction.cible}
+                  </div>
+                  <table className="w-full border text-right">
+                    <thead className="bg-gray-100">
+                      <tr>
+                        <th className="text-left px-2 py-1">Modèle</th>
+                        <th className="px-2 py-1">Lus</th>
+                        <th className="px-2 py-1">Créés</th>
+                        <th className="px-2 py-1">MàJ</th>
+                        <th className="px-2 py-1">Suppr.</th>
+                        <th className="px-2 py-1">Conflits</th>
+                        <th className="px-2 py-1">Requêtes</th>
+                        <th className="px-2 py-1">Ko envoyés</th>
+                        <th className="px-2 py-1">Durée (s)</th>
+                      </tr>
+                    </thead>
+                    <tbody>
+                      {direction.modeles
+                        .filter((m) => m.lus || m.supprimes)
+                        .map((m) => (
+                          <tr key={m.modele} className="border-t">
+                            <td className="text-left px-2 py-1">{m.modele}</td>
+                            <td className="px-2 py-1">{m.lus}</td>
+                            <td className="px-2 py-1">{m.crees}</td>
+                            <td className="px-2 py-1">{m.mis_a_jour}</td>
+                            <td className="px-2 py-1">{m.supprimes}</td>
+                            <td className={`px-2 py-1 ${m.conflits ? 'text-orange-600 font-semibold' : ''}`}>
+                              {m.conflits}
+                            </td>
+                            <td className="px-2 py-1">{somme(m.requetes)}</td>
+                            <td className="px-2 py-1">{(somme(m.octets_envoyes) / 1024).toFixed(1)}</td>
+                            <td className="px-2 py-1">{m.duree}</td>
+                          </tr>
+                        ))}
+                    </tbody>
+                  </table>
+                </div>
+              ))}
+            </div>
+          )}
+
           {progress === 100 && syncLog && (
             <div className="flex justify-center">
               <button
                 className="mt-2 px-4 py-1 text-sm bg-gray-300 rounded hover:bg-gray-400"
                 onClick={() => {
                   setSyncLog(null);
+                  setRapport(null);
                   setProgress(0);
                 }}
               >
@@ -1,8 +1,8 @@
+import argparse
 import os
 import sys
-from django.utils import timezone
-from django.db import connections
-from django.db.utils import IntegrityError
+import json
+import time
 
 # Config Django
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -12,86 +12,196 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gestion_pharmacie.settings")
 import django
 django.setup()
 
-from comptes.models import Pharmacie, User
-from pharmacie.models import (
-    ProduitPharmacie, LotProduitPharmacie,
-    CommandeProduit, CommandeProduitLigne, ReceptionProduit, ReceptionLigne,
-    Client, VenteProduit, VenteLigne,
-    ClientPurchase, MedicalExam, Prescription, Requisition,
-    RendezVous
+from django.db import transaction
+from django.utils import timezone
+
+from comptes.models import Pharmacie
+from pharmacie.synchronisation import (
+    filigrane, lire_journal, sans_journal, acquitter, JournalPurge,
+    par_paquets, upsert, executer_par_dependances, conflits_uniques,
+    MesuresSync, PHARMACIE_LOOKUP_BY_MODEL, modeles_synchronises, suppressions_synchro,
 )
+from pharmacie.statistiques import jours_touches, reconstruire_jours, reconstruire_pharmacie
+
+# Même liste que sync_remote_to_local.py et les paquets hors ligne
+# (MODELES_GLOBAUX / MODELES_PAR_PHARMACIE dans pharmacie/synchronisation.py)
+MODELS_GLOBAL, MODELS_PAR_PHARMACIE = modeles_synchronises()
+
+# Lignes envoyées par INSERT ... ON CONFLICT (un aller-retour Render par paquet)
+BATCH_SIZE = int(os.environ.get("SYNC_BATCH_SIZE", 500))
+SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS", 4))
+
+# Même fichier que sync_remote_to_local.py, avec son propre curseur
+SYNC_TRACK_FILE = os.path.join(CURRENT_DIR, "last_sync.json")
+CLE_CURSEUR = "local_vers_remote"
+SYNC_REPORT_FILE = os.path.join(CURRENT_DIR, "last_sync_report.json")
+
 
-REMOTE = connections['remote']
-
-MODELS_GLOBAL = [
-    Pharmacie,
-    User,
-    
-    
-   
-]
-
-MODELS_PAR_PHARMACIE = [
-    ProduitPharmacie,
-    CommandeProduit,
-    CommandeProduitLigne,
-    ReceptionProduit,
-    ReceptionLigne,
-    LotProduitPharmacie,
-    VenteProduit, 
-    VenteLigne,
-    Requisition,    
-]
+def load_sync_state():
+    if os.path.exists(SYNC_TRACK_FILE):
+        with open(SYNC_TRACK_FILE, "r") as f:
+            return json.load(f)
+    return {}
+
+def save_curseur(curseur):
+    # Relu juste avant l'écriture : l'autre script peut avoir modifié le fichier
+    state = load_sync_state()
+    state.setdefault("journal", {})[CLE_CURSEUR] = curseur
+    with open(SYNC_TRACK_FILE, "w") as f:
+        json.dump(state, f, indent=2, default=str)
 
 
 def get_current_pharmacie():
     return Pharmacie.objects.using('default').first()
 
-def sync_model_to_remote(model, filter_kwargs=None):
+def sync_model_to_remote(model, pharmacie=None, changements=None, dry_run=False):
+    """
+    `changements` : {'upsert': ids, 'delete': ids} lus dans le journal local
+    (None : premier envoi, toute la table).
+    `dry_run` : compte ce qui serait envoyé sans écrire sur Render.
+    Retourne les MesuresSync du modèle.
+    """
+    mesures = MesuresSync(model)
     qs = model.objects.using('default')
+    cibles_remote = model.objects.using('remote')
 
-    # Vérifier si on peut filtrer parv "pharmacie"
-    if filter_kwargs and 'pharmacie' in filter_kwargs:
-        if 'pharmacie' in [field.name for field in model._meta.get_fields()]:
-            qs = qs.filter(**filter_kwargs)
-        else:
-            print(f"⚠️ Le modèle {model.__name__} n'a pas de champ 'pharmacie'. Filtrage ignoré.")
+    # Filtre par pharmacie, y compris pour les modèles qui l'atteignent par une clé étrangère
+    lookup = PHARMACIE_LOOKUP_BY_MODEL.get(model.__name__) if pharmacie else None
+    if lookup:
+        qs = qs.filter(**{lookup: pharmacie})
+        cibles_remote = cibles_remote.filter(**{lookup: pharmacie})
 
     print(f"\n🔄 {model.__name__} local ➜ Render...")
 
-    for local_obj in qs.iterator():
-        try:
-            remote_obj = model.objects.using('remote').get(pk=local_obj.pk)
-        except model.DoesNotExist:
-            remote_obj = None
-
-        if not remote_obj:
-            print(f"➕ {model.__name__} (id={local_obj.pk}) ➜ Render")
-            try:
-                local_obj.save(using='remote')
-            except IntegrityError as e:
-                print(f"⚠️ IntegrityError: {e}")
+    with mesures.mesurer('default', 'remote'):
+        if changements is not None:
+            if changements['delete']:
+                with transaction.atomic(using='remote'), suppressions_synchro():
+                    sans_journal('remote')
+                    for ids in par_paquets(changements['delete'], BATCH_SIZE):
+                        cibles = cibles_remote.filter(pk__in=ids)
+                        mesures.supprimes += cibles.count() if dry_run else cibles.delete()[0]
+                print(f"🗑️ {model.__name__} : {mesures.supprimes} suppression(s) ➜ Render")
+            if not changements['upsert']:
+                return mesures
+
+        ecartes = set()
+        if changements is None:
+            lots = par_paquets(qs.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE)
         else:
-            if hasattr(local_obj, 'updated_at') and hasattr(remote_obj, 'updated_at'):
-                if local_obj.updated_at > remote_obj.updated_at:
-                    print(f"📝 Update {model.__name__} (id={local_obj.pk}) ➜ Render")
-                    local_obj.save(using='remote')
-
-def run():
+            lots = (list(qs.filter(pk__in=ids)) for ids in par_paquets(changements['upsert'], BATCH_SIZE))
+
+        for objets in lots:
+            mesures.lus += len(objets)
+            # Une requête de plus par paquet : créations / mises à jour, et
+            # updated_at de Render (la version la plus récente gagne, comme
+            # dans sync_remote_to_local.sync_data)
+            existants = model.objects.using('remote').filter(pk__in=[o.pk for o in objets])
+            if hasattr(model, 'updated_at'):
+                existants = dict(existants.values_list('pk', 'updated_at'))
+            else:
+                existants = dict.fromkeys(existants.values_list('pk', flat=True))
+
+            a_envoyer = []
+            for obj in objets:
+                updated_at_remote = existants.get(obj.pk)
+                if updated_at_remote and getattr(obj, 'updated_at', None) and updated_at_remote >= obj.updated_at:
+                    mesures.inchanges += 1
+                    continue  # Render a déjà cette version (ou une plus récente)
+                a_envoyer.append(obj)
+            if not a_envoyer:
+                continue
+
+            if dry_run:
+                conflits = conflits_uniques(model, 'remote', a_envoyer)
+            else:
+                _, conflits = upsert(model, 'remote', a_envoyer, taille_lot=BATCH_SIZE)
+            ecartes |= conflits
+            for obj in a_envoyer:
+                if obj.pk in conflits:
+                    continue
+                if obj.pk in existants:
+                    mesures.mis_a_jour += 1
+                else:
+                    mesures.crees += 1
+        mesures.conflits = len(ecartes)
+
+    print(f"📝 {model.__name__} : {mesures.crees + mesures.mis_a_jour} ligne(s) ➜ Render")
+    for pk in ecartes:
+        print(f"⚠️ IntegrityError: {model.__name__} (id={pk}) en conflit d'unicité, ignoré")
+    return mesures
+
+def save_rapport(rapport):
+    with open(SYNC_REPORT_FILE, "w") as f:
+        json.dump(rapport, f, indent=2, default=str)
+
+def run(dry_run=False):
     print("\n🚀 Sync LOCAL ➜ Render")
+    debut = time.monotonic()
+    rapport = {'debut': timezone.now(), 'dry_run': dry_run, 'directions': []}
 
     pharmacie = get_current_pharmacie()
     if not pharmacie:
         print("❌ Aucune pharmacie locale trouvée.")
         return
 
-    for model in MODELS_GLOBAL:
-        sync_model_to_remote(model)
-
-    for model in MODELS_PAR_PHARMACIE:
-        sync_model_to_remote(model, {'pharmacie': pharmacie})
+    depuis = load_sync_state().get("journal", {}).get(CLE_CURSEUR)
+    changements = None
+    if depuis is not None:
+        try:
+            changements, curseur = lire_journal('default', depuis, pharmacie=pharmacie)
+        except JournalPurge as e:
+            print(f"⚠️ {e}")
+    if changements is None:
+        curseur = filigrane('default')
+
+    def synchroniser(model):
+        changements_model = None
+        if changements is not None:
+            changements_model = changements.get(model._meta.db_table, {'upsert': set(), 'delete': set()})
+        return sync_model_to_remote(
+            model, pharmacie if model in MODELS_PAR_PHARMACIE else None, changements_model, dry_run=dry_run,
+        )
+
+    # Jours de vente touchés sur Render, avant écrasement / suppression
+    jours = set()
+    if changements is not None and not dry_run:
+        jours = jours_touches('remote', changements)
+
+    modeles = MODELS_GLOBAL + MODELS_PAR_PHARMACIE
+    try:
+        resultats = executer_par_dependances(modeles, synchroniser, max_workers=SYNC_WORKERS)
+        # Les ventes envoyées par upsert n'alimentent pas VenteJournaliere sur Render
+        if not dry_run:
+            if changements is None:
+                reconstruire_pharmacie('remote', pharmacie)
+            else:
+                reconstruire_jours('remote', jours | jours_touches('remote', changements))
+        rapport['directions'].append({
+            'source': 'default',
+            'cible': 'remote',
+            'depuis': depuis,
+            'jusqua': curseur,
+            'modeles': [resultats[model].en_dict() for model in modeles],
+        })
+    except Exception as e:
+        rapport['erreur'] = str(e)
+        raise
+    finally:
+        rapport['fin'] = timezone.now()
+        rapport['duree'] = round(time.monotonic() - debut, 3)
+        save_rapport(rapport)
+
+    if not dry_run:
+        save_curseur(curseur)
+        # Autorise purger_journal à supprimer ce qui est déjà sur Render
+        acquitter('default', f"{CLE_CURSEUR}:{pharmacie.pk}", curseur)
 
     print("\n✅ Synchronisation locale ➜ Render terminée.")
+    return rapport
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Synchronisation local ➜ Render")
+    parser.add_argument("--dry-run", action="store_true", help="calcule le delta sans rien écrire")
+    args = parser.parse_args()
+    run(dry_run=args.dry_run)
@@ -1,9 +1,9 @@
+import argparse
 import os
 import sys
-from django.db import models
+import time
+from django.db import models, transaction
 from django.core.exceptions import FieldDoesNotExist
-from django.utils.timezone import now
-from datetime import datetime
 import json
 
 # ============================
@@ -17,101 +17,55 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gestion_pharmacie.settings")
 import django
 django.setup()
 
-from comptes.models import Pharmacie, User
-from pharmacie.models import (
-    TauxChange,
-    Fabricant,
-    ProduitFabricant,
-    ProduitPharmacie,
-    LotProduitPharmacie,
-    CommandeProduit,
-    CommandeProduitLigne,
-    ReceptionProduit,
-    ReceptionLigne,
-    Client,
-    VenteProduit,
-    VenteLigne,
-    ClientPurchase,
-    MedicalExam,
-    Prescription,
-    RendezVous,
-    Requisition,
-    PublicitePharmacie,
-    Depense
+from django.utils import timezone
+
+from comptes.models import Pharmacie
+from pharmacie.synchronisation import (
+    filigrane, lire_journal, sans_journal, acquitter, JournalPurge, par_paquets, conflits_uniques,
+    executer_par_dependances, conserver_dates, MesuresSync, modeles_synchronises, suppressions_synchro,
+    PHARMACIE_LOOKUP_BY_MODEL,  # partagé avec les commandes de paquet hors ligne
 )
+from pharmacie.statistiques import jours_touches, reconstruire_jours, reconstruire_pharmacie
 
 # ============================
 # CONFIGURATION SYNCHRO
 # ============================
 
-MODELS_GLOBAL = [
-    TauxChange,
-    Fabricant,
-    ProduitFabricant,
-    Pharmacie,
-    User,
-    PublicitePharmacie,
-]
-
-MODELS_PAR_PHARMACIE = [
-    ProduitPharmacie,
-    LotProduitPharmacie,
-    CommandeProduit,
-    CommandeProduitLigne,
-    ReceptionProduit,
-    ReceptionLigne,
-    Client,
-    VenteProduit,
-    VenteLigne,
-    ClientPurchase,
-    MedicalExam,
-    Prescription,
-    RendezVous,
-    Requisition,
-    Depense,
-]
-
-PHARMACIE_LOOKUP_BY_MODEL = {
-    'ProduitPharmacie': 'pharmacie',
-    'LotProduitPharmacie': 'produit__pharmacie',
-    'CommandeProduit': 'pharmacie',
-    'CommandeProduitLigne': 'commande__pharmacie',
-    'ReceptionProduit': 'commande__pharmacie',
-    'ReceptionLigne': 'reception__commande__pharmacie',
-    'Client': 'pharmacie',
-    'VenteProduit': 'pharmacie',
-    'VenteLigne': 'vente__pharmacie',
-    'ClientPurchase': 'client__pharmacie',
-    'MedicalExam': 'client__pharmacie',
-    'Prescription': 'client__pharmacie',
-    'RendezVous': 'pharmacie',
-    'Requisition': 'pharmacie',
-    'Depense': 'pharmacie',
-}
+# Listes partagées avec sync_local_to_remote.py et les paquets hors ligne
+# (MODELES_GLOBAUX / MODELES_PAR_PHARMACIE dans pharmacie/synchronisation.py)
+MODELS_GLOBAL, MODELS_PAR_PHARMACIE = modeles_synchronises()
 
 SYNC_TRACK_FILE = os.path.join(CURRENT_DIR, "last_sync.json")
+# Rapport détaillé de la dernière exécution (lu par /api/sync)
+SYNC_REPORT_FILE = os.path.join(CURRENT_DIR, "last_sync_report.json")
+
+# Nombre de modèles synchronisés en parallèle (une connexion par thread)
+SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS", 4))
 
 # ============================
 # UTILITAIRES
 # ============================
 
-def load_sync_times():
+def load_sync_state():
     if os.path.exists(SYNC_TRACK_FILE):
         with open(SYNC_TRACK_FILE, "r") as f:
             return json.load(f)
     return {}
 
-def save_sync_times(times):
+def save_sync_state(state):
     with open(SYNC_TRACK_FILE, "w") as f:
-        json.dump(times, f, indent=2, default=str)
+        json.dump(state, f, indent=2, default=str)
 
-SYNC_TIMES = load_sync_times()
+# Curseur de journal (txid) déjà synchronisé, par base source.
+# Les anciennes clés par modèle (dates updated_at) ne sont plus utilisées.
+SYNC_STATE = load_sync_state()
 
-def get_last_sync_time(model):
-    return datetime.fromisoformat(SYNC_TIMES.get(model.__name__, "1970-01-01T00:00:00"))
+def get_curseur(source_db):
+    return SYNC_STATE.get("journal", {}).get(source_db)
 
-def update_last_sync_time(model):
-    SYNC_TIMES[model.__name__] = now().isoformat()
+def set_curseur(source_db, curseur):
+    SYNC_STATE.setdefault("journal", {})[source_db] = curseur
+    save_sync_state(SYNC_STATE)
 
 def get_current_pharmacie():
     return Pharmacie.objects.using('default').first()
@@ -123,79 +77,190 @@ def get_pharmacie_lookup(model):
 # SYNCHRO
 # ============================
 
-def sync_data(source_db, target_db, model, pharmacie=None, verbose=False):
+def sync_data(source_db, target_db, model, pharmacie=None, verbose=False, changements=None, dry_run=False):
+    """
+    Copie `model` de source_db vers target_db et retourne ses MesuresSync.
+
+    `changements` : {'upsert': ids, 'delete': ids} lus dans le journal de la
+    source ; None lors de la toute première synchro (copie complète).
+    `dry_run` : calcule le delta (créations, mises à jour, suppressions,
+    conflits) sans rien écrire dans target_db.
+    """
+    mesures = MesuresSync(model)
     print(f"🔄 Sync: {model.__name__} [{source_db} → {target_db}]")
 
+    if changements is not None and not (changements['upsert'] or changements['delete']):
+        print("   🟡 Rien à synchroniser")
+        return mesures
+
     fk_fields = [f.name for f in model._meta.fields if isinstance(f, models.ForeignKey)]
     qs = model.objects.using(source_db).select_related(*fk_fields)
+    cibles_target = model.objects.using(target_db)
 
     if pharmacie:
         lookup = get_pharmacie_lookup(model)
         if lookup:
             try:
                 qs = qs.filter(**{lookup: pharmacie})
+                cibles_target = cibles_target.filter(**{lookup: pharmacie})
             except FieldDoesNotExist:
                 pass
 
-    # Filtrage par date de dernière synchro
-    last_sync = get_last_sync_time(model)
-    if hasattr(model, 'updated_at'):
-        qs = qs.filter(updated_at__gt=last_sync)
-
-    source_ids = list(qs.values_list('pk', flat=True))
-    if not source_ids:
-        print("   🟡 Rien à synchroniser")
-        return
-
-    # Objets existants par PK
-    existing_ids = set(model.objects.using(target_db).filter(pk__in=source_ids).values_list('pk', flat=True))
+    with mesures.mesurer(source_db, target_db), transaction.atomic(using=target_db):
+        # Les écritures de la synchro ne sont pas journalisées dans la cible
+        sans_journal(target_db)
+
+        if changements is not None:
+            with suppressions_synchro():
+                for ids in par_paquets(changements['delete']):
+                    cibles = cibles_target.filter(pk__in=ids)
+                    mesures.supprimes += cibles.count() if dry_run else cibles.delete()[0]
+            if mesures.supprimes and verbose:
+                print(f"   🗑️ Supprimés: {mesures.supprimes}")
+
+            objets = []
+            for ids in par_paquets(changements['upsert']):
+                objets.extend(qs.filter(pk__in=ids))
+        else:
+            objets = list(qs)
+
+        mesures.lus = len(objets)
+        if not objets:
+            print("   🟡 Rien à synchroniser")
+            return mesures
+
+        source_ids = [obj.pk for obj in objets]
+
+        # Objets existants par PK (avec leur updated_at : la version la plus récente gagne)
+        existing = {}
+        for ids in par_paquets(source_ids):
+            if hasattr(model, 'updated_at'):
+                existing.update(model.objects.using(target_db).filter(pk__in=ids).values_list('pk', 'updated_at'))
+            else:
+                existing.update((pk, None) for pk in model.objects.using(target_db).filter(pk__in=ids).values_list('pk', flat=True))
+
+        # Contraintes d'unicité : seules les valeurs de ce lot sont vérifiées
+        conflits = conflits_uniques(model, target_db, objets)
+        mesures.conflits = len(conflits)
+        if conflits:
+            print(f"   ⚠️ Conflits d'unicité ignorés: {len(conflits)}")
+
+        to_create = []
+        to_update = []
+
+        for obj in objets:
+            data = {}
+            for field in model._meta.fields:
+                if field.name == 'id':
+                    continue
+                data[field.name] = getattr(obj, field.name)
+
+            if obj.pk in conflits:
+                continue
 
-    # Vérifier aussi les champs uniques
-    unique_fields = [f.name for f in model._meta.fields if f.unique and f.name != 'id']
-    existing_uniques = set()
-    if unique_fields:
-        existing_uniques = set(
-            tuple(getattr(o, f) for f in unique_fields)
-            for o in model.objects.using(target_db).all()
+            if obj.pk not in existing:
+                to_create.append(model(id=obj.pk, **data))
+            else:
+                updated_at_cible = existing.get(obj.pk)
+                if updated_at_cible and data.get('updated_at') and updated_at_cible >= data['updated_at']:
+                    mesures.inchanges += 1
+                    continue  # la cible a déjà cette version (ou une plus récente)
+                to_update.append(model(id=obj.pk, **data))
+
+        mesures.crees = len(to_create)
+        mesures.mis_a_jour = len(to_update)
+        if dry_run:
+            return mesures
+
+        if to_create:
+            with conserver_dates(model):
+                model.objects.using(target_db).bulk_create(to_create, batch_size=500)
+            if verbose:
+                print(f"   ➕ Créés: {len(to_create)}")
+
+        if to_update:
+            fields = [f.name for f in model._meta.fields if f.name != 'id']
+            model.objects.using(target_db).bulk_update(to_update, fields=fields, batch_size=500)
+            if verbose:
+                print(f"   🔁 Mis à jour: {len(to_update)}")
+
+    return mesures
+
+
+def sync_direction(source_db, target_db, pharmacie, verbose=False, dry_run=False):
+    """
+    Applique à target_db les changements du journal de source_db, puis avance
+    le curseur (sauf en dry_run). Retourne le rapport de la direction.
+    """
+    depuis = get_curseur(source_db)
+    changements = None
+    if depuis is not None:
+        try:
+            # Tables par pharmacie : seulement les changements de cette pharmacie
+            changements, curseur = lire_journal(source_db, depuis, pharmacie=pharmacie)
+        except JournalPurge as e:
+            print(f"⚠️ {e}")
+    if changements is None:
+        # Première synchro (ou journal purgé) : copie complète ; le curseur est
+        # pris AVANT la copie pour que les écritures concurrentes soient relues
+        # la fois suivante
+        curseur = filigrane(source_db)
+
+    def changements_de(model):
+        if changements is None:
+            return None
+        return changements.get(model._meta.db_table, {'upsert': set(), 'delete': set()})
+
+    def synchroniser(model):
+        return sync_data(
+            source_db, target_db, model,
+            pharmacie=pharmacie if model in MODELS_PAR_PHARMACIE else None,
+            verbose=verbose,
+            changements=changements_de(model),
+            dry_run=dry_run,
         )
 
-    to_create = []
-    to_update = []
+    # Jours de vente touchés dans la cible, avant écrasement / suppression
+    jours = set()
+    if changements is not None and not dry_run:
+        jours = jours_touches(target_db, changements)
 
-    for obj in qs:
-        data = {}
-        for field in model._meta.fields:
-            if field.name == 'id':
-                continue
-            data[field.name] = getattr(obj, field.name)
-
-        unique_key = tuple(data[f] for f in unique_fields) if unique_fields else None
+    # Modèles indépendants en parallèle, parents toujours avant enfants
+    modeles = MODELS_GLOBAL + MODELS_PAR_PHARMACIE
+    resultats = executer_par_dependances(modeles, synchroniser, max_workers=SYNC_WORKERS)
 
-        if obj.pk not in existing_ids and (not unique_key or unique_key not in existing_uniques):
-            to_create.append(model(id=obj.pk, **data))
-            if unique_key:
-                existing_uniques.add(unique_key)
+    # Les ventes copiées par bulk_create n'alimentent pas VenteJournaliere
+    if not dry_run:
+        if changements is None:
+            reconstruire_pharmacie(target_db, pharmacie)
         else:
-            to_update.append(model(id=obj.pk, **data))
-
-    if to_create:
-        model.objects.using(target_db).bulk_create(to_create, batch_size=500)
-        if verbose:
-            print(f"   ➕ Créés: {len(to_create)}")
-
-    if to_update:
-        fields = [f.name for f in model._meta.fields if f.name != 'id']
-        model.objects.using(target_db).bulk_update(to_update, fields=fields, batch_size=500)
-        if verbose:
-            print(f"   🔁 Mis à jour: {len(to_update)}")
-
-    update_last_sync_time(model)
+            reconstruire_jours(target_db, jours | jours_touches(target_db, changements))
+
+    # Le curseur n'avance que si tous les modèles sont passés
+    if not dry_run:
+        set_curseur(source_db, curseur)
+        # Autorise purger_journal à supprimer ce qui est déjà dans target_db
+        acquitter(source_db, f"{source_db}_vers_{target_db}:{pharmacie.pk}", curseur)
+
+    return {
+        'source': source_db,
+        'cible': target_db,
+        'depuis': depuis,
+        'jusqua': curseur,
+        'modeles': [resultats[model].en_dict() for model in modeles],
+    }
 
 # ============================
 # EXECUTION
 # ============================
 
-def run(verbose=False):
+def save_rapport(rapport):
+    with open(SYNC_REPORT_FILE, "w") as f:
+        json.dump(rapport, f, indent=2, default=str)
+
+def run(verbose=False, dry_run=False):
+    debut = time.monotonic()
+    rapport = {'debut': timezone.now(), 'dry_run': dry_run, 'directions': []}
     pharmacie = get_current_pharmacie()
 
     if not pharmacie:
@@ -203,23 +268,29 @@ def run(verbose=False):
         return
 
     print(f"✅ Pharmacie : {pharmacie.nom_pharm} (ID: {pharmacie.id})")
+    if dry_run:
+        print("🧪 Simulation : aucune écriture, curseurs inchangés")
+
+    try:
+        print("\n=== 🔽 REMOTE → LOCAL ===")
+        rapport['directions'].append(sync_direction("remote", "default", pharmacie, verbose=verbose, dry_run=dry_run))
+
+        print("\n=== 🔼 LOCAL → REMOTE ===")
+        rapport['directions'].append(sync_direction("default", "remote", pharmacie, verbose=verbose, dry_run=dry_run))
+    except Exception as e:
+        rapport['erreur'] = str(e)
+        raise
+    finally:
+        rapport['fin'] = timezone.now()
+        rapport['duree'] = round(time.monotonic() - debut, 3)
+        save_rapport(rapport)
 
-    print("\n=== 🔽 REMOTE → LOCAL ===")
-    for model in MODELS_GLOBAL:
-        sync_data("remote", "default", model, verbose=verbose)
-
-    for model in MODELS_PAR_PHARMACIE:
-        sync_data("remote", "default", model, pharmacie=pharmacie, verbose=verbose)
-
-    print("\n=== 🔼 LOCAL → REMOTE ===")
-    for model in MODELS_GLOBAL:
-        sync_data("default", "remote", model, verbose=verbose)
-
-    for model in MODELS_PAR_PHARMACIE:
-        sync_data("default", "remote", model, pharmacie=pharmacie, verbose=verbose)
-
-    save_sync_times(SYNC_TIMES)
     print("\n✅ Synchro terminée.")
+    return rapport
 
 if __name__ == "__main__":
-    run(verbose=False)
+    parser = argparse.ArgumentParser(description="Synchronisation Render ⇄ local")
+    parser.add_argument("--dry-run", action="store_true", help="calcule le delta sans rien écrire")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    run(verbose=args.verbose, dry_run=args.dry_run)
@@ -0,0 +1,88 @@
+# pharmacie/exports.py
+"""
+Export en flux (CSV ou NDJSON) des ventes et des dépenses.
+
+Les lignes sont lues par paquets avec .iterator() et écrites au fil de
+l'eau dans une StreamingHttpResponse : la mémoire du worker reste constante
+quelle que soit la période exportée.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import VenteLigne, Depense
+
+TAILLE_PAQUET = 2000
+
+COLONNES_VENTES = [
+    ('vente', 'vente_id'),
+    ('date_vente', 'vente__date_vente'),
+    ('utilisateur', 'vente__utilisateur__username'),
+    ('client', 'vente__client__nom_complet'),
+    ('produit', 'produit__nom_medicament'),
+    ('code_barre', 'produit__code_barre'),
+    ('quantite', 'quantite'),
+    ('prix_unitaire', 'prix_unitaire'),
+    ('total', 'total'),
+    ('cout_unitaire', 'cout_unitaire'),
+]
+
+COLONNES_DEPENSES = [
+    ('depense', 'id'),
+    ('date_depense', 'date_depense'),
+    ('utilisateur', 'cree_par__username'),
+    ('categorie', 'categorie'),
+    ('methode_paiement', 'methode_paiement'),
+    ('montant', 'montant'),
+    ('description', 'description'),
+]
+
+
+def lignes_ventes(pharmacie, debut=None, fin=None, utilisateur_id=None):
+    """Une ligne par produit vendu ; debut/fin : bornes datetime semi-ouvertes."""
+    lignes = VenteLigne.objects.filter(vente__pharmacie=pharmacie)
+    if debut:
+        lignes = lignes.filter(vente__date_vente__gte=debut)
+    if fin:
+        lignes = lignes.filter(vente__date_vente__lt=fin)
+    if utilisateur_id:
+        lignes = lignes.filter(vente__utilisateur_id=utilisateur_id)
+    return (
+        lignes.order_by('vente__date_vente', 'vente_id', 'id')
+        .values_list(*[champ for _, champ in COLONNES_VENTES])
+    ), [nom for nom, _ in COLONNES_VENTES]
+
+
+def lignes_depenses(pharmacie, date_debut=None, date_fin=None, utilisateur_id=None):
+    depenses = Depense.objects.filter(pharmacie=pharmacie)
+    if date_debut:
+        depenses = depenses.filter(date_depense__gte=date_debut)
+    if date_fin:
+        depenses = depenses.filter(date_depense__lte=date_fin)
+    if utilisateur_id:
+        depenses = depenses.filter(cree_par_id=utilisateur_id)
+    return (
+        depenses.order_by('date_depense', 'created_at', 'id')
+        .values_list(*[champ for _, champ in COLONNES_DEPENSES])
+    ), [nom for nom, _ in COLONNES_DEPENSES]
+
+
+class _Tampon:
+    """Pseudo-fichier : csv.writer renvoie directement la ligne écrite."""
+
+    def write(self, valeur):
+        return valeur
+
+
+def flux_csv(lignes, entetes):
+    writer = csv.writer(_Tampon())
+    # BOM : Excel ouvre alors le fichier en UTF-8 (accents)
+    yield '\ufeff' + writer.writerow(entetes)
+    for ligne in lignes.iterator(chunk_size=TAILLE_PAQUET):
+        yield writer.writerow(ligne)
+
+
+def flux_ndjson(lignes, entetes):
+    for ligne in lignes.iterator(chunk_size=TAILLE_PAQUET):
+        yield json.dumps(dict(zip(entetes, ligne)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
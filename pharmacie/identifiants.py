@@ -0,0 +1,52 @@
+# pharmacie/identifiants.py
+"""
+Numéros de lot et codes-barres générés sans interroger la base.
+
+Chaque identifiant est un ULID : 48 bits d'horodatage en millisecondes
+suivis de 80 bits aléatoires, en base 32 de Crockford (26 caractères,
+chiffres et majuscules sans I, L, O, U : lisibles, sûrs dans une URL et
+encodables en Code 128). Ils sont triés par date de création.
+
+Dans un même processus, deux identifiants générés dans la même
+milliseconde incrémentent la partie aléatoire : jamais de doublon, même
+pour un bulk_create de milliers de lots. Entre processus ou entre la base
+locale et Render, une collision demanderait le même tirage de 80 bits dans
+la même milliseconde. Aucune séquence en base, donc rien à réconcilier à
+la synchronisation.
+"""
+import os
+import secrets
+import threading
+import time
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+BITS_ALEATOIRES = 80
+LONGUEUR = 26
+
+_verrou = threading.Lock()
+_dernier = {'pid': None, 'ms': 0, 'alea': 0}
+
+
+def identifiant_ordonne():
+    with _verrou:
+        ms = time.time_ns() // 1_000_000
+        # Après un fork (workers gunicorn), repartir d'un tirage neuf
+        if _dernier['pid'] == os.getpid() and ms <= _dernier['ms']:
+            # Même milliseconde (ou horloge qui recule) : rester monotone
+            ms, alea = _dernier['ms'], _dernier['alea'] + 1
+            if alea >> BITS_ALEATOIRES:
+                ms, alea = ms + 1, secrets.randbits(BITS_ALEATOIRES)
+        else:
+            alea = secrets.randbits(BITS_ALEATOIRES)
+        _dernier.update(pid=os.getpid(), ms=ms, alea=alea)
+
+    valeur = (ms << BITS_ALEATOIRES) | alea
+    return ''.join(ALPHABET[(valeur >> (5 * i)) & 31] for i in reversed(range(LONGUEUR)))
+
+
+def generer_numero_lot():
+    return f"lot-{identifiant_ordonne()}"
+
+
+def generer_code_barre():
+    return identifiant_ordonne()
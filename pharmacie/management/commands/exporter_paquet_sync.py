@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from comptes.models import Pharmacie
+from pharmacie.paquet_sync import ecrire_paquet
+from pharmacie.synchronisation import JournalPurge
+
+
+class Command(BaseCommand):
+    help = "Écrit les changements d'une pharmacie dans un paquet compressé (.tar) à transférer hors ligne"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sortie', help="Fichier ou dossier de destination (défaut : dossier courant)")
+        parser.add_argument('--pharmacie', help="Pharmacie (UUID) ; défaut : la pharmacie de la base locale")
+        parser.add_argument('--depuis', type=int,
+                            help="Curseur de journal (champ 'jusqua' du paquet précédent) ; absent : export complet")
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--taille-lot', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        pharmacies = Pharmacie.objects.using(using)
+        pharmacie = pharmacies.filter(pk=options['pharmacie']).first() if options['pharmacie'] else pharmacies.first()
+        if pharmacie is None:
+            raise CommandError("Aucune pharmacie trouvée.")
+
+        chemin = options['sortie'] or '.'
+        if os.path.isdir(chemin):
+            horodatage = timezone.now().strftime('%Y%m%d_%H%M%S')
+            chemin = os.path.join(chemin, f"sync_{pharmacie.pk}_{horodatage}.tar")
+
+        try:
+            manifeste = ecrire_paquet(
+                chemin, using=using, pharmacie=pharmacie,
+                depuis=options['depuis'], taille_lot=options['taille_lot'],
+            )
+        except JournalPurge as e:
+            raise CommandError(f"{e} Relancer sans --depuis.")
+
+        for entree in manifeste['modeles']:
+            if entree['lignes'] or entree['suppressions']:
+                self.stdout.write(f"   {entree['modele']} : {entree['lignes']} ligne(s), {entree['suppressions']} suppression(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"📦 Paquet écrit : {chemin} ({os.path.getsize(chemin)} octets). "
+            f"Prochain export : --depuis {manifeste['jusqua']}"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacie.paquet_sync import appliquer_paquet, PaquetInvalide
+
+
+class Command(BaseCommand):
+    help = "Vérifie (SHA-256) puis applique un paquet de synchronisation, en une seule transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paquet', help="Fichier .tar produit par exporter_paquet_sync")
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--taille-lot', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            manifeste, resultats = appliquer_paquet(
+                options['paquet'], using=options['database'], taille_lot=options['taille_lot'],
+            )
+        except PaquetInvalide as e:
+            raise CommandError(f"Paquet refusé : {e}")
+
+        for label, compte in resultats.items():
+            self.stdout.write(
+                f"   {label} : {compte['ecrits']} écrit(s), {compte['supprimes']} supprimé(s)"
+                + (f", {compte['inchanges']} déjà à jour" if compte['inchanges'] else "")
+                + (f", ⚠️ {compte['conflits']} conflit(s) d'unicité ignoré(s)" if compte['conflits'] else "")
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Paquet du {manifeste['cree_le']} appliqué (journal {manifeste['depuis']} → {manifeste['jusqua']})."
+        ))
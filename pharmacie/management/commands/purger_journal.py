@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from pharmacie.models import CurseurJournal
+from pharmacie.synchronisation import purger_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les lignes de JournalModification sous le plus petit curseur acquitté. "
+        "À planifier une fois par jour (cron, hors heures d'ouverture), sur chaque base : "
+        "la base locale de chaque pharmacie et celle de Render."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--conserver-jours', type=int, default=7,
+            help="Garde toujours le journal des N derniers jours (catalogue des caisses, "
+                 "paquets pas encore importés) ; défaut : 7",
+        )
+        parser.add_argument(
+            '--oublier-jours', type=int, default=30,
+            help="Ignore les curseurs non acquittés depuis N jours (pharmacie qui ne se "
+                 "synchronise plus : elle refera une copie complète) ; défaut : 30",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Affiche la limite sans rien supprimer")
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        for curseur in CurseurJournal.objects.using(using).order_by('txid'):
+            self.stdout.write(f"   {curseur.consommateur} : {curseur.txid} ({curseur.updated_at:%Y-%m-%d %H:%M})")
+
+        limite, supprimes = purger_journal(
+            using,
+            conserver=timedelta(days=options['conserver_jours']),
+            oublier=timedelta(days=options['oublier_jours']),
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f"🧪 {supprimes} ligne(s) de journal sous le txid {limite} seraient supprimées.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"🧹 {supprimes} ligne(s) de journal supprimée(s) sous le txid {limite}."))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum, Max
+
+from pharmacie.models import Client, VenteProduit
+
+
+class Command(BaseCommand):
+    help = "Reconstruit total_depense et dernier_achat de tous les clients à partir des ventes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pharmacie', help="Limiter à une pharmacie (UUID)")
+        parser.add_argument('--taille-lot', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        clients = Client.objects.all()
+        ventes = VenteProduit.objects.filter(client__isnull=False)
+
+        if options['pharmacie']:
+            clients = clients.filter(pharmacie_id=options['pharmacie'])
+            ventes = ventes.filter(client__pharmacie_id=options['pharmacie'])
+
+        # Une seule requête groupée pour toutes les ventes
+        stats_ventes = {
+            ligne['client_id']: ligne
+            for ligne in ventes.values('client_id').annotate(
+                total=Sum('montant_total'),
+                dernier=Max('date_vente'),
+            ).order_by()
+        }
+
+        taille_lot = options['taille_lot']
+        a_ecrire = []
+        total = 0
+
+        for client in clients.only('id', 'total_depense', 'dernier_achat').iterator(chunk_size=taille_lot):
+            stats = stats_ventes.get(client.id, {})
+            client.total_depense = stats.get('total') or 0
+            client.dernier_achat = stats.get('dernier')
+            a_ecrire.append(client)
+
+            if len(a_ecrire) >= taille_lot:
+                Client.objects.bulk_update(a_ecrire, ['total_depense', 'dernier_achat'])
+                total += len(a_ecrire)
+                a_ecrire = []
+
+        if a_ecrire:
+            Client.objects.bulk_update(a_ecrire, ['total_depense', 'dernier_achat'])
+            total += len(a_ecrire)
+
+        self.stdout.write(self.style.SUCCESS(f"{total} client(s) recalculé(s)."))
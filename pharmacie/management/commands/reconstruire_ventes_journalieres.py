@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pharmacie.models import VenteJournaliere, VenteLigne
+from pharmacie.statistiques import recalculer_cumuls
+from pharmacie.utils import intervalle_jours
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table VenteJournaliere à partir des lignes de vente (une requête groupée)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pharmacie', help="Limiter à une pharmacie (UUID)")
+        parser.add_argument('--depuis', help="Premier jour inclus (AAAA-MM-JJ)")
+        parser.add_argument('--jusqua', help="Dernier jour inclus (AAAA-MM-JJ)")
+        parser.add_argument('--taille-lot', type=int, default=1000)
+
+    def jour(self, valeur, option):
+        if not valeur:
+            return None
+        try:
+            jour = parse_date(valeur)
+        except ValueError:
+            jour = None
+        if jour is None:
+            raise CommandError(f"{option} : date invalide, format attendu AAAA-MM-JJ")
+        return jour
+
+    def handle(self, *args, **options):
+        depuis = self.jour(options['depuis'], '--depuis')
+        jusqua = self.jour(options['jusqua'], '--jusqua')
+
+        lignes = VenteLigne.objects.all()
+        cumuls = VenteJournaliere.objects.all()
+
+        if options['pharmacie']:
+            lignes = lignes.filter(vente__pharmacie_id=options['pharmacie'])
+            cumuls = cumuls.filter(pharmacie_id=options['pharmacie'])
+        debut, fin = intervalle_jours(depuis, jusqua)
+        if depuis:
+            lignes = lignes.filter(vente__date_vente__gte=debut)
+            cumuls = cumuls.filter(jour__gte=depuis)
+        if jusqua:
+            lignes = lignes.filter(vente__date_vente__lt=fin)
+            cumuls = cumuls.filter(jour__lte=jusqua)
+
+        supprimes, total = recalculer_cumuls(lignes, cumuls, taille_lot=options['taille_lot'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{supprimes} cumul(s) supprimé(s), {total} cumul(s) recréé(s)."
+        ))
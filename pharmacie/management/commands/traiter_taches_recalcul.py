@@ -0,0 +1,117 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from pharmacie.models import TacheRecalcul, TauxChange, ProduitFabricant
+from pharmacie.recalcul_prix import recalculer_prix_apres_taux, recalculer_prix_produit_fabricant
+
+# Un worker vivant met à jour updated_at à chaque paquet traité (progression)
+DELAI_REPRISE = 15 * 60
+
+
+class Command(BaseCommand):
+    help = "Worker qui exécute les tâches de recalcul des prix (changement de taux, prix fabricant)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--une-fois', action='store_true',
+            help="Traite les tâches en attente puis s'arrête (au lieu de tourner en boucle)",
+        )
+        parser.add_argument(
+            '--intervalle', type=float, default=5,
+            help="Secondes d'attente entre deux vérifications de la file (défaut : 5)",
+        )
+        parser.add_argument(
+            '--delai-reprise', type=float, default=DELAI_REPRISE,
+            help="Secondes sans progression après lesquelles une tâche en cours est "
+                 "considérée abandonnée (worker arrêté) et reprise (défaut : 900)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("🚀 Worker de recalcul des prix démarré"))
+
+        self.delai_reprise = timedelta(seconds=options['delai_reprise'])
+
+        while True:
+            tache = self.prendre_tache()
+            if tache is None:
+                if options['une_fois']:
+                    break
+                time.sleep(options['intervalle'])
+                continue
+            self.executer(tache)
+
+    def prendre_tache(self):
+        """
+        Réserve la plus ancienne tâche en attente, ou une tâche en cours dont
+        le worker ne donne plus signe de vie depuis --delai-reprise (sans
+        bloquer les autres workers). Une tâche reprise continue après son
+        dernier paquet validé (resultat['reprise']).
+        """
+        abandonnee = Q(statut='en_cours', updated_at__lt=timezone.now() - self.delai_reprise)
+        with transaction.atomic():
+            tache = (
+                TacheRecalcul.objects
+                .select_for_update(skip_locked=True)
+                .filter(Q(statut='en_attente') | abandonnee)
+                .order_by('created_at')
+                .first()
+            )
+            if tache is None:
+                return None
+            if tache.statut == 'en_cours':
+                self.stdout.write(self.style.WARNING(f"♻️ Reprise de la tâche abandonnée {tache.id}"))
+            tache.statut = 'en_cours'
+            tache.debut = timezone.now()
+            tache.save(update_fields=['statut', 'debut', 'updated_at'])
+        return tache
+
+    def executer(self, tache):
+        self.stdout.write(f"🔁 {tache} ({tache.id})")
+
+        # Point de reprise d'une exécution précédente (worker arrêté ou tâche relancée)
+        reprise = (tache.resultat or {}).get('reprise')
+        if reprise:
+            self.stdout.write(f"↪️ Reprise après {reprise['paquets']} paquet(s) validé(s)")
+        etat = {'reprise': reprise}
+
+        def progression(traites, total, reprise):
+            # Appelé dans la transaction du paquet : le point de reprise
+            # enregistré correspond exactement aux prix validés
+            etat['reprise'] = reprise
+            TacheRecalcul.objects.filter(pk=tache.pk).update(
+                traites=traites, total=total, resultat={'reprise': reprise},
+                updated_at=timezone.now(),
+            )
+
+        try:
+            if tache.type_tache == 'taux_change':
+                taux = TauxChange.objects.get(pk=tache.cible_id).taux
+                resultat = recalculer_prix_apres_taux(taux, progression=progression, reprise=reprise)
+            else:
+                produit = ProduitFabricant.objects.get(pk=tache.cible_id)
+                resultat = recalculer_prix_produit_fabricant(produit, progression=progression, reprise=reprise)
+        except Exception:
+            paquets = etat['reprise']['paquets'] if etat['reprise'] else 0
+            TacheRecalcul.objects.filter(pk=tache.pk).update(
+                statut='echouee',
+                erreur=(
+                    f"Échec après {paquets} paquet(s) validé(s) : les prix sont "
+                    f"partiellement recalculés, relancer la tâche pour terminer.\n"
+                    f"{traceback.format_exc()}"
+                ),
+                fin=timezone.now(), updated_at=timezone.now(),
+            )
+            self.stdout.write(self.style.ERROR(f"❌ Tâche {tache.id} échouée après {paquets} paquet(s)"))
+            return
+
+        TacheRecalcul.objects.filter(pk=tache.pk).update(
+            statut='terminee', resultat=resultat,
+            fin=timezone.now(), updated_at=timezone.now(),
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Tâche {tache.id} terminée : {resultat}"))
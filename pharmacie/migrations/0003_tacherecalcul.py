@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:25
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0002_alter_depense_options_alter_depense_categorie_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheRecalcul',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type_tache', models.CharField(choices=[('taux_change', 'Changement de taux'), ('produit_fabricant', 'Prix fabricant')], max_length=30)),
+                ('cible_id', models.UUIDField(help_text='TauxChange ou ProduitFabricant à répercuter')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('terminee', 'Terminée'), ('echouee', 'Échouée')], default='en_attente', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('traites', models.PositiveIntegerField(default=0)),
+                ('resultat', models.JSONField(blank=True, null=True)),
+                ('erreur', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('debut', models.DateTimeField(blank=True, null=True)),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['statut', 'created_at'], name='tache_statut_created_idx')],
+            },
+        ),
+    ]
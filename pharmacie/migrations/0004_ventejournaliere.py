@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:28
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0001_initial'),
+        ('pharmacie', '0003_tacherecalcul'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VenteJournaliere',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('jour', models.DateField()),
+                ('quantite', models.IntegerField(default=0)),
+                ('chiffre_affaire', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('benefice', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nombre_lignes', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pharmacie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventes_journalieres', to='comptes.pharmacie')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventes_journalieres', to='pharmacie.produitpharmacie')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('pharmacie', 'jour', 'produit'), name='unique_vente_journaliere')],
+            },
+        ),
+    ]
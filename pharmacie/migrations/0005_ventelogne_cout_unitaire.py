@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:29
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def initialiser_cout_unitaire(apps, schema_editor):
+    # Le coût réel des ventes passées est inconnu : on fige le prix d'achat
+    # courant, ce qui reproduit les bénéfices affichés jusqu'ici.
+    VenteLigne = apps.get_model('pharmacie', 'VenteLigne')
+    ProduitPharmacie = apps.get_model('pharmacie', 'ProduitPharmacie')
+    VenteLigne.objects.filter(cout_unitaire__isnull=True).update(
+        cout_unitaire=Subquery(
+            ProduitPharmacie.objects.filter(pk=OuterRef('produit_id')).values('prix_achat')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0004_ventejournaliere'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venteligne',
+            name='cout_unitaire',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(initialiser_cout_unitaire, migrations.RunPython.noop),
+    ]
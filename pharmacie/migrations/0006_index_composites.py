@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0001_initial'),
+        ('pharmacie', '0005_ventelogne_cout_unitaire'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commandeproduit',
+            index=models.Index(fields=['pharmacie', 'date_commande'], name='commande_pharm_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='depense',
+            index=models.Index(fields=['pharmacie', 'date_depense'], name='depense_pharm_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lotproduitpharmacie',
+            index=models.Index(fields=['produit', 'date_peremption'], name='lot_produit_peremption_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lotproduitpharmacie',
+            index=models.Index(fields=['produit', 'quantite', 'date_entree'], name='lot_produit_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produitpharmacie',
+            index=models.Index(fields=['pharmacie', 'quantite'], name='produit_pharm_qte_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venteproduit',
+            index=models.Index(fields=['pharmacie', 'date_vente'], name='vente_pharm_date_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Tables synchronisées par hopitalsage_front/sync_*.py
+TABLES_JOURNALISEES = [
+    'comptes_pharmacie',
+    'comptes_user',
+    'pharmacie_tauxchange',
+    'pharmacie_fabricant',
+    'pharmacie_produitfabricant',
+    'pharmacie_publicitepharmacie',
+    'pharmacie_produitpharmacie',
+    'pharmacie_lotproduitpharmacie',
+    'pharmacie_commandeproduit',
+    'pharmacie_commandeproduitligne',
+    'pharmacie_receptionproduit',
+    'pharmacie_receptionligne',
+    'pharmacie_client',
+    'pharmacie_venteproduit',
+    'pharmacie_venteligne',
+    'pharmacie_clientpurchase',
+    'pharmacie_medicalexam',
+    'pharmacie_prescription',
+    'pharmacie_rendezvous',
+    'pharmacie_requisition',
+    'pharmacie_depense',
+]
+
+# Les écritures faites par la synchronisation elle-même positionnent
+# pharmacie.synchronisation = 'on' (SET LOCAL) et ne sont pas journalisées,
+# sinon chaque ligne reçue serait renvoyée à l'autre base.
+FONCTION = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('pharmacie.synchronisation', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now());
+    ELSE
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now());
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def creer_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(FONCTION)
+    for table in TABLES_JOURNALISEES:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_journal ON {table}")
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_journal "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION pharmacie_journaliser()"
+        )
+
+
+def supprimer_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES_JOURNALISEES:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_journal ON {table}")
+    schema_editor.execute("DROP FUNCTION IF EXISTS pharmacie_journaliser()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0001_initial'),
+        ('pharmacie', '0006_index_composites'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalModification',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('table', models.CharField(max_length=100)),
+                ('objet_id', models.UUIDField()),
+                ('operation', models.CharField(choices=[('I', 'Insertion'), ('U', 'Modification'), ('D', 'Suppression')], max_length=1)),
+                ('txid', models.BigIntegerField(db_index=True)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['seq'],
+            },
+        ),
+        migrations.RunPython(creer_triggers, supprimer_triggers),
+    ]
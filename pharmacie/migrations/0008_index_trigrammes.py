@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:05
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# (table, colonne) recherchées par icontains / istartswith / pharmacie.recherche.
+# L'index porte sur UPPER(colonne::text), l'expression générée par Django pour
+# les lookups insensibles à la casse sous PostgreSQL.
+COLONNES_RECHERCHEES = [
+    ('pharmacie_fabricant', 'nom'),
+    ('pharmacie_produitfabricant', 'nom'),
+    ('pharmacie_produitpharmacie', 'nom_medicament'),
+    ('pharmacie_produitpharmacie', 'code_barre'),
+]
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, colonne in COLONNES_RECHERCHEES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_{colonne}_trgm "
+            f"ON {table} USING gin (UPPER({colonne}::text) gin_trgm_ops)"
+        )
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, colonne in COLONNES_RECHERCHEES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_{colonne}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0007_journalmodification'),
+    ]
+
+    operations = [
+        # Ignorée hors PostgreSQL
+        TrigramExtension(),
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
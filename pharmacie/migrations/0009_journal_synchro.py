@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+# Les écritures de la synchronisation (SET LOCAL pharmacie.synchronisation =
+# 'on') sont désormais journalisées avec synchro = true au lieu d'être
+# ignorées : la synchro les filtre, le catalogue des caisses les voit.
+FONCTION = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+DECLARE
+    est_synchro boolean := coalesce(current_setting('pharmacie.synchronisation', true) = 'on', false);
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now(), est_synchro);
+    ELSE
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now(), est_synchro);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Version de 0007 (écritures de la synchro non journalisées)
+FONCTION_PRECEDENTE = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('pharmacie.synchronisation', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now());
+    ELSE
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now());
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def remplacer_fonction(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(FONCTION)
+
+
+def restaurer_fonction(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(FONCTION_PRECEDENTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0008_index_trigrammes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalmodification',
+            name='synchro',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='journalmodification',
+            index=models.Index(fields=['table', 'txid'], name='journal_table_txid_idx'),
+        ),
+        migrations.RunPython(remplacer_fonction, restaurer_fonction),
+    ]
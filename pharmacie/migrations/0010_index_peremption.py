@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0009_journal_synchro'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lotproduitpharmacie',
+            index=models.Index(condition=models.Q(('quantite__gt', 0)), fields=['date_peremption', 'produit'], name='lot_peremption_stock_idx'),
+        ),
+    ]
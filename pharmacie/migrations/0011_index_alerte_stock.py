@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0001_initial'),
+        ('pharmacie', '0010_index_peremption'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produitpharmacie',
+            index=models.Index(condition=models.Q(('quantite__lte', models.F('alerte_quantite'))), fields=['pharmacie', 'quantite'], name='produit_alerte_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+def dedoublonner_taches(apps, schema_editor):
+    """
+    Tâches en attente en double (planifier sans verrou) : pour le taux, la
+    plus ancienne est gardée avec la cible la plus récente ; pour un produit
+    fabricant, la plus ancienne de chaque cible.
+    """
+    TacheRecalcul = apps.get_model('pharmacie', 'TacheRecalcul')
+    en_attente = TacheRecalcul.objects.filter(statut='en_attente').order_by('created_at')
+
+    taux = list(en_attente.filter(type_tache='taux_change'))
+    if len(taux) > 1:
+        gardee = taux[0]
+        gardee.cible_id = taux[-1].cible_id
+        gardee.save(update_fields=['cible_id'])
+        TacheRecalcul.objects.filter(pk__in=[t.pk for t in taux[1:]]).delete()
+
+    vues = set()
+    doublons = []
+    for tache in en_attente.filter(type_tache='produit_fabricant'):
+        if tache.cible_id in vues:
+            doublons.append(tache.pk)
+        vues.add(tache.cible_id)
+    TacheRecalcul.objects.filter(pk__in=doublons).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0011_index_alerte_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedoublonner_taches, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tacherecalcul',
+            constraint=models.UniqueConstraint(condition=models.Q(('statut', 'en_attente')), fields=('type_tache', 'cible_id'), name='tache_en_attente_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='tacherecalcul',
+            constraint=models.UniqueConstraint(condition=models.Q(('statut', 'en_attente'), ('type_tache', 'taux_change')), fields=('type_tache',), name='tache_taux_en_attente_unique'),
+        ),
+    ]
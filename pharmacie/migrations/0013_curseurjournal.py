@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0012_tache_en_attente_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurseurJournal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consommateur', models.CharField(max_length=100, unique=True)),
+                ('txid', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:18
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Le journal garde la pharmacie de la ligne écrite (colonne pharmacie_id de
+# la table, lue sans la nommer : toutes les tables n'en ont pas), pour que le
+# catalogue d'une caisse ne lise que les changements de sa pharmacie.
+FONCTION = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+DECLARE
+    est_synchro boolean := coalesce(current_setting('pharmacie.synchronisation', true) = 'on', false);
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro, pharmacie_id)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now(), est_synchro,
+                (to_jsonb(OLD) ->> 'pharmacie_id')::uuid);
+    ELSE
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro, pharmacie_id)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now(), est_synchro,
+                (to_jsonb(NEW) ->> 'pharmacie_id')::uuid);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Version de 0009
+FONCTION_PRECEDENTE = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+DECLARE
+    est_synchro boolean := coalesce(current_setting('pharmacie.synchronisation', true) = 'on', false);
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now(), est_synchro);
+    ELSE
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now(), est_synchro);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def remplacer_fonction(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(FONCTION)
+
+
+def restaurer_fonction(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(FONCTION_PRECEDENTE)
+
+
+def renseigner_produits(apps, schema_editor):
+    """
+    Lignes déjà journalisées des produits encore en stock. Les suppressions
+    antérieures restent sans pharmacie : une caisse les verra au prochain
+    chargement complet du catalogue.
+    """
+    JournalModification = apps.get_model('pharmacie', 'JournalModification')
+    ProduitPharmacie = apps.get_model('pharmacie', 'ProduitPharmacie')
+    using = schema_editor.connection.alias
+    JournalModification.objects.using(using).filter(
+        table=ProduitPharmacie._meta.db_table, pharmacie_id__isnull=True,
+    ).update(pharmacie_id=Subquery(
+        ProduitPharmacie.objects.using(using).filter(pk=OuterRef('objet_id')).values('pharmacie_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0013_curseurjournal'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='journalmodification',
+            name='journal_table_txid_idx',
+        ),
+        migrations.AddField(
+            model_name='journalmodification',
+            name='pharmacie_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='journalmodification',
+            index=models.Index(fields=['table', 'pharmacie_id', 'txid'], name='journal_table_pharm_txid_idx'),
+        ),
+        migrations.RunPython(remplacer_fonction, restaurer_fonction),
+        migrations.RunPython(renseigner_produits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0014_journal_pharmacie'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='produitpharmacie',
+            name='produit_pharm_qte_idx',
+        ),
+    ]
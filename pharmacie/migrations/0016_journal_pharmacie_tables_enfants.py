@@ -0,0 +1,140 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:05
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# Les tables enfants n'ont pas de colonne pharmacie_id : le trigger reçoit la
+# requête qui la retrouve par le parent ($1 = la ligne écrite). Sans cela
+# leurs lignes de journal restent sans pharmacie et lire_journal(pharmacie=...)
+# les ignorerait.
+PHARMACIE_PAR_PARENT = {
+    'pharmacie_lotproduitpharmacie':
+        "SELECT pharmacie_id FROM pharmacie_produitpharmacie WHERE id = ($1).produit_id",
+    'pharmacie_commandeproduitligne':
+        "SELECT pharmacie_id FROM pharmacie_commandeproduit WHERE id = ($1).commande_id",
+    'pharmacie_receptionproduit':
+        "SELECT pharmacie_id FROM pharmacie_commandeproduit WHERE id = ($1).commande_id",
+    'pharmacie_receptionligne':
+        "SELECT c.pharmacie_id FROM pharmacie_receptionproduit r "
+        "JOIN pharmacie_commandeproduit c ON c.id = r.commande_id WHERE r.id = ($1).reception_id",
+    'pharmacie_venteligne':
+        "SELECT pharmacie_id FROM pharmacie_venteproduit WHERE id = ($1).vente_id",
+    'pharmacie_clientpurchase':
+        "SELECT pharmacie_id FROM pharmacie_client WHERE id = ($1).client_id",
+    'pharmacie_medicalexam':
+        "SELECT pharmacie_id FROM pharmacie_client WHERE id = ($1).client_id",
+    'pharmacie_prescription':
+        "SELECT pharmacie_id FROM pharmacie_client WHERE id = ($1).client_id",
+}
+
+FONCTION = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+DECLARE
+    est_synchro boolean := coalesce(current_setting('pharmacie.synchronisation', true) = 'on', false);
+    pharmacie uuid;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF TG_NARGS > 0 THEN
+            EXECUTE TG_ARGV[0] INTO pharmacie USING OLD;
+        ELSE
+            pharmacie := (to_jsonb(OLD) ->> 'pharmacie_id')::uuid;
+        END IF;
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro, pharmacie_id)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now(), est_synchro, pharmacie);
+    ELSE
+        IF TG_NARGS > 0 THEN
+            EXECUTE TG_ARGV[0] INTO pharmacie USING NEW;
+        ELSE
+            pharmacie := (to_jsonb(NEW) ->> 'pharmacie_id')::uuid;
+        END IF;
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro, pharmacie_id)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now(), est_synchro, pharmacie);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Version de 0014
+FONCTION_PRECEDENTE = """
+CREATE OR REPLACE FUNCTION pharmacie_journaliser() RETURNS trigger AS $$
+DECLARE
+    est_synchro boolean := coalesce(current_setting('pharmacie.synchronisation', true) = 'on', false);
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro, pharmacie_id)
+        VALUES (TG_TABLE_NAME, OLD.id, 'D', txid_current(), now(), est_synchro,
+                (to_jsonb(OLD) ->> 'pharmacie_id')::uuid);
+    ELSE
+        INSERT INTO pharmacie_journalmodification ("table", objet_id, operation, txid, date, synchro, pharmacie_id)
+        VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1), txid_current(), now(), est_synchro,
+                (to_jsonb(NEW) ->> 'pharmacie_id')::uuid);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def creer_trigger(schema_editor, table, requete=None):
+    argument = "'" + requete.replace("'", "''") + "'" if requete else ""
+    schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_journal ON {table}")
+    schema_editor.execute(
+        f"CREATE TRIGGER {table}_journal "
+        f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION pharmacie_journaliser({argument})"
+    )
+
+
+def remplacer_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(FONCTION)
+    for table, requete in PHARMACIE_PAR_PARENT.items():
+        creer_trigger(schema_editor, table, requete)
+
+
+def restaurer_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in PHARMACIE_PAR_PARENT:
+        creer_trigger(schema_editor, table)
+    schema_editor.execute(FONCTION_PRECEDENTE)
+
+
+def renseigner_tables_enfants(apps, schema_editor):
+    """
+    Lignes déjà journalisées des objets encore présents. Les suppressions
+    antérieures restent sans pharmacie : synchroniser avant de migrer.
+    """
+    JournalModification = apps.get_model('pharmacie', 'JournalModification')
+    using = schema_editor.connection.alias
+    chemins = {
+        'LotProduitPharmacie': 'produit__pharmacie_id',
+        'CommandeProduitLigne': 'commande__pharmacie_id',
+        'ReceptionProduit': 'commande__pharmacie_id',
+        'ReceptionLigne': 'reception__commande__pharmacie_id',
+        'VenteLigne': 'vente__pharmacie_id',
+        'ClientPurchase': 'client__pharmacie_id',
+        'MedicalExam': 'client__pharmacie_id',
+        'Prescription': 'client__pharmacie_id',
+    }
+    for nom, chemin in chemins.items():
+        modele = apps.get_model('pharmacie', nom)
+        JournalModification.objects.using(using).filter(
+            table=modele._meta.db_table, pharmacie_id__isnull=True,
+        ).update(pharmacie_id=Subquery(
+            modele.objects.using(using).filter(pk=OuterRef('objet_id')).values(chemin)[:1]
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacie', '0015_supprimer_index_quantite'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplacer_triggers, restaurer_triggers),
+        migrations.RunPython(renseigner_tables_enfants, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from comptes.models import Pharmacie, User
+from .taux import taux_actuel
 import uuid
 
 
@@ -53,11 +54,7 @@ class ProduitFabricant(models.Model):
 
     def prix_achat_cdf(self):
         if self.devise == 'USD':
-            try:
-                taux_actuel = TauxChange.objects.latest('date').taux
-            except TauxChange.DoesNotExist:
-                taux_actuel = 1
-            return self.prix_achat * taux_actuel
+            return self.prix_achat * (taux_actuel() or 1)
         return self.prix_achat
 
     @property
@@ -98,7 +95,18 @@ class ProduitPharmacie(models.Model):
     prix_vente = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
+    class Meta:
+        indexes = [
+            # Produits en alerte (même condition que stock.EN_ALERTE) ; seule
+            # requête qui filtre les produits d'une pharmacie par quantité
+            models.Index(
+                fields=['pharmacie', 'quantite'], name='produit_alerte_idx',
+                condition=models.Q(quantite__lte=models.F('alerte_quantite')),
+            ),
+        ]
+
+    def calculer_prix(self):
+        """prix_achat (par plaquette, en CDF) et prix_vente depuis le produit fabricant."""
         try:
             nb_plaquettes = self.produit_fabricant.nombre_plaquettes_par_boite
             prix_boite = self.produit_fabricant.prix_achat_cdf()  # ✅ conversion correcte
@@ -115,6 +123,8 @@ class ProduitPharmacie(models.Model):
         except (AttributeError, ZeroDivisionError, InvalidOperation) as e:
             print(f"Erreur lors du calcul automatique : {e}")
 
+    def save(self, *args, **kwargs):
+        self.calculer_prix()
         super().save(*args, **kwargs)
 
 
@@ -122,8 +132,7 @@ class ProduitPharmacie(models.Model):
         return f"{self.nom_medicament} - {self.pharmacie.nom}"
 
 from decimal import Decimal
-import string
-import random
+from .identifiants import generer_numero_lot
 
 class LotProduitPharmacie(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -146,16 +155,23 @@ class LotProduitPharmacie(models.Model):
     prix_vente = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['produit', 'date_peremption'], name='lot_produit_peremption_idx'),
+            # Sortie FIFO : lots non vides d'un produit, du plus ancien au plus récent
+            models.Index(fields=['produit', 'quantite', 'date_entree'], name='lot_produit_fifo_idx'),
+            # Rapport de péremption : lots en stock par plage de dates, filtrés
+            # ensuite sur les produits de la pharmacie
+            models.Index(
+                fields=['date_peremption', 'produit'], name='lot_peremption_stock_idx',
+                condition=models.Q(quantite__gt=0),
+            ),
+        ]
+
     def save(self, *args, **kwargs):
-        # ✅ Génère automatiquement un numéro de lot si vide
+        # ✅ Génère automatiquement un numéro de lot si vide (unique sans requête, voir identifiants.py)
         if not self.numero_lot:
-            caracteres = string.ascii_letters + string.digits + "!@#$%&*"
-            while True:
-                aleatoire = ''.join(random.choices(caracteres, k=10))
-                candidate = f"lot-{aleatoire}"
-                if not LotProduitPharmacie.objects.filter(numero_lot=candidate).exists():
-                    self.numero_lot = candidate
-                    break
+            self.numero_lot = generer_numero_lot()
 
         # ✅ Copie les prix du produit s'ils ne sont pas définis
         if self.prix_achat is None:
@@ -176,6 +192,11 @@ class CommandeProduit(models.Model):
     fabricant = models.ForeignKey(Fabricant, on_delete=models.CASCADE)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['pharmacie', 'date_commande'], name='commande_pharm_date_idx'),
+        ]
+
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import models
 from .models import TauxChange
@@ -193,11 +214,10 @@ class CommandeProduitLigne(models.Model):
         devise = self.produit_fabricant.devise.upper()
 
         if devise == 'USD':
-            try:
-                taux = TauxChange.objects.latest('date').taux
-                prix = Decimal(prix) * Decimal(taux)
-            except TauxChange.DoesNotExist:
+            taux = taux_actuel()
+            if taux is None:
                 raise ValueError("Aucun taux de change défini pour convertir le prix.")
+            prix = Decimal(prix) * Decimal(taux)
 
         self.prix_achat = Decimal(prix).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
@@ -223,6 +243,10 @@ class ReceptionLigne(models.Model):
         return f"{self.ligne_commande.produit_fabricant.nom} reçu : {self.quantite_recue}"
 
 from django.core.validators import RegexValidator
+from django.db.models import F, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
 class Client(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     pharmacie = models.ForeignKey(
@@ -258,15 +282,28 @@ class Client(models.Model):
             )
         ]
     
-    def update_stats(self):
-        """Met à jour les statistiques du client"""
-        ventes = self.ventes.all()
-        total = sum(v.montant_total for v in ventes)
-        derniere_vente = ventes.order_by('-date_vente').first()
-        
-        self.total_depense = total
-        self.dernier_achat = derniere_vente.date_vente if derniere_vente else None
-        self.save(update_fields=['total_depense', 'dernier_achat'])
+    @classmethod
+    def enregistrer_vente(cls, vente, using='default'):
+        """Ajoute une vente aux statistiques du client (un seul UPDATE atomique)."""
+        date_vente = Value(vente.date_vente)
+        cls.objects.using(using).filter(pk=vente.client_id).update(
+            total_depense=F('total_depense') + vente.montant_total,
+            dernier_achat=Greatest(Coalesce('dernier_achat', date_vente), date_vente),
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def annuler_vente(cls, vente, using='default'):
+        """Retire une vente (annulée / supprimée) des statistiques du client."""
+        autres_ventes = VenteProduit.objects.using(using).filter(
+            client_id=OuterRef('pk')
+        ).exclude(pk=vente.pk).order_by('-date_vente')
+
+        cls.objects.using(using).filter(pk=vente.client_id).update(
+            total_depense=Greatest(F('total_depense') - vente.montant_total, Value(Decimal('0'))),
+            dernier_achat=Subquery(autres_ventes.values('date_vente')[:1]),
+            updated_at=timezone.now(),
+        )
 
 from django.db import models
 from django.core.validators import MinValueValidator
@@ -291,6 +328,11 @@ class VenteProduit(models.Model):
         validators=[MinValueValidator(0)]
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['pharmacie', 'date_vente'], name='vente_pharm_date_idx'),
+        ]
+
     def __str__(self):
         return f"Vente #{self.id} - {self.date_vente.strftime('%d/%m/%Y')}"
     
@@ -307,12 +349,21 @@ class VenteLigne(models.Model):
     quantite = models.PositiveIntegerField()
     prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2)
     total = models.DecimalField(max_digits=12, decimal_places=2, editable=False)
+    # Coût d'achat unitaire au moment de la vente (moyenne des lots FIFO consommés) :
+    # le bénéfice ne change plus quand le taux ou le prix fabricant changent
+    cout_unitaire = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         self.total = self.quantite * self.prix_unitaire
+        if self.cout_unitaire is None:
+            self.cout_unitaire = self.produit.prix_achat
         super().save(*args, **kwargs)
 
+    @property
+    def benefice(self):
+        return (self.prix_unitaire - (self.cout_unitaire or 0)) * self.quantite
+
     def __str__(self):
         return f"{self.produit.nom_medicament} x {self.quantite}"
 
@@ -465,5 +516,215 @@ class Depense(models.Model):
 
     class Meta:
         ordering = ['-date_depense']
+        indexes = [
+            models.Index(fields=['pharmacie', 'date_depense'], name='depense_pharm_date_idx'),
+        ]
         verbose_name = "Dépense"
         verbose_name_plural = "Dépenses"
+
+
+######### TACHES DE RECALCUL DES PRIX (exécutées par le worker) ###################
+from django.db import IntegrityError, transaction
+
+class TacheRecalcul(models.Model):
+    TYPES = (
+        ('taux_change', 'Changement de taux'),
+        ('produit_fabricant', 'Prix fabricant'),
+    )
+    STATUTS = (
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('terminee', 'Terminée'),
+        ('echouee', 'Échouée'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    type_tache = models.CharField(max_length=30, choices=TYPES)
+    cible_id = models.UUIDField(help_text="TauxChange ou ProduitFabricant à répercuter")
+    statut = models.CharField(max_length=20, choices=STATUTS, default='en_attente')
+    total = models.PositiveIntegerField(default=0)
+    traites = models.PositiveIntegerField(default=0)
+    resultat = models.JSONField(null=True, blank=True)
+    erreur = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    debut = models.DateTimeField(null=True, blank=True)
+    fin = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['statut', 'created_at'], name='tache_statut_created_idx'),
+        ]
+        constraints = [
+            # Au plus une tâche en attente par cible, et une seule pour le taux
+            # (voir planifier)
+            models.UniqueConstraint(
+                fields=['type_tache', 'cible_id'], condition=models.Q(statut='en_attente'),
+                name='tache_en_attente_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['type_tache'], condition=models.Q(statut='en_attente', type_tache='taux_change'),
+                name='tache_taux_en_attente_unique',
+            ),
+        ]
+
+    @property
+    def progression(self):
+        if self.statut == 'terminee':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.traites * 100 / self.total))
+
+    @classmethod
+    def planifier(cls, type_tache, cible_id):
+        """
+        Ajoute une tâche à la file. Une tâche du même type encore en attente
+        est réutilisée : pour un taux, seul le dernier enregistré compte.
+        """
+        en_attente = cls.objects.filter(type_tache=type_tache, statut='en_attente')
+        if type_tache == 'produit_fabricant':
+            en_attente = en_attente.filter(cible_id=cible_id)
+
+        # Les contraintes d'unicité conditionnelles arbitrent les
+        # enregistrements concurrents : le perdant réutilise la tâche du gagnant
+        for _ in range(5):
+            tache = en_attente.order_by('created_at').first()
+            if tache is None:
+                try:
+                    with transaction.atomic():
+                        return cls.objects.create(type_tache=type_tache, cible_id=cible_id)
+                except IntegrityError:
+                    continue
+
+            if tache.cible_id != cible_id:
+                # Ne modifie pas une tâche qu'un worker vient de prendre ; le
+                # point de reprise d'une tâche relancée ne vaut plus pour ce taux
+                if not en_attente.filter(pk=tache.pk).update(
+                    cible_id=cible_id, resultat=None, traites=0, updated_at=timezone.now(),
+                ):
+                    continue
+                tache.cible_id = cible_id
+                tache.resultat = None
+                tache.traites = 0
+            return tache
+        raise IntegrityError(f"Impossible de planifier la tâche {type_tache} ({cible_id})")
+
+    def relancer(self):
+        """
+        Remet en file une tâche échouée : le worker repart du dernier paquet
+        validé (resultat['reprise']). Si une tâche de même cible (ou un taux
+        plus récent) est déjà en attente, elle recalculera tout : c'est elle
+        qui est retournée.
+        """
+        try:
+            with transaction.atomic():
+                TacheRecalcul.objects.filter(pk=self.pk, statut='echouee').update(
+                    statut='en_attente', erreur=None, fin=None, updated_at=timezone.now(),
+                )
+        except IntegrityError:
+            en_attente = TacheRecalcul.objects.filter(type_tache=self.type_tache, statut='en_attente')
+            if self.type_tache == 'produit_fabricant':
+                en_attente = en_attente.filter(cible_id=self.cible_id)
+            return en_attente.first()
+        self.refresh_from_db()
+        return self
+
+    def __str__(self):
+        return f"{self.get_type_tache_display()} ({self.get_statut_display()})"
+
+
+######### CUMUL JOURNALIER DES VENTES (tableaux de bord) ###################
+class VenteJournaliere(models.Model):
+    """
+    Cumul des ventes par pharmacie, jour et produit. Alimenté à chaque vente
+    (voir pharmacie/statistiques.py) et reconstructible avec la commande
+    `reconstruire_ventes_journalieres`.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    pharmacie = models.ForeignKey(Pharmacie, on_delete=models.CASCADE, related_name='ventes_journalieres')
+    jour = models.DateField()
+    produit = models.ForeignKey(ProduitPharmacie, on_delete=models.CASCADE, related_name='ventes_journalieres')
+    quantite = models.IntegerField(default=0)
+    chiffre_affaire = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    benefice = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    nombre_lignes = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['pharmacie', 'jour', 'produit'],
+                name='unique_vente_journaliere'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.jour} - {self.produit_id} x {self.quantite}"
+
+
+######### JOURNAL DES MODIFICATIONS (synchronisation local ⇄ Render) ###################
+class JournalModification(models.Model):
+    """
+    Une ligne par insertion / modification / suppression d'une table
+    synchronisée, écrite par des triggers PostgreSQL (migration 0007) : les
+    bulk_create / bulk_update / update() sont donc aussi journalisés.
+
+    La synchronisation lit ce journal au lieu de comparer des updated_at
+    (voir pharmacie/synchronisation.py). `txid` est l'identifiant de la
+    transaction qui a écrit la ligne : il sert de curseur sûr même quand des
+    transactions concurrentes valident dans le désordre.
+
+    `synchro` marque les écritures faites par la synchronisation elle-même :
+    elles ne sont pas renvoyées à l'autre base, mais restent visibles pour
+    les autres lecteurs du journal (catalogue des caisses).
+
+    `pharmacie_id` recopie la colonne pharmacie_id de la ligne écrite quand
+    la table en a une (NULL sinon) : c'est la seule trace de la pharmacie
+    d'une ligne supprimée.
+    """
+    OPERATIONS = (
+        ('I', 'Insertion'),
+        ('U', 'Modification'),
+        ('D', 'Suppression'),
+    )
+
+    seq = models.BigAutoField(primary_key=True)
+    table = models.CharField(max_length=100)
+    objet_id = models.UUIDField()
+    operation = models.CharField(max_length=1, choices=OPERATIONS)
+    txid = models.BigIntegerField(db_index=True)
+    date = models.DateTimeField(default=timezone.now)
+    synchro = models.BooleanField(default=False)
+    pharmacie_id = models.UUIDField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            # Changements d'une table pour une pharmacie (catalogue caisse)
+            models.Index(fields=['table', 'pharmacie_id', 'txid'], name='journal_table_pharm_txid_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.operation} {self.table} {self.objet_id}"
+
+
+class CurseurJournal(models.Model):
+    """
+    Curseur acquitté par un lecteur du journal de cette base (script de
+    synchronisation d'une pharmacie) : tout ce qui est en dessous de `txid`
+    a été appliqué ailleurs. La commande purger_journal supprime le journal
+    sous le plus petit curseur.
+
+    La ligne PURGE garde la limite de la dernière purge : un curseur plus
+    ancien ne peut plus être lu (voir synchronisation.JournalPurge).
+    """
+    PURGE = 'purge'
+
+    consommateur = models.CharField(max_length=100, unique=True)
+    txid = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consommateur} → {self.txid}"
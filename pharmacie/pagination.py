@@ -0,0 +1,69 @@
+# pharmacie/pagination.py
+"""
+Pagination par curseur (keyset) sur (date, id), du plus récent au plus ancien.
+
+Contrairement à PageNumberPagination, une page ne coûte pas un OFFSET
+croissant ni un COUNT(*) : la requête reprend juste après la dernière ligne
+vue, en s'appuyant sur l'index (pharmacie, date).
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+class PaginationCurseur:
+    taille_defaut = 50
+    taille_max = 500
+
+    def __init__(self, champ_date, param_curseur, param_taille='page_size'):
+        self.champ_date = champ_date
+        self.param_curseur = param_curseur
+        self.param_taille = param_taille
+
+    def taille_page(self, request):
+        try:
+            taille = int(request.query_params.get(self.param_taille, self.taille_defaut))
+        except (TypeError, ValueError):
+            return self.taille_defaut
+        return max(1, min(taille, self.taille_max))
+
+    @staticmethod
+    def encoder(valeur_date, pk):
+        brut = json.dumps([valeur_date.isoformat(), str(pk)])
+        return base64.urlsafe_b64encode(brut.encode()).decode()
+
+    def decoder(self, curseur, modele):
+        """(date, pk) convertis avec les champs de `modele` ; 400 si le curseur est altéré."""
+        try:
+            valeur_date, pk = json.loads(base64.urlsafe_b64decode(curseur.encode()))
+            valeur_date = modele._meta.get_field(self.champ_date).to_python(valeur_date)
+            pk = modele._meta.pk.to_python(pk)
+            if valeur_date is None or pk is None:
+                raise ValueError
+        except (ValueError, TypeError, DjangoValidationError):
+            raise ValidationError({self.param_curseur: "Curseur invalide."})
+        return valeur_date, pk
+
+    def paginer(self, queryset, request):
+        """Retourne (objets de la page, curseur de la page suivante ou None)."""
+        queryset = queryset.order_by(f'-{self.champ_date}', '-id')
+
+        curseur = request.query_params.get(self.param_curseur)
+        if curseur:
+            valeur_date, pk = self.decoder(curseur, queryset.model)
+            queryset = queryset.filter(
+                Q(**{f'{self.champ_date}__lt': valeur_date})
+                | Q(**{self.champ_date: valeur_date, 'id__lt': pk})
+            )
+
+        taille = self.taille_page(request)
+        objets = list(queryset[:taille + 1])
+        if len(objets) <= taille:
+            return objets, None
+
+        objets = objets[:taille]
+        dernier = objets[-1]
+        return objets, self.encoder(getattr(dernier, self.champ_date), dernier.pk)
@@ -0,0 +1,231 @@
+# pharmacie/paquet_sync.py
+"""
+Paquet de synchronisation hors ligne (clé USB, transfert de fichier).
+
+Un paquet est une archive .tar contenant :
+  - manifest.json : version du format, pharmacie, curseurs du journal et,
+    pour chaque modèle, son fichier, ses nombres de lignes et son SHA-256 ;
+  - un fichier <app>.<modele>.ndjson.gz par modèle, une ligne JSON par objet
+    ({"pk": ..., "fields": {...}}, format des fixtures Django) ou par
+    suppression ({"pk": ..., "supprime": true}).
+
+Voir les commandes `exporter_paquet_sync` et `importer_paquet_sync`.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+from datetime import datetime
+
+from django.apps import apps
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .statistiques import TABLES_VENTES, jours_touches, reconstruire_jours
+from .synchronisation import (
+    MODELES_GLOBAUX, MODELES_PAR_PHARMACIE, PHARMACIE_LOOKUP_BY_MODEL,
+    filigrane, lire_journal, sans_journal, suppressions_synchro, par_paquets, upsert,
+)
+
+VERSION = 1
+MANIFESTE = 'manifest.json'
+
+
+class PaquetInvalide(Exception):
+    pass
+
+
+class _Encodeur(DjangoJSONEncoder):
+    # DjangoJSONEncoder tronque les datetimes à la milliseconde ; updated_at
+    # doit rester identique des deux côtés
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _sha256(fichier):
+    empreinte = hashlib.sha256()
+    for bloc in iter(lambda: fichier.read(1 << 20), b''):
+        empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def ecrire_paquet(chemin, using='default', pharmacie=None, depuis=None, taille_lot=1000):
+    """
+    Écrit dans `chemin` les changements de `using` depuis le curseur `depuis`
+    (tout si None), limités à `pharmacie` pour les modèles par pharmacie.
+    Retourne le manifeste.
+    """
+    if depuis is None:
+        changements, jusqua = None, filigrane(using)
+    else:
+        changements, jusqua = lire_journal(using, depuis, pharmacie=pharmacie)
+
+    manifeste = {
+        'version': VERSION,
+        'cree_le': timezone.now().isoformat(),
+        'pharmacie': str(pharmacie.pk) if pharmacie else None,
+        'depuis': depuis,
+        'jusqua': jusqua,
+        'modeles': [],
+    }
+
+    with tempfile.TemporaryDirectory() as dossier, tarfile.open(chemin, 'w') as archive:
+        fichiers = []
+        for label in MODELES_GLOBAUX + MODELES_PAR_PHARMACIE:
+            modele = apps.get_model(label)
+            qs = modele.objects.using(using)
+            if pharmacie and label in MODELES_PAR_PHARMACIE:
+                qs = qs.filter(**{PHARMACIE_LOOKUP_BY_MODEL[modele.__name__]: pharmacie})
+
+            if changements is None:
+                lots = par_paquets(qs.iterator(chunk_size=taille_lot), taille_lot)
+                suppressions = set()
+            else:
+                table = changements.get(modele._meta.db_table)
+                if not table:
+                    continue
+                lots = (qs.filter(pk__in=ids) for ids in par_paquets(table['upsert'], taille_lot))
+                suppressions = table['delete']
+
+            champs = [f.name for f in modele._meta.concrete_fields if not f.primary_key]
+            nom = f'{label.lower()}.ndjson.gz'
+            chemin_fichier = os.path.join(dossier, nom)
+            lignes = 0
+            with gzip.open(chemin_fichier, 'wt', encoding='utf-8') as sortie:
+                for objets in lots:
+                    for objet in serializers.serialize('python', objets, fields=champs):
+                        sortie.write(json.dumps({'pk': objet['pk'], 'fields': objet['fields']}, cls=_Encodeur) + '\n')
+                        lignes += 1
+                for pk in suppressions:
+                    sortie.write(json.dumps({'pk': str(pk), 'supprime': True}) + '\n')
+
+            with open(chemin_fichier, 'rb') as f:
+                sha256 = _sha256(f)
+            manifeste['modeles'].append({
+                'modele': label,
+                'fichier': nom,
+                'lignes': lignes,
+                'suppressions': len(suppressions),
+                'sha256': sha256,
+            })
+            fichiers.append((chemin_fichier, nom))
+
+        contenu = json.dumps(manifeste, indent=2).encode('utf-8')
+        info = tarfile.TarInfo(MANIFESTE)
+        info.size = len(contenu)
+        archive.addfile(info, io.BytesIO(contenu))
+        for chemin_fichier, nom in fichiers:
+            archive.add(chemin_fichier, arcname=nom)
+
+    return manifeste
+
+
+def lire_manifeste(archive):
+    try:
+        manifeste = json.load(archive.extractfile(MANIFESTE))
+    except (KeyError, ValueError):
+        raise PaquetInvalide("manifest.json absent ou illisible.")
+    if manifeste.get('version') != VERSION:
+        raise PaquetInvalide(f"Version de paquet non prise en charge : {manifeste.get('version')}")
+
+    # Toutes les empreintes sont vérifiées avant la moindre écriture
+    for entree in manifeste['modeles']:
+        try:
+            sha256 = _sha256(archive.extractfile(entree['fichier']))
+        except KeyError:
+            raise PaquetInvalide(f"{entree['fichier']} manquant.")
+        if sha256 != entree['sha256']:
+            raise PaquetInvalide(f"{entree['fichier']} corrompu (SHA-256 différent).")
+    return manifeste
+
+
+def appliquer_paquet(chemin, using='default', taille_lot=500):
+    """
+    Vérifie puis applique un paquet dans `using`, en une seule transaction.
+    Une ligne n'est écrite que si elle est plus récente (updated_at) que
+    celle de `using`.
+    Retourne (manifeste, {label: {'ecrits', 'supprimes', 'inchanges', 'conflits'}}).
+    """
+    try:
+        archive = tarfile.open(chemin, 'r')
+    except (OSError, tarfile.TarError) as e:
+        raise PaquetInvalide(f"Archive illisible : {e}")
+
+    resultats = {}
+    # Jours de vente à recalculer : VenteJournaliere n'est pas alimentée par upsert
+    jours, ecrits_ventes = set(), {}
+    with archive, transaction.atomic(using=using):
+        manifeste = lire_manifeste(archive)
+        sans_journal(using)
+
+        for entree in manifeste['modeles']:
+            label = entree['modele']
+            modele = apps.get_model(label)
+            table = modele._meta.db_table
+            ventes = table in TABLES_VENTES
+            date_modification = hasattr(modele, 'updated_at')
+            ecrits, supprimes, inchanges, conflits = 0, 0, 0, set()
+
+            with gzip.open(archive.extractfile(entree['fichier']), 'rt', encoding='utf-8') as lignes:
+                a_supprimer = []
+                for paquet in par_paquets((json.loads(ligne) for ligne in lignes), taille_lot):
+                    objets = []
+                    for ligne in paquet:
+                        if ligne.get('supprime'):
+                            a_supprimer.append(ligne['pk'])
+                        else:
+                            objets.append({'model': label, 'pk': ligne['pk'], 'fields': ligne['fields']})
+                    objets = [
+                        d.object for d in
+                        serializers.deserialize('python', objets, using=using, ignorenonexistent=True)
+                    ]
+                    if date_modification:
+                        # La version la plus récente gagne, comme dans les sync_data :
+                        # un paquet ancien n'écrase pas ce que la synchro a déjà apporté
+                        existants = dict(
+                            modele.objects.using(using)
+                            .filter(pk__in=[obj.pk for obj in objets]).values_list('pk', 'updated_at')
+                        )
+                        a_ecrire = [
+                            obj for obj in objets
+                            if not (existants.get(obj.pk) and obj.updated_at and existants[obj.pk] >= obj.updated_at)
+                        ]
+                        inchanges += len(objets) - len(a_ecrire)
+                        objets = a_ecrire
+                    if ventes:
+                        ids = {obj.pk for obj in objets}
+                        jours |= jours_touches(using, {table: {'upsert': ids}})
+                    n, ecartes = upsert(modele, using, objets, taille_lot)
+                    if ventes:
+                        ecrits_ventes.setdefault(table, set()).update(ids - ecartes)
+                    ecrits += n
+                    conflits |= ecartes
+
+            # Le journal ne garde pas la pharmacie d'une ligne supprimée : un
+            # paquet ne supprime que des lignes de la pharmacie qui l'a exporté
+            supprimables = modele.objects.using(using)
+            lookup = PHARMACIE_LOOKUP_BY_MODEL.get(modele.__name__)
+            if lookup and manifeste['pharmacie']:
+                supprimables = supprimables.filter(**{lookup: manifeste['pharmacie']})
+            with suppressions_synchro():
+                for ids in par_paquets(a_supprimer, taille_lot):
+                    cibles = supprimables.filter(pk__in=ids)
+                    if ventes:
+                        jours |= jours_touches(using, {table: {'delete': set(cibles.values_list('pk', flat=True))}})
+                    supprimes += cibles.delete()[0]
+
+            resultats[label] = {
+                'ecrits': ecrits, 'supprimes': supprimes, 'inchanges': inchanges, 'conflits': len(conflits),
+            }
+
+        jours |= jours_touches(using, {table: {'upsert': ids} for table, ids in ecrits_ventes.items()})
+        reconstruire_jours(using, jours)
+
+    return manifeste, resultats
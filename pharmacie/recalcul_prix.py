@@ -0,0 +1,263 @@
+# pharmacie/recalcul_prix.py
+"""
+Recalcul des prix en CDF après un changement de taux ou de prix fabricant.
+
+Les mises à jour sont faites par paquets (bulk_update / UPDATE ensemblistes)
+au lieu d'un .save() par ligne, et seules les lignes dont le prix change
+réellement sont écrites. Ces fonctions sont appelées par le worker
+`traiter_taches_recalcul` (voir TacheRecalcul), jamais dans une requête HTTP.
+
+Les lignes sont parcourues par clé croissante et chaque paquet est validé
+dans sa propre transaction avec son point de reprise (étape + dernière clé
+traitée), transmis à `progression`. Après un échec, les prix sont mélangés
+(ancien taux / nouveau taux) jusqu'à ce que la tâche soit relancée avec ce
+point de reprise : elle repart du paquet suivant au lieu de tout refaire.
+"""
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import ProduitPharmacie, CommandeProduitLigne, LotProduitPharmacie
+from .taux import taux_actuel
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 1000
+
+
+ETAPES = ('produits', 'lignes_commande')
+
+
+class _Avancement:
+    """
+    Compte les lignes parcourues et les paquets validés, et tient le point de
+    reprise remonté à l'appelant.
+    """
+
+    def __init__(self, progression, reprise, *querysets):
+        reprise = reprise or {}
+        self.progression = progression
+        self.etape = reprise.get('etape')
+        self.pk = reprise.get('pk')
+        self.traites = reprise.get('traites', 0)
+        self.paquets = reprise.get('paquets', 0)
+        self.total = sum(qs.count() for qs in querysets) if progression else 0
+
+    def restant(self, etape, queryset):
+        """Lignes de `etape` pas encore validées, None si l'étape est déjà faite."""
+        queryset = queryset.order_by('pk')
+        if self.etape is None:
+            return queryset
+        if ETAPES.index(etape) < ETAPES.index(self.etape):
+            return None
+        if etape == self.etape and self.pk:
+            return queryset.filter(pk__gt=self.pk)
+        return queryset
+
+    def traiter(self):
+        self.traites += 1
+
+    def valider(self, etape, pk):
+        """À appeler dans la transaction du paquet, après ses écritures."""
+        self.paquets += 1
+        self.etape = etape
+        self.pk = str(pk) if pk is not None else self.pk
+        if self.progression:
+            self.progression(self.traites, self.total, self.reprise())
+
+    def reprise(self):
+        return {'etape': self.etape, 'pk': self.pk, 'traites': self.traites, 'paquets': self.paquets}
+
+
+def calculer_prix_plaquette(prix_boite_cdf, nb_plaquettes, marge_beneficiaire):
+    """Retourne (prix_achat, prix_vente) par plaquette, arrondis comme ProduitPharmacie.save()."""
+    prix_achat = (Decimal(prix_boite_cdf) / Decimal(nb_plaquettes)).quantize(Decimal('0.01'))
+    prix_vente = None
+    if marge_beneficiaire is not None:
+        prix_vente = (prix_achat + (prix_achat * marge_beneficiaire / 100)).quantize(Decimal('0.01'))
+    return prix_achat, prix_vente
+
+
+def _recalculer_produits_pharmacie(queryset, taux, maintenant, taille_lot, avancement):
+    """
+    Recalcule prix_achat / prix_vente des ProduitPharmacie et recopie les
+    nouveaux prix sur leurs lots, paquet par paquet (voir en-tête du module).
+
+    Retourne (nombre de produits modifiés, nombre de lots modifiés).
+    """
+    queryset = avancement.restant('produits', queryset)
+    if queryset is None:
+        return 0, 0
+    queryset = queryset.select_related('produit_fabricant').only(
+        'id', 'prix_achat', 'prix_vente', 'marge_beneficiaire',
+        'produit_fabricant__prix_achat',
+        'produit_fabricant__devise',
+        'produit_fabricant__nombre_plaquettes_par_boite',
+    )
+
+    nb_produits = 0
+    nb_lots = 0
+    a_ecrire = []
+    dernier = None
+
+    def ecrire():
+        with transaction.atomic():
+            lots = 0
+            if a_ecrire:
+                ProduitPharmacie.objects.bulk_update(a_ecrire, ['prix_achat', 'prix_vente', 'updated_at'])
+                lots = _recalculer_lots([p.id for p in a_ecrire], maintenant)
+            avancement.valider('produits', dernier)
+        return lots
+
+    for produit in queryset.iterator(chunk_size=taille_lot):
+        avancement.traiter()
+        dernier = produit.pk
+        fabricant = produit.produit_fabricant
+        nb_plaquettes = fabricant.nombre_plaquettes_par_boite
+        if not nb_plaquettes:
+            continue
+
+        prix_boite = Decimal(fabricant.prix_achat)
+        if fabricant.devise == 'USD':
+            prix_boite *= Decimal(taux)
+
+        prix_achat, prix_vente = calculer_prix_plaquette(
+            prix_boite, nb_plaquettes, produit.marge_beneficiaire
+        )
+        if prix_vente is None:
+            prix_vente = produit.prix_vente
+
+        if produit.prix_achat == prix_achat and produit.prix_vente == prix_vente:
+            continue
+
+        produit.prix_achat = prix_achat
+        produit.prix_vente = prix_vente
+        produit.updated_at = maintenant
+        a_ecrire.append(produit)
+        nb_produits += 1
+
+        if len(a_ecrire) >= taille_lot:
+            nb_lots += ecrire()
+            a_ecrire = []
+
+    nb_lots += ecrire()
+
+    return nb_produits, nb_lots
+
+
+def _recalculer_lots(ids_produits, maintenant):
+    """Recopie les prix des produits modifiés sur leurs lots (un seul UPDATE)."""
+    produit = ProduitPharmacie.objects.filter(pk=OuterRef('produit_id'))
+    return LotProduitPharmacie.objects.filter(produit_id__in=ids_produits).update(
+        prix_achat=Subquery(produit.values('prix_achat')[:1]),
+        prix_vente=Subquery(produit.values('prix_vente')[:1]),
+        updated_at=maintenant,
+    )
+
+
+def _recalculer_lignes_commande(queryset, taux, maintenant, taille_lot, avancement):
+    """Recalcule prix_achat (CDF) des lignes de commande en USD."""
+    queryset = avancement.restant('lignes_commande', queryset)
+    if queryset is None:
+        return 0
+    queryset = queryset.select_related('produit_fabricant').only(
+        'id', 'prix_achat', 'produit_fabricant__prix_achat', 'produit_fabricant__devise',
+    )
+
+    total = 0
+    a_ecrire = []
+    dernier = None
+
+    def ecrire():
+        with transaction.atomic():
+            if a_ecrire:
+                CommandeProduitLigne.objects.bulk_update(a_ecrire, ['prix_achat', 'updated_at'])
+            avancement.valider('lignes_commande', dernier)
+
+    for ligne in queryset.iterator(chunk_size=taille_lot):
+        avancement.traiter()
+        dernier = ligne.pk
+        prix = (Decimal(ligne.produit_fabricant.prix_achat) * Decimal(taux)).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP
+        )
+        if ligne.prix_achat == prix:
+            continue
+
+        ligne.prix_achat = prix
+        ligne.updated_at = maintenant
+        a_ecrire.append(ligne)
+        total += 1
+
+        if len(a_ecrire) >= taille_lot:
+            ecrire()
+            a_ecrire = []
+
+    ecrire()
+
+    return total
+
+
+def recalculer_prix_apres_taux(taux, taille_lot=TAILLE_LOT, progression=None, reprise=None):
+    """
+    Applique un nouveau taux à toutes les lignes libellées en USD :
+    ProduitPharmacie, LotProduitPharmacie et CommandeProduitLigne.
+
+    `progression(traites, total, reprise)` est appelé dans la transaction de
+    chaque paquet ; passer le dernier `reprise` reçu pour continuer un
+    recalcul interrompu. Retourne un dict avec le nombre de lignes modifiées
+    par table (depuis la reprise), le nombre de paquets validés et la durée (s).
+    """
+    debut = time.monotonic()
+    maintenant = timezone.now()
+
+    produits = ProduitPharmacie.objects.filter(produit_fabricant__devise='USD')
+    lignes = CommandeProduitLigne.objects.filter(produit_fabricant__devise='USD')
+    avancement = _Avancement(progression, reprise, produits, lignes)
+
+    nb_produits, nb_lots = _recalculer_produits_pharmacie(
+        produits, taux, maintenant, taille_lot, avancement
+    )
+    nb_lignes = _recalculer_lignes_commande(lignes, taux, maintenant, taille_lot, avancement)
+
+    resultat = {
+        'produits': nb_produits,
+        'lots': nb_lots,
+        'lignes_commande': nb_lignes,
+        'paquets': avancement.paquets,
+        'duree': round(time.monotonic() - debut, 3),
+    }
+    logger.info("🔁 Recalcul des prix (taux %s) : %s", taux, resultat)
+    return resultat
+
+
+def recalculer_prix_produit_fabricant(produit_fabricant, taille_lot=TAILLE_LOT, progression=None, reprise=None):
+    """
+    Répercute le prix d'un ProduitFabricant sur les ProduitPharmacie qui le
+    référencent et sur leurs lots. `progression` et `reprise` : voir
+    recalculer_prix_apres_taux.
+    """
+    debut = time.monotonic()
+    maintenant = timezone.now()
+
+    # Le worker ne reçoit pas les invalidations des processus web : lecture directe
+    taux = taux_actuel(cache=False) or 1
+
+    produits = ProduitPharmacie.objects.filter(produit_fabricant=produit_fabricant)
+    avancement = _Avancement(progression, reprise, produits)
+
+    nb_produits, nb_lots = _recalculer_produits_pharmacie(
+        produits, taux, maintenant, taille_lot, avancement
+    )
+
+    resultat = {
+        'produits': nb_produits,
+        'lots': nb_lots,
+        'paquets': avancement.paquets,
+        'duree': round(time.monotonic() - debut, 3),
+    }
+    logger.info("🔁 Recalcul des prix (%s) : %s", produit_fabricant.nom, resultat)
+    return resultat
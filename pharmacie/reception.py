@@ -0,0 +1,128 @@
+# pharmacie/reception.py
+"""
+Entrée en stock d'une réception de commande fabricant.
+
+Toutes les lignes sont traitées ensemble : un SELECT des ProduitPharmacie
+déjà en stock, un bulk_create des produits manquants, un UPDATE unique
+(CASE WHEN) pour les quantités et les prix des produits existants, puis un
+bulk_create des ReceptionLigne et des lots. Le nombre de requêtes ne dépend
+pas du nombre de lignes. À appeler dans une transaction.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .identifiants import generer_code_barre, generer_numero_lot
+from .models import LotProduitPharmacie, ProduitPharmacie, ReceptionLigne
+
+DUREE_PEREMPTION_PRODUIT = timedelta(days=545)
+DUREE_PEREMPTION_LOT = timedelta(days=365)
+
+
+def _nouveau_produit(pharmacie_id, produit_fabricant, prix_achat, code_barre, aujourdhui):
+    produit = ProduitPharmacie(
+        pharmacie_id=pharmacie_id,
+        produit_fabricant=produit_fabricant,
+        quantite=0,
+        code_barre=code_barre,
+        nom_medicament=produit_fabricant.nom,
+        indication=True,
+        localisation='A0',
+        conditionnement='boîte',
+        date_peremption=aujourdhui + DUREE_PEREMPTION_PRODUIT,
+        categorie='True',
+        alerte_quantite=8,
+        prix_achat=prix_achat,
+        marge_beneficiaire=Decimal('35.00'),
+    )
+    produit.prix_vente = (
+        produit.prix_achat + (produit.prix_achat * produit.marge_beneficiaire / 100)
+    ).quantize(Decimal('0.01'))
+    produit.calculer_prix()
+    return produit
+
+
+def receptionner(reception, lignes):
+    """
+    `lignes` : [{'ligne_commande': CommandeProduitLigne (produit_fabricant
+    chargé), 'quantite_recue': n}, ...].
+
+    Ajoute au stock de la pharmacie de la commande quantite_recue × plaquettes
+    par boîte pour chaque ligne, crée les ProduitPharmacie manquants et un lot
+    par ligne. Retourne {produit_fabricant_id: ProduitPharmacie}.
+    """
+    pharmacie_id = reception.commande.pharmacie_id
+    aujourdhui = timezone.localdate()
+
+    plaquettes = defaultdict(int)
+    premiere_ligne = {}
+    for ligne in lignes:
+        produit_fabricant = ligne['ligne_commande'].produit_fabricant
+        plaquettes[produit_fabricant.id] += ligne['quantite_recue'] * produit_fabricant.nombre_plaquettes_par_boite
+        premiere_ligne.setdefault(produit_fabricant.id, ligne['ligne_commande'])
+
+    produits = {}
+    existants = (
+        ProduitPharmacie.objects
+        .filter(pharmacie_id=pharmacie_id, produit_fabricant_id__in=list(plaquettes))
+        .only('id', 'produit_fabricant_id', 'marge_beneficiaire', 'prix_achat', 'prix_vente')
+        .order_by('pk')
+    )
+    for produit in existants:
+        produits.setdefault(produit.produit_fabricant_id, produit)
+    a_jour = list(produits.values())
+
+    # Produits jamais reçus par cette pharmacie : créés avec tout leur stock
+    nouveaux = []
+    for produit_fabricant_id, ligne_commande in premiere_ligne.items():
+        if produit_fabricant_id in produits:
+            continue
+        produit = _nouveau_produit(
+            pharmacie_id, ligne_commande.produit_fabricant, ligne_commande.prix_achat,
+            generer_code_barre(), aujourdhui,
+        )
+        produit.quantite = plaquettes[produit_fabricant_id]
+        produits[produit_fabricant_id] = produit
+        nouveaux.append(produit)
+    if nouveaux:
+        ProduitPharmacie.objects.bulk_create(nouveaux)
+
+    # Produits existants : quantité incrémentée en SQL, prix recalculés au taux du jour
+    for produit in a_jour:
+        produit.produit_fabricant = premiere_ligne[produit.produit_fabricant_id].produit_fabricant
+        produit.calculer_prix()
+    if a_jour:
+        prix = DecimalField(max_digits=10, decimal_places=2)
+        ProduitPharmacie.objects.filter(pk__in=[p.pk for p in a_jour]).update(
+            quantite=F('quantite') + Case(
+                *[When(pk=p.pk, then=Value(plaquettes[p.produit_fabricant_id])) for p in a_jour],
+                output_field=IntegerField(),
+            ),
+            prix_achat=Case(*[When(pk=p.pk, then=Value(p.prix_achat)) for p in a_jour], output_field=prix),
+            prix_vente=Case(*[When(pk=p.pk, then=Value(p.prix_vente)) for p in a_jour], output_field=prix),
+            updated_at=timezone.now(),
+        )
+
+    ReceptionLigne.objects.bulk_create([
+        ReceptionLigne(reception=reception, ligne_commande=ligne['ligne_commande'], quantite_recue=ligne['quantite_recue'])
+        for ligne in lignes
+    ])
+
+    lots = []
+    for ligne in lignes:
+        produit_fabricant = ligne['ligne_commande'].produit_fabricant
+        produit = produits[produit_fabricant.id]
+        lots.append(LotProduitPharmacie(
+            produit=produit,
+            numero_lot=generer_numero_lot(),
+            quantite=ligne['quantite_recue'] * produit_fabricant.nombre_plaquettes_par_boite,
+            date_peremption=aujourdhui + DUREE_PEREMPTION_LOT,
+            prix_achat=produit.prix_achat,
+            prix_vente=produit.prix_vente,
+        ))
+    LotProduitPharmacie.objects.bulk_create(lots)
+
+    return produits
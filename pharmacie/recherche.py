@@ -0,0 +1,84 @@
+# pharmacie/recherche.py
+"""
+Recherche de produits par nom / code-barre (catalogue fabricants et stock
+d'une pharmacie, caisse).
+
+Sous PostgreSQL, chaque colonne recherchée a un index GIN pg_trgm sur
+UPPER(colonne::text) (migration 0008) : c'est l'expression générée par les
+lookups icontains / istartswith de Django, donc ces filtres, le SearchFilter
+de DRF et l'opérateur de similarité `%>` utilisent tous le même index.
+
+Deux modes :
+  - 'prefixe' : saisie au fil de la frappe, les noms qui commencent par le terme ;
+  - 'floue'   : sous-chaîne ou nom proche (fautes de frappe), classé par
+                similarité de trigrammes. Sans PostgreSQL, simple icontains.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import connections
+from django.db.models import Case, FloatField, Q, TextField, Value, When
+from django.db.models.functions import Cast, Greatest, Upper
+from rest_framework.exceptions import ValidationError
+
+MODES = ('floue', 'prefixe')
+LIMITE_DEFAUT = 20
+LIMITE_MAX = 50
+
+
+def _indexe(champ):
+    """Expression couverte par l'index trigramme de `champ`."""
+    return Upper(Cast(champ, TextField()))
+
+
+def _score(champs, terme):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    scores = [TrigramWordSimilarity(terme, champ) for champ in champs]
+    return scores[0] if len(scores) == 1 else Greatest(*scores)
+
+
+def rechercher(qs, champs, terme, mode='floue', limite=LIMITE_DEFAUT):
+    """
+    Filtre `qs` sur `champs` et retourne au plus `limite` objets annotés d'un
+    `score` (meilleur résultat d'abord). `champs[0]` sert d'ordre secondaire.
+    """
+    terme = terme.strip()
+    if mode not in MODES:
+        raise ValueError(f"Mode de recherche inconnu : {mode}")
+
+    if mode == 'prefixe':
+        qs = qs.filter(reduce(or_, (Q(**{f'{champ}__istartswith': terme}) for champ in champs)))
+        # Correspondance exacte d'abord (code-barre complet saisi au clavier)
+        exacte = reduce(or_, (Q(**{f'{champ}__iexact': terme}) for champ in champs))
+        qs = qs.annotate(score=Case(When(exacte, then=Value(1.0)), default=Value(0.5), output_field=FloatField()))
+        return qs.order_by('-score', champs[0])[:limite]
+
+    filtre = reduce(or_, (Q(**{f'{champ}__icontains': terme}) for champ in champs))
+    if connections[qs.db].vendor == 'postgresql':
+        alias = {f'_trgm_{i}': _indexe(champ) for i, champ in enumerate(champs)}
+        qs = qs.alias(**alias)
+        filtre |= reduce(or_, (Q(**{f'{nom}__trigram_word_similar': terme}) for nom in alias))
+        score = _score(champs, terme)
+    else:
+        debut = reduce(or_, (Q(**{f'{champ}__istartswith': terme}) for champ in champs))
+        score = Case(When(debut, then=Value(1.0)), default=Value(0.5), output_field=FloatField())
+
+    return qs.filter(filtre).annotate(score=score).order_by('-score', champs[0])[:limite]
+
+
+def parametres(request):
+    """Lit ?q=&mode=&limite= ; ValidationError si invalides."""
+    terme = request.query_params.get('q', '').strip()
+    mode = request.query_params.get('mode', 'floue')
+    if not terme:
+        raise ValidationError({'q': "Terme de recherche requis."})
+    if mode not in MODES:
+        raise ValidationError({'mode': f"Valeurs possibles : {', '.join(MODES)}."})
+    try:
+        limite = min(int(request.query_params.get('limite', LIMITE_DEFAUT)), LIMITE_MAX)
+    except ValueError:
+        raise ValidationError({'limite': "Entier attendu."})
+    if limite < 1:
+        raise ValidationError({'limite': "Entier positif attendu."})
+    return terme, mode, limite
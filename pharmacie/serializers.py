@@ -1,8 +1,35 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import Fabricant, ProduitFabricant
+from .taux import taux_actuel
 from comptes.models import Pharmacie
 
-class ProduitFabricantSerializer(serializers.ModelSerializer):
+
+def champs_demandes(request):
+    """Champs de ?fields=id,nom,prix_vente (None si absent ou hors lecture)."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    valeur = request.query_params.get('fields')
+    if not valeur:
+        return None
+    return {champ.strip() for champ in valeur.split(',') if champ.strip()}
+
+
+class ChampsDynamiquesMixin:
+    """
+    ⚡ Sélection de champs : ?fields=id,nom_medicament,prix_vente ne renvoie que
+    ces champs. Seul le serializer de premier niveau (celui de la vue) est
+    concerné ; les champs inconnus sont ignorés.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        demandes = champs_demandes(self.context.get('request'))
+        if demandes:
+            for nom in set(self.fields) - demandes:
+                self.fields.pop(nom)
+
+
+class ProduitFabricantSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     fabricant_nom = serializers.CharField(source='fabricant.nom', read_only=True)
     taux_change = serializers.SerializerMethodField()
     prix_achat_cdf = serializers.SerializerMethodField()
@@ -18,10 +45,7 @@ class ProduitFabricantSerializer(serializers.ModelSerializer):
         read_only_fields = ['fabricant_nom']
     def get_taux_change(self, obj):
         if obj.devise == 'USD':
-            try:
-                return TauxChange.objects.latest('date').taux
-            except TauxChange.DoesNotExist:
-                return None
+            return taux_actuel()
         return None
 
     def get_prix_achat_cdf(self, obj):
@@ -51,9 +75,29 @@ from rest_framework import serializers
 from .models import TauxChange
 
 class TauxChangeSerializer(serializers.ModelSerializer):
+    # Id de la tâche de recalcul planifiée par l'enregistrement (création / modification)
+    tache_recalcul = serializers.SerializerMethodField()
+
     class Meta:
         model = TauxChange
-        fields = ['id', 'taux', 'date']
+        fields = ['id', 'taux', 'date', 'tache_recalcul']
+
+    def get_tache_recalcul(self, obj):
+        tache = getattr(obj, 'tache_recalcul', None)
+        return tache.id if tache else None
+
+from .models import TacheRecalcul
+
+class TacheRecalculSerializer(serializers.ModelSerializer):
+    progression = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = TacheRecalcul
+        fields = [
+            'id', 'type_tache', 'cible_id', 'statut', 'total', 'traites',
+            'progression', 'resultat', 'erreur', 'created_at', 'debut', 'fin',
+        ]
+        read_only_fields = fields
 
 class FabricantSerializer(serializers.ModelSerializer):
     produits = ProduitFabricantSerializer(many=True, read_only=True)
@@ -62,13 +106,20 @@ class FabricantSerializer(serializers.ModelSerializer):
         model = Fabricant
         fields = ['id', 'nom', 'pays_origine', 'produits']
 
-class FabricantDetailSerializer(serializers.ModelSerializer):
+class FabricantDetailSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     produits = ProduitFabricantSerializer(many=True, read_only=True)
 
     class Meta:
         model = Fabricant
         fields = ['id', 'nom', 'pays_origine', 'produits']
-class FabricantDashboardSerializer(serializers.ModelSerializer):
+
+class FabricantResumeSerializer(serializers.ModelSerializer):
+    # Fabricant sans son catalogue (listes de commandes)
+    class Meta:
+        model = Fabricant
+        fields = ['id', 'nom', 'pays_origine']
+
+class FabricantDashboardSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     nombre_produits = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -84,30 +135,27 @@ from .models import ProduitPharmacie, ProduitFabricant, LotProduitPharmacie
 from rest_framework import serializers
 from decimal import Decimal, InvalidOperation
 from django.core.exceptions import ObjectDoesNotExist
-from django.utils.crypto import get_random_string
 
 from pharmacie.models import ProduitPharmacie, LotProduitPharmacie, TauxChange
 
-def generate_unique_numero_lot():
-    """Génère un numéro de lot unique du type LOT-AB12"""
-    while True:
-        numero = f"LOT-{get_random_string(4).upper()}"
-        if not LotProduitPharmacie.objects.filter(numero_lot=numero).exists():
-            return numero
-
-class ProduitPharmacieSerializer(serializers.ModelSerializer):
+class ProduitPharmacieSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = ProduitPharmacie
-        fields = '__all__'
+        fields = [
+            'id', 'pharmacie', 'produit_fabricant', 'code_barre', 'nom_medicament',
+            'indication', 'localisation', 'conditionnement', 'date_peremption',
+            'categorie', 'alerte_quantite', 'quantite', 'prix_achat',
+            'marge_beneficiaire', 'prix_vente', 'updated_at',
+        ]
         read_only_fields = ['pharmacie', 'prix_achat', 'prix_vente']
 
 # serializers.py
 from rest_framework import serializers
 from .models import LotProduitPharmacie
 
-class LotProduitPharmacieSerializer(serializers.ModelSerializer):
+class LotProduitPharmacieSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     nom_medicament = serializers.CharField(source='produit.nom_medicament', read_only=True)
-    pharmacie_id = serializers.CharField(source='produit.pharmacie.id', read_only=True)
+    pharmacie_id = serializers.CharField(source='produit.pharmacie_id', read_only=True)
 
     class Meta:
         model = LotProduitPharmacie
@@ -127,9 +175,9 @@ from rest_framework import serializers
 from .models import LotProduitPharmacie
 from .models import ProduitPharmacie
 
-class LotsProduitPharmacieSerializer(serializers.ModelSerializer):
+class LotsProduitPharmacieSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     nom_medicament = serializers.CharField(source='produit.nom_medicament', read_only=True)
-    pharmacie_id = serializers.CharField(source='produit.pharmacie.id', read_only=True)
+    pharmacie_id = serializers.CharField(source='produit.pharmacie_id', read_only=True)
     class Meta:
         model = LotProduitPharmacie
         fields = [
@@ -193,6 +241,8 @@ from pharmacie.models import TauxChange, CommandeProduit, CommandeProduitLigne
 from rest_framework import serializers
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import date, timedelta
+from django.utils import timezone
+from .utils import intervalle_jours
 import random
 import string
 from pharmacie.models import (
@@ -203,11 +253,11 @@ from pharmacie.models import (
     LotProduitPharmacie
 )
 
-def generer_code_barre_aleatoire():
-    chars = string.ascii_letters + string.digits + "!@#$%^&*"
-    return ''.join(random.choices(chars, k=6))
-
 class CommandeProduitLigneSerializer(serializers.ModelSerializer):
+    # Simple identifiant : les produits sont chargés en une requête dans
+    # CommandeProduitSerializer.validate
+    produit_fabricant = serializers.UUIDField(source='produit_fabricant_id')
+
     class Meta:
         model = CommandeProduitLigne
         fields = ['produit_fabricant', 'quantite_commandee', 'prix_achat']
@@ -221,6 +271,18 @@ class CommandeProduitSerializer(serializers.ModelSerializer):
         fields = ['id', 'date_commande', 'etat', 'fabricant', 'lignes']
         read_only_fields = ['id']
 
+    def validate_lignes(self, lignes):
+        ids = {ligne['produit_fabricant_id'] for ligne in lignes}
+        produits = ProduitFabricant.objects.in_bulk(ids)
+
+        for ligne in lignes:
+            produit = produits.get(ligne.pop('produit_fabricant_id'))
+            if produit is None:
+                raise serializers.ValidationError("Produit fabricant introuvable.")
+            ligne['produit_fabricant'] = produit
+
+        return lignes
+
     def create(self, validated_data):
         lignes_data = validated_data.pop('lignes')
         user = self.context['request'].user
@@ -229,52 +291,57 @@ class CommandeProduitSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("L'utilisateur n'est pas lié à une pharmacie.")
 
         pharmacie = user.pharmacie
-        today = date.today()
-        errors = []
+        debut_jour, fin_jour = intervalle_jours(timezone.localdate(), timezone.localdate())
 
-        for idx, ligne_data in enumerate(lignes_data):
-            produit = ligne_data['produit_fabricant']
-
-            deja_commande = CommandeProduitLigne.objects.filter(
-                produit_fabricant=produit,
+        # ⚡ Une seule requête pour tous les produits déjà commandés aujourd'hui
+        deja_commandes = set(
+            CommandeProduitLigne.objects.filter(
+                produit_fabricant_id__in={l['produit_fabricant'].id for l in lignes_data},
                 commande__pharmacie=pharmacie,
-                commande__date_commande__date=today
-            ).exists()
+                commande__date_commande__gte=debut_jour,
+                commande__date_commande__lt=fin_jour,
+            ).values_list('produit_fabricant_id', flat=True)
+        )
 
-            if deja_commande:
-                errors.append({
-                    'index': idx,
-                    'produit': produit.nom,
-                    'message': f"⚠ Le produit '{produit.nom}' a déjà été commandé aujourd’hui par votre pharmacie."
-                })
+        errors = [
+            {
+                'index': idx,
+                'produit': ligne_data['produit_fabricant'].nom,
+                'message': f"⚠ Le produit '{ligne_data['produit_fabricant'].nom}' a déjà été commandé aujourd’hui par votre pharmacie."
+            }
+            for idx, ligne_data in enumerate(lignes_data)
+            if ligne_data['produit_fabricant'].id in deja_commandes
+        ]
 
         if errors:
             raise serializers.ValidationError({'lignes': errors})
 
-        # Création de la commande (sans toucher au stock)
-        commande = CommandeProduit.objects.create(pharmacie=pharmacie, **validated_data)
+        # Un seul taux pour toute la commande
+        taux = taux_actuel()
+        if taux is None and any(l['produit_fabricant'].devise.upper() == 'USD' for l in lignes_data):
+            raise serializers.ValidationError("Aucun taux de change défini.")
 
-        for ligne_data in lignes_data:
-            produit_fabricant = ligne_data['produit_fabricant']
-            quantite = ligne_data['quantite_commandee']
-            devise = produit_fabricant.devise.upper()
-            prix_achat = Decimal(produit_fabricant.prix_achat)
-
-            if devise == 'USD':
-                try:
-                    taux = TauxChange.objects.latest('date').taux
-                    prix_achat *= Decimal(taux)
-                except TauxChange.DoesNotExist:
-                    raise serializers.ValidationError("Aucun taux de change défini.")
+        with transaction.atomic():
+            # Création de la commande (sans toucher au stock)
+            commande = CommandeProduit.objects.create(pharmacie=pharmacie, **validated_data)
 
-            prix_achat = prix_achat.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            lignes = []
+            for ligne_data in lignes_data:
+                produit_fabricant = ligne_data['produit_fabricant']
+                devise = produit_fabricant.devise.upper()
+                prix_achat = Decimal(produit_fabricant.prix_achat)
 
-            CommandeProduitLigne.objects.create(
-                commande=commande,
-                produit_fabricant=produit_fabricant,
-                quantite_commandee=quantite,
-                prix_achat=prix_achat
-            )
+                if devise == 'USD':
+                    prix_achat *= Decimal(taux)
+
+                # Même prix que CommandeProduitLigne.save, que bulk_create n'appelle pas
+                lignes.append(CommandeProduitLigne(
+                    commande=commande,
+                    produit_fabricant=produit_fabricant,
+                    quantite_commandee=ligne_data['quantite_commandee'],
+                    prix_achat=prix_achat.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                ))
+            CommandeProduitLigne.objects.bulk_create(lignes)
 
         return commande
 
@@ -285,40 +352,25 @@ from .models import CommandeProduit, CommandeProduitLigne, ReceptionProduit, Rec
 class ProduitCommandeSerializer(serializers.Serializer):
     produit = serializers.CharField(source='produit_fabricant.nom')
     quantite_commandee = serializers.IntegerField()
-    quantite_recue = serializers.SerializerMethodField()
+    # ⚡ Annoté (Sum des ReceptionLigne) par historique_mouvements
+    quantite_recue = serializers.IntegerField(read_only=True)
     prix_achat = serializers.DecimalField(max_digits=10, decimal_places=2)
 
-    def get_quantite_recue(self, obj):
-        reception_lignes = ReceptionLigne.objects.filter(ligne_commande=obj)
-        return sum(rl.quantite_recue for rl in reception_lignes)
-    
 
 class MouvementCommandeSerializer(serializers.ModelSerializer):
+    """
+    Attend les annotations de historique_mouvements : lignes préchargées avec
+    quantite_recue, date et utilisateur de la dernière réception.
+    """
     fabricant = serializers.CharField(source='fabricant.nom')
-    produits = serializers.SerializerMethodField()
-    date_reception = serializers.SerializerMethodField()
-    utilisateur_reception = serializers.SerializerMethodField()
+    produits = ProduitCommandeSerializer(source='lignes', many=True, read_only=True)
+    date_reception = serializers.DateTimeField(read_only=True)
+    utilisateur_reception = serializers.CharField(read_only=True)
 
     class Meta:
         model = CommandeProduit
         fields = ['id', 'date_commande', 'etat', 'fabricant', 'produits', 'date_reception', 'utilisateur_reception']
 
-    def get_produits(self, obj):
-        lignes = CommandeProduitLigne.objects.filter(commande=obj)
-        return ProduitCommandeSerializer(lignes, many=True).data
-
-    def get_date_reception(self, obj):
-        receptions = obj.receptions.order_by('-date_reception')
-        if receptions.exists():
-            return receptions.first().date_reception
-        return None
-
-    def get_utilisateur_reception(self, obj):
-        receptions = obj.receptions.order_by('-date_reception')
-        if receptions.exists() and receptions.first().utilisateur:
-            return receptions.first().utilisateur.username
-        return None
-
 
 #####################Reception de medicament####################################
 from rest_framework import serializers
@@ -334,7 +386,13 @@ from pharmacie.models import (
     LotProduitPharmacie,
 )
 
+from .reception import receptionner
+
 class ReceptionLigneSerializer(serializers.ModelSerializer):
+    # Simple identifiant : les lignes de commande sont chargées en une requête
+    # dans ReceptionProduitSerializer.validate
+    ligne_commande = serializers.UUIDField(source='ligne_commande_id')
+
     class Meta:
         model = ReceptionLigne
         fields = ['ligne_commande', 'quantite_recue']
@@ -347,60 +405,30 @@ class ReceptionProduitSerializer(serializers.ModelSerializer):
         fields = ['id', 'commande', 'utilisateur', 'lignes']
         read_only_fields = ['id']
 
-    def create(self, validated_data):
-        lignes_data = validated_data.pop('lignes')
-
-        with transaction.atomic():
-            reception = ReceptionProduit.objects.create(**validated_data)
-            commande = reception.commande
-            pharmacie = commande.pharmacie
-
-            for ligne_data in lignes_data:
-                reception_ligne = ReceptionLigne.objects.create(reception=reception, **ligne_data)
-
-                commande_ligne = ligne_data['ligne_commande']
-                produit_fabricant = commande_ligne.produit_fabricant
-                quantite_recue = ligne_data['quantite_recue']
-
-                if not produit_fabricant:
-                    raise serializers.ValidationError("Produit fabricant introuvable pour la ligne.")
-
-                nb_plaquettes = quantite_recue * produit_fabricant.nombre_plaquettes_par_boite
+    def validate(self, data):
+        commande = data['commande']
+        ids = {ligne['ligne_commande_id'] for ligne in data['lignes']}
+        lignes_commande = CommandeProduitLigne.objects.select_related('produit_fabricant').in_bulk(ids)
 
-                produit_pharmacie, created = ProduitPharmacie.objects.get_or_create(
-                    pharmacie=pharmacie,
-                    produit_fabricant=produit_fabricant,
-                    defaults={
-                        'quantite': 0,
-                        'code_barre': generer_code_barre_aleatoire(),
-                        'nom_medicament': produit_fabricant.nom,
-                        'indication': True,
-                        'localisation': 'A0',
-                        'conditionnement': 'boîte',
-                        'date_peremption': date.today() + timedelta(days=545),
-                        'categorie': 'True',
-                        'alerte_quantite': 8,
-                        'prix_achat': commande_ligne.prix_achat,
-                        'marge_beneficiaire': Decimal('35.00'),
-                    }
+        for ligne in data['lignes']:
+            ligne_commande = lignes_commande.get(ligne.pop('ligne_commande_id'))
+            if ligne_commande is None:
+                raise serializers.ValidationError("Ligne de commande introuvable.")
+            if ligne_commande.commande_id != commande.id:
+                raise serializers.ValidationError(
+                    f"La ligne {ligne_commande.produit_fabricant.nom} n'appartient pas à cette commande."
                 )
+            ligne['ligne_commande'] = ligne_commande
 
-                produit_pharmacie.quantite += nb_plaquettes
-
-                if created:
-                    produit_pharmacie.prix_vente = (
-                        produit_pharmacie.prix_achat +
-                        (produit_pharmacie.prix_achat * produit_pharmacie.marge_beneficiaire / 100)
-                    ).quantize(Decimal('0.01'))
-
-                produit_pharmacie.save()
+        return data
 
-                LotProduitPharmacie.objects.create(
-                    produit=produit_pharmacie,
-                    quantite=nb_plaquettes,
-                    date_peremption=date.today() + timedelta(days=365)
-                )
+    def create(self, validated_data):
+        lignes_data = validated_data.pop('lignes')
 
+        with transaction.atomic():
+            reception = ReceptionProduit.objects.create(**validated_data)
+            # ⚡ Stock, produits manquants et lots en requêtes groupées (voir reception.py)
+            receptionner(reception, lignes_data)
             return reception
 
 ###############################################
@@ -413,7 +441,7 @@ class CommandeProduitLigneDetailSerializer(serializers.ModelSerializer):
 
 class CommandeProduitDetailSerializer(serializers.ModelSerializer):
     lignes = CommandeProduitLigneDetailSerializer(many=True, read_only=True)
-    fabricant = FabricantSerializer(read_only=True)
+    fabricant = FabricantResumeSerializer(read_only=True)
 
     class Meta:
         model = CommandeProduit
@@ -427,7 +455,7 @@ from comptes.models import Pharmacie
 
 # Sérialiseur ProduitPharmacie simples
 
-class ProduitsPharmacieSerializer(serializers.ModelSerializer):
+class ProduitsPharmacieSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = ProduitPharmacie
         fields = ['id', 'nom_medicament', 'prix_vente', 'quantite', 'code_barre']
@@ -438,16 +466,15 @@ class PharmacieSerializer(serializers.ModelSerializer):
         fields = '__all__'  # ✅ Affiche tous les champs du modèle
 
 class VenteLigneSerializer(serializers.ModelSerializer):
+    # Simple id : les produits du panier sont chargés en une seule requête
+    # dans VenteProduitSerializer (validate puis create, sous verrou)
+    produit = serializers.UUIDField(source='produit_id')
+    quantite = serializers.IntegerField(min_value=1)
+
     class Meta:
         model = VenteLigne
         fields = ['produit', 'quantite']  # prix_unitaire n'est plus requis
 
-    def create(self, validated_data):
-        # Récupère automatiquement le prix du produit
-        produit = validated_data['produit']
-        validated_data['prix_unitaire'] = produit.prix_vente
-        return super().create(validated_data)
-
 ################################# Historique de la vente #################################
 # serializers.py
 from rest_framework import serializers
@@ -498,6 +525,9 @@ from .models import VenteProduit, ProduitPharmacie, Client
 from .serializers import VenteLigneSerializer, PharmacieSerializer
 
 from rest_framework.fields import CurrentUserDefault
+from collections import defaultdict
+from .stock import sortir_stock, cout_unitaire_moyen, StockInsuffisant
+from .statistiques import cumuler_ventes
 
 class CurrentPharmacieDefault:
     requires_context = True
@@ -542,80 +572,90 @@ class VenteProduitSerializer(serializers.ModelSerializer):
         pharmacie = data['pharmacie']
         client = data.get('client')
 
-        if client and client.pharmacie != pharmacie:
+        if client and client.pharmacie_id != pharmacie.id:
             raise serializers.ValidationError(
                 "Le client n'appartient pas à cette pharmacie"
             )
 
-        for ligne in data['lignes']:
-            produit = ligne['produit']
-            if produit.pharmacie != pharmacie:
+        if not data['lignes']:
+            raise serializers.ValidationError("La vente doit contenir au moins une ligne.")
+
+        ids = {ligne['produit_id'] for ligne in data['lignes']}
+        produits = ProduitPharmacie.objects.only('id', 'pharmacie_id', 'nom_medicament').in_bulk(ids)
+
+        for produit_id in ids:
+            produit = produits.get(produit_id)
+            if produit is None:
+                raise serializers.ValidationError(f"Produit {produit_id} introuvable")
+            if produit.pharmacie_id != pharmacie.id:
                 raise serializers.ValidationError(
                     f"Le produit {produit.nom_medicament} n'appartient pas à cette pharmacie"
                 )
 
-            quantite = ligne['quantite']
-            if produit.quantite < quantite:
-                raise serializers.ValidationError(
-                    f"Stock insuffisant pour {produit.nom_medicament}. "
-                    f"Stock: {produit.quantite}, Demande: {quantite}"
-                )
+        # ⚠ Le stock est vérifié dans create(), sur les lignes verrouillées
 
         return data
 
     @transaction.atomic
-
     def create(self, validated_data):
         lignes_data = validated_data.pop('lignes')
         client = validated_data.pop('client', None)
 
-        vente = VenteProduit.objects.create(
-            client=client,
-            **validated_data
-        )
+        # Un même produit peut apparaître sur plusieurs lignes du panier
+        quantites = defaultdict(int)
+        for ligne_data in lignes_data:
+            quantites[ligne_data['produit_id']] += ligne_data['quantite']
+
+        try:
+            produits, consommations = sortir_stock(quantites)
+        except StockInsuffisant as e:
+            raise serializers.ValidationError(str(e))
+
+        couts = {
+            produit_id: cout_unitaire_moyen(produits[produit_id], consommations[produit_id], quantite)
+            for produit_id, quantite in quantites.items()
+        }
 
+        lignes = []
         total_vente = 0
 
         for ligne_data in lignes_data:
-            produit = ligne_data['produit']
+            produit = produits[ligne_data['produit_id']]
             quantite = ligne_data['quantite']
             prix_unitaire = produit.prix_vente
-            total_ligne = quantite * prix_unitaire
 
-            # Création de la ligne de vente
-            VenteLigne.objects.create(
-                vente=vente,
+            if prix_unitaire is None:
+                raise serializers.ValidationError(
+                    f"Le produit {produit.nom_medicament} n'a pas de prix de vente"
+                )
+
+            total_ligne = quantite * prix_unitaire
+            lignes.append(VenteLigne(
                 produit=produit,
                 quantite=quantite,
                 prix_unitaire=prix_unitaire,
-                total=total_ligne
-            )
-
-            # ✅ Réduction du stock global
-            produit.quantite -= quantite
-            produit.save()
-
-            # ✅ Réduction du stock dans les lots FIFO
-            quantite_restante = quantite
-            lots = produit.lots.filter(quantite__gt=0).order_by('date_entree')
-
-            for lot in lots:
-                if quantite_restante <= 0:
-                    break
-
-                quantite_a_retirer = min(lot.quantite, quantite_restante)
-                lot.quantite -= quantite_a_retirer
-                lot.save()
+                total=total_ligne,
+                cout_unitaire=couts[produit.id],
+            ))
+            total_vente += total_ligne
 
-                quantite_restante -= quantite_a_retirer
+        vente = VenteProduit.objects.create(
+            client=client,
+            montant_total=total_vente,
+            **validated_data
+        )
 
-            total_vente += total_ligne
+        for ligne in lignes:
+            ligne.vente = vente
+        VenteLigne.objects.bulk_create(lignes)
 
-        vente.montant_total = total_vente
-        vente.save(update_fields=['montant_total'])
+        cumuler_ventes(vente.pharmacie_id, vente.date_vente, [
+            (ligne.produit_id, ligne.quantite, ligne.total, ligne.benefice)
+            for ligne in lignes
+        ])
 
         if client:
-            client.update_stats()
+            Client.enregistrer_vente(vente)
 
         return vente
 
@@ -741,25 +781,19 @@ class StatistiquesDuJourSerializer(serializers.Serializer):
     produit_plus_vendu = serializers.CharField()
 
 class ProduitAlerteSerializer(serializers.ModelSerializer):
-    niveau_alerte = serializers.SerializerMethodField()
+    # Annoté en SQL par stock.produits_en_alerte (règle unique des alertes)
+    niveau_alerte = serializers.CharField(read_only=True)
 
     class Meta:
         model = ProduitPharmacie
         fields = ['id', 'nom_medicament', 'quantite', 'alerte_quantite', 'niveau_alerte']
 
-    def get_niveau_alerte(self, obj):
-        if obj.quantite <= obj.alerte_quantite:
-            return 'danger'
-        elif obj.quantite <= obj.alerte_quantite + 5:
-            return 'warning'
-        return None
-
 # monapp/serializers.py
 
 from rest_framework import serializers
 from .models import Requisition, ProduitFabricant
 
-class RequisitionSerializer(serializers.ModelSerializer):
+class RequisitionSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     nom_produit = serializers.SerializerMethodField()
     fabricant_nom = serializers.SerializerMethodField()
     prix_achat = serializers.SerializerMethodField()
@@ -1,73 +1,60 @@
 # medicamentsn/signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import ProduitFabricant, ProduitPharmacie
-from decimal import Decimal, InvalidOperation
+from .models import ProduitFabricant, TauxChange, TacheRecalcul, VenteProduit, VenteLigne, Client
+from .taux import invalider_taux_actuel
+from .statistiques import cumuler_ventes
+from .synchronisation import en_suppression_synchro
 
-@receiver(post_save, sender=ProduitFabricant)
-def update_produits_pharmacie(sender, instance, **kwargs):
-    try:
-        nb_plaquettes = instance.nombre_plaquettes_par_boite
-        prix_boite_cdf = instance.prix_achat_cdf()
-
-        if nb_plaquettes and nb_plaquettes > 0:
-            prix_par_plaquette = Decimal(prix_boite_cdf) / Decimal(nb_plaquettes)
-
-            produits_pharmacies = ProduitPharmacie.objects.filter(produit_fabricant=instance)
-
-            for produit in produits_pharmacies:
-                produit.prix_achat = prix_par_plaquette.quantize(Decimal('0.01'))
 
-                if produit.marge_beneficiaire is not None:
-                    produit.prix_vente = (
-                        produit.prix_achat + (produit.prix_achat * produit.marge_beneficiaire / 100)
-                    ).quantize(Decimal('0.01'))
-
-                produit.save()
-
-    except (InvalidOperation, ZeroDivisionError) as e:
-        print(f"Erreur lors de la mise à jour des produits pharmacie : {e}")
+# Le recalcul des prix est délégué au worker `manage.py traiter_taches_recalcul` :
+# ces signaux ne font qu'ajouter une tâche à la file. L'id de la tâche est
+# laissé sur l'instance (`instance.tache_recalcul`) pour que la vue puisse
+# le renvoyer au frontend.
 
+@receiver(post_save, sender=ProduitFabricant)
+def update_produits_pharmacie(sender, instance, created, raw=False, **kwargs):
+    # Un produit qui vient d'être créé n'est encore dans aucune pharmacie
+    if created or raw:
+        return
+    instance.tache_recalcul = TacheRecalcul.planifier('produit_fabricant', instance.id)
 
-# signals.py (crée ce fichier dans ton app si pas encore)
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import TauxChange, ProduitPharmacie, CommandeProduitLigne, LotProduitPharmacie
-from decimal import Decimal, ROUND_HALF_UP
 
 @receiver(post_save, sender=TauxChange)
-def update_prices_after_taux_change(sender, instance, **kwargs):
-    print("🔁 Mise à jour des prix suite à une modification du taux...")
-
-    taux = instance.taux
-
-    # Mettre à jour les Produits Pharmacie
-    for produit in ProduitPharmacie.objects.select_related('produit_fabricant').all():
-        if produit.produit_fabricant.devise == 'USD':
-            nb_plaquettes = produit.produit_fabricant.nombre_plaquettes_par_boite or 1
-            prix_usd = produit.produit_fabricant.prix_achat
-            prix_cdf = Decimal(prix_usd) * taux
-            prix_plaquette = prix_cdf / Decimal(nb_plaquettes)
-            produit.prix_achat = prix_plaquette.quantize(Decimal('0.01'))
-
-            if produit.marge_beneficiaire is not None:
-                produit.prix_vente = (
-                    produit.prix_achat + (produit.prix_achat * produit.marge_beneficiaire / 100)
-                ).quantize(Decimal('0.01'))
+def update_prices_after_taux_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance.tache_recalcul = TacheRecalcul.planifier('taux_change', instance.id)
 
-            produit.save()
 
-    # Mettre à jour les lignes de commande
-    for ligne in CommandeProduitLigne.objects.select_related('produit_fabricant').all():
-        if ligne.produit_fabricant.devise == 'USD':
-            prix_usd = ligne.produit_fabricant.prix_achat
-            ligne.prix_achat = (Decimal(prix_usd) * taux).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            ligne.save()
-
-    # Mettre à jour les lots (facultatif si prix viennent de ProduitPharmacie)
-    for lot in LotProduitPharmacie.objects.select_related('produit').all():
-        lot.prix_achat = lot.produit.prix_achat
-        lot.prix_vente = lot.produit.prix_vente
-        lot.save()
-
-    print("✅ Mise à jour des prix terminée.")
+@receiver(post_save, sender=TauxChange)
+@receiver(post_delete, sender=TauxChange)
+def invalider_cache_taux(sender, **kwargs):
+    invalider_taux_actuel()
+    # Une lecture faite avant le commit a pu remettre l'ancien taux en cache
+    transaction.on_commit(invalider_taux_actuel)
+
+
+@receiver(post_delete, sender=VenteProduit)
+def retirer_vente_des_stats_client(sender, instance, using='default', **kwargs):
+    # Supprimée par la synchro : le Client reçu de la source l'a déjà retirée
+    if en_suppression_synchro():
+        return
+    if instance.client_id:
+        Client.annuler_vente(instance, using=using)
+
+
+@receiver(pre_delete, sender=VenteProduit)
+def retirer_vente_du_cumul_journalier(sender, instance, using='default', **kwargs):
+    # Supprimée par la synchro : les jours touchés sont reconstruits ensuite
+    if en_suppression_synchro():
+        return
+    # `using` : la synchro supprime aussi des ventes dans la base distante
+    lignes = VenteLigne.objects.using(using).filter(vente=instance).values_list(
+        'produit_id', 'quantite', 'total', 'prix_unitaire', 'cout_unitaire'
+    )
+    cumuler_ventes(instance.pharmacie_id, instance.date_vente, [
+        (produit_id, quantite, total, (prix_unitaire - (cout_unitaire or 0)) * quantite)
+        for produit_id, quantite, total, prix_unitaire, cout_unitaire in lignes
+    ], signe=-1, using=using)
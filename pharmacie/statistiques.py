@@ -0,0 +1,226 @@
+# pharmacie/statistiques.py
+"""
+Alimentation et lecture de la table VenteJournaliere.
+
+Les tableaux de bord (statistiques_du_jour, rapport_general) lisent le
+cumul par jour au lieu de réagréger toutes les lignes de vente : le coût
+d'une requête dépend du nombre de jours de la période, pas du nombre de
+ventes.
+
+Les ventes écrites par la synchronisation (bulk_create, sans passer par
+VenteProduitSerializer) ne sont pas cumulées au fil de l'eau : les scripts
+de synchro et l'import de paquet appellent jours_touches() puis
+reconstruire_jours() sur la base cible.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import VenteJournaliere, VenteLigne, VenteProduit
+from .utils import intervalle_jours
+
+# Tables dont les changements modifient les cumuls (voir jours_touches)
+TABLES_VENTES = (VenteProduit._meta.db_table, VenteLigne._meta.db_table)
+
+
+def cumuler_ventes(pharmacie_id, date_vente, lignes, signe=1, using='default'):
+    """
+    Ajoute (signe=1) ou retire (signe=-1) des lignes de vente du cumul du jour
+    dans la base `using`.
+
+    `lignes` : itérable de (produit_id, quantite, chiffre_affaire, benefice).
+    À appeler dans la transaction de la vente : les ProduitPharmacie vendus y
+    sont déjà verrouillés, ce qui protège la création des lignes de cumul.
+    """
+    jour = timezone.localdate(date_vente)
+
+    cumuls = defaultdict(lambda: [0, Decimal('0'), Decimal('0'), 0])
+    for produit_id, quantite, chiffre_affaire, benefice in lignes:
+        cumul = cumuls[produit_id]
+        cumul[0] += quantite
+        cumul[1] += chiffre_affaire
+        cumul[2] += benefice
+        cumul[3] += 1
+
+    if not cumuls:
+        return
+
+    existants = {
+        ligne.produit_id: ligne
+        for ligne in VenteJournaliere.objects.using(using).select_for_update().filter(
+            pharmacie_id=pharmacie_id, jour=jour, produit_id__in=list(cumuls)
+        )
+    }
+
+    maintenant = timezone.now()
+    a_modifier = []
+    a_creer = []
+
+    for produit_id, (quantite, chiffre_affaire, benefice, nombre) in cumuls.items():
+        ligne = existants.get(produit_id)
+        if ligne is None:
+            if signe < 0:
+                continue
+            a_creer.append(VenteJournaliere(
+                pharmacie_id=pharmacie_id,
+                jour=jour,
+                produit_id=produit_id,
+                quantite=quantite,
+                chiffre_affaire=chiffre_affaire,
+                benefice=benefice,
+                nombre_lignes=nombre,
+            ))
+            continue
+
+        ligne.quantite += signe * quantite
+        ligne.chiffre_affaire += signe * chiffre_affaire
+        ligne.benefice += signe * benefice
+        ligne.nombre_lignes += signe * nombre
+        ligne.updated_at = maintenant
+        a_modifier.append(ligne)
+
+    if a_modifier:
+        VenteJournaliere.objects.using(using).bulk_update(
+            a_modifier, ['quantite', 'chiffre_affaire', 'benefice', 'nombre_lignes', 'updated_at']
+        )
+    if a_creer:
+        VenteJournaliere.objects.using(using).bulk_create(a_creer)
+
+
+def recalculer_cumuls(lignes, cumuls, jours=None, taille_lot=1000):
+    """
+    Remplace les cumuls `cumuls` (queryset de VenteJournaliere) par l'agrégat
+    des lignes de vente `lignes`, en une requête groupée, dans la base de
+    `cumuls`. `jours` limite aux jours donnés. Retourne (supprimés, créés).
+    """
+    using = cumuls.db
+
+    # cout_unitaire est figé à la vente ; le prix d'achat courant ne sert
+    # que pour d'éventuelles lignes importées sans coût
+    benefice = ExpressionWrapper(
+        (F('prix_unitaire') - Coalesce('cout_unitaire', 'produit__prix_achat')) * F('quantite'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    lignes = lignes.annotate(jour=TruncDate('vente__date_vente'))
+    if jours is not None:
+        lignes = lignes.filter(jour__in=jours)
+        cumuls = cumuls.filter(jour__in=jours)
+    groupes = (
+        lignes
+        .values('vente__pharmacie_id', 'jour', 'produit_id')
+        .annotate(
+            qte=Sum('quantite'),
+            ca=Sum('total'),
+            benef=Sum(benefice),
+            nombre=Count('id'),
+        )
+        .order_by()
+    )
+
+    total = 0
+    with transaction.atomic(using=using):
+        supprimes, _ = cumuls.delete()
+        a_creer = []
+        for groupe in groupes.using(using).iterator(chunk_size=taille_lot):
+            a_creer.append(VenteJournaliere(
+                pharmacie_id=groupe['vente__pharmacie_id'],
+                jour=groupe['jour'],
+                produit_id=groupe['produit_id'],
+                quantite=groupe['qte'],
+                chiffre_affaire=groupe['ca'],
+                benefice=groupe['benef'] or 0,
+                nombre_lignes=groupe['nombre'],
+            ))
+            if len(a_creer) >= taille_lot:
+                VenteJournaliere.objects.using(using).bulk_create(a_creer)
+                total += len(a_creer)
+                a_creer = []
+        if a_creer:
+            VenteJournaliere.objects.using(using).bulk_create(a_creer)
+            total += len(a_creer)
+
+    return supprimes, total
+
+
+def jours_touches(using, changements):
+    """
+    (pharmacie_id, jour) des ventes de `changements` (format de
+    synchronisation.lire_journal) présentes dans `using`, directement ou via
+    leurs lignes. À appeler avant la synchro (anciennes dates, ventes qui vont
+    être supprimées) puis après (nouvelles ventes).
+    """
+    from .synchronisation import par_paquets
+
+    def ids(modele):
+        table = changements.get(modele._meta.db_table, {})
+        return table.get('upsert', set()) | table.get('delete', set())
+
+    dates = []
+    for paquet in par_paquets(ids(VenteProduit)):
+        dates.extend(VenteProduit.objects.using(using).filter(pk__in=paquet).values_list('pharmacie_id', 'date_vente'))
+    for paquet in par_paquets(ids(VenteLigne)):
+        dates.extend(
+            VenteLigne.objects.using(using).filter(pk__in=paquet)
+            .values_list('vente__pharmacie_id', 'vente__date_vente')
+        )
+    return {(pharmacie_id, timezone.localdate(date_vente)) for pharmacie_id, date_vente in dates}
+
+
+def reconstruire_jours(using, jours):
+    """Recalcule dans `using` les cumuls des (pharmacie_id, jour) donnés."""
+    par_pharmacie = defaultdict(set)
+    for pharmacie_id, jour in jours:
+        par_pharmacie[pharmacie_id].add(jour)
+
+    for pharmacie_id, dates in par_pharmacie.items():
+        debut, fin = intervalle_jours(min(dates), max(dates))
+        lignes = VenteLigne.objects.using(using).filter(
+            vente__pharmacie_id=pharmacie_id, vente__date_vente__gte=debut, vente__date_vente__lt=fin,
+        )
+        cumuls = VenteJournaliere.objects.using(using).filter(pharmacie_id=pharmacie_id)
+        recalculer_cumuls(lignes, cumuls, jours=dates)
+
+
+def reconstruire_pharmacie(using, pharmacie=None):
+    """Recalcule dans `using` tous les cumuls de `pharmacie` (toutes si None) : première synchro."""
+    lignes = VenteLigne.objects.using(using)
+    cumuls = VenteJournaliere.objects.using(using)
+    if pharmacie is not None:
+        lignes = lignes.filter(vente__pharmacie=pharmacie)
+        cumuls = cumuls.filter(pharmacie=pharmacie)
+    return recalculer_cumuls(lignes, cumuls)
+
+
+def resume_ventes(pharmacie, date_debut, date_fin):
+    """Chiffre d'affaires, bénéfice et produit le plus vendu entre deux jours inclus."""
+    cumuls = VenteJournaliere.objects.filter(
+        pharmacie=pharmacie,
+        jour__gte=date_debut,
+        jour__lte=date_fin,
+    )
+
+    totaux = cumuls.aggregate(chiffre_affaire=Sum('chiffre_affaire'), benefice=Sum('benefice'))
+
+    # VenteProduit.montant_total est la somme des VenteLigne.total de la vente
+    # (VenteProduitSerializer.create) : le montant encaissé du jour est donc
+    # déjà dans le cumul, inutile de relire les ventes de la période
+    total_ventes = totaux['chiffre_affaire'] or 0
+
+    produit_plus_vendu = (
+        cumuls.values('produit__nom_medicament')
+        .annotate(qte=Sum('quantite'))
+        .filter(qte__gt=0)
+        .order_by('-qte')
+        .first()
+    )
+
+    return {
+        "chiffre_affaire": totaux['chiffre_affaire'] or 0,
+        "benefice": totaux['benefice'] or 0,
+        "total_ventes": total_ventes,
+        "produit_plus_vendu": produit_plus_vendu['produit__nom_medicament'] if produit_plus_vendu else "Aucun",
+    }
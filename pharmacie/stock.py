@@ -0,0 +1,139 @@
+# pharmacie/stock.py
+"""
+Sortie de stock d'un panier de vente, et niveaux d'alerte de stock.
+
+Les ProduitPharmacie puis leurs lots sont verrouillés (select_for_update)
+toujours dans le même ordre, ce qui sérialise deux caisses qui vendent le
+même produit sans risque d'interblocage. Les décréments sont écrits en
+bulk_update : le nombre de requêtes ne dépend pas de la taille du panier.
+À appeler dans une transaction.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import ProduitPharmacie, LotProduitPharmacie
+
+
+class StockInsuffisant(Exception):
+    def __init__(self, produit, demande):
+        self.produit = produit
+        self.demande = demande
+        super().__init__(
+            f"Stock insuffisant pour {produit.nom_medicament}. "
+            f"Stock: {produit.quantite}, Demande: {demande}"
+        )
+
+
+def sortir_stock(quantites):
+    """
+    `quantites` : {produit_id: quantité à sortir}.
+
+    Retourne (produits, consommations) :
+      - produits : {produit_id: ProduitPharmacie verrouillé, stock déjà décrémenté}
+      - consommations : {produit_id: [(lot, quantité prise), ...]} dans l'ordre FIFO
+    Lève StockInsuffisant sans rien modifier si un produit manque de stock.
+    """
+    maintenant = timezone.now()
+    ids = list(quantites)
+
+    produits = {
+        produit.id: produit
+        for produit in ProduitPharmacie.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+    }
+
+    for produit_id, quantite in quantites.items():
+        produit = produits[produit_id]
+        if produit.quantite < quantite:
+            raise StockInsuffisant(produit, quantite)
+
+    lots = (
+        LotProduitPharmacie.objects
+        .select_for_update()
+        .filter(produit_id__in=ids, quantite__gt=0)
+        .order_by('produit_id', 'date_entree', 'date_peremption', 'pk')
+    )
+
+    restant = dict(quantites)
+    consommations = defaultdict(list)
+    lots_modifies = []
+
+    for lot in lots:
+        reste = restant[lot.produit_id]
+        if reste <= 0:
+            continue
+        pris = min(lot.quantite, reste)
+        lot.quantite -= pris
+        lot.updated_at = maintenant
+        restant[lot.produit_id] = reste - pris
+        consommations[lot.produit_id].append((lot, pris))
+        lots_modifies.append(lot)
+
+    for produit_id, quantite in quantites.items():
+        produit = produits[produit_id]
+        produit.quantite -= quantite
+        produit.updated_at = maintenant
+
+    ProduitPharmacie.objects.bulk_update(list(produits.values()), ['quantite', 'updated_at'])
+    if lots_modifies:
+        LotProduitPharmacie.objects.bulk_update(lots_modifies, ['quantite', 'updated_at'])
+
+    return produits, consommations
+
+
+def cout_unitaire_moyen(produit, consommations, quantite):
+    """
+    Coût d'achat moyen d'une sortie de `quantite` unités de `produit`, pondéré
+    par les lots consommés. La part non couverte par des lots (stock sans lot)
+    est valorisée au prix d'achat courant du produit.
+    """
+    if not quantite:
+        return produit.prix_achat
+
+    cout_total = Decimal('0')
+    couvert = 0
+    for lot, pris in consommations:
+        prix = lot.prix_achat if lot.prix_achat is not None else produit.prix_achat
+        cout_total += prix * pris
+        couvert += pris
+
+    cout_total += produit.prix_achat * (quantite - couvert)
+    return (cout_total / quantite).quantize(Decimal('0.01'))
+
+
+# Règle unique des alertes de stock : un produit est en alerte quand sa
+# quantité atteint son seuil, en danger à la moitié du seuil ou moins.
+EN_ALERTE = Q(quantite__lte=F('alerte_quantite'))
+EN_DANGER = Q(quantite__lte=F('alerte_quantite') / 2.0)
+
+
+def produits_en_alerte(pharmacie):
+    """
+    Produits en alerte de `pharmacie`, annotés de `niveau_alerte`
+    ('danger' / 'warning'), les plus urgents d'abord. Utilise l'index
+    partiel produit_alerte_idx.
+    """
+    return (
+        ProduitPharmacie.objects
+        .filter(EN_ALERTE, pharmacie=pharmacie)
+        .annotate(
+            niveau_alerte=Case(
+                When(EN_DANGER, then=Value('danger')),
+                default=Value('warning'), output_field=CharField(),
+            ),
+            rang_alerte=Case(When(EN_DANGER, then=Value(0)), default=Value(1), output_field=IntegerField()),
+        )
+        .order_by('rang_alerte', 'quantite', 'nom_medicament', 'id')
+    )
+
+
+def compter_alertes(pharmacie):
+    """{'total', 'danger', 'warning'} en une requête (badge du tableau de bord)."""
+    compte = ProduitPharmacie.objects.filter(EN_ALERTE, pharmacie=pharmacie).aggregate(
+        total=Count('id'),
+        danger=Count('id', filter=EN_DANGER),
+    )
+    compte['warning'] = compte['total'] - compte['danger']
+    return compte
@@ -0,0 +1,490 @@
+# pharmacie/synchronisation.py
+"""
+Outils communs aux scripts de synchronisation local ⇄ Render
+(hopitalsage_front/sync_*.py).
+
+Les changements à transférer sont lus dans JournalModification au lieu de
+comparer des updated_at : le curseur est un txid PostgreSQL (pas une heure
+locale), il n'y a pas de balayage complet des tables, et les suppressions
+sont transmises.
+
+Chaque script acquitte son curseur dans la base qu'il lit (CurseurJournal) ;
+la commande purger_journal supprime le journal sous le plus petit curseur
+acquitté.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+
+from django.apps import apps
+from django.db import connections, transaction, IntegrityError
+from django.db.models import Q, UniqueConstraint
+from django.utils import timezone
+
+from .models import JournalModification, CurseurJournal
+
+# Modèles échangés entre une pharmacie et Render, parents avant enfants
+MODELES_GLOBAUX = [
+    'pharmacie.TauxChange',
+    'pharmacie.Fabricant',
+    'pharmacie.ProduitFabricant',
+    'comptes.Pharmacie',
+    'comptes.User',
+    'pharmacie.PublicitePharmacie',
+]
+
+MODELES_PAR_PHARMACIE = [
+    'pharmacie.ProduitPharmacie',
+    'pharmacie.LotProduitPharmacie',
+    'pharmacie.CommandeProduit',
+    'pharmacie.CommandeProduitLigne',
+    'pharmacie.ReceptionProduit',
+    'pharmacie.ReceptionLigne',
+    'pharmacie.Client',
+    'pharmacie.VenteProduit',
+    'pharmacie.VenteLigne',
+    'pharmacie.ClientPurchase',
+    'pharmacie.MedicalExam',
+    'pharmacie.Prescription',
+    'pharmacie.RendezVous',
+    'pharmacie.Requisition',
+    'pharmacie.Depense',
+]
+
+# Chemin vers la pharmacie propriétaire d'une ligne, par modèle
+PHARMACIE_LOOKUP_BY_MODEL = {
+    'ProduitPharmacie': 'pharmacie',
+    'LotProduitPharmacie': 'produit__pharmacie',
+    'CommandeProduit': 'pharmacie',
+    'CommandeProduitLigne': 'commande__pharmacie',
+    'ReceptionProduit': 'commande__pharmacie',
+    'ReceptionLigne': 'reception__commande__pharmacie',
+    'Client': 'pharmacie',
+    'VenteProduit': 'pharmacie',
+    'VenteLigne': 'vente__pharmacie',
+    'ClientPurchase': 'client__pharmacie',
+    'MedicalExam': 'client__pharmacie',
+    'Prescription': 'client__pharmacie',
+    'RendezVous': 'pharmacie',
+    'Requisition': 'pharmacie',
+    'Depense': 'pharmacie',
+}
+
+
+def modeles_synchronises():
+    """(modèles globaux, modèles par pharmacie) en classes, parents avant enfants."""
+    return (
+        [apps.get_model(label) for label in MODELES_GLOBAUX],
+        [apps.get_model(label) for label in MODELES_PAR_PHARMACIE],
+    )
+
+
+def filigrane(using):
+    """
+    Curseur sûr pour la base `using` : toutes les transactions dont le txid
+    est inférieur sont terminées, leurs lignes de journal sont donc visibles
+    et aucune ne pourra plus apparaître en dessous.
+    """
+    connexion = connections[using]
+    if connexion.vendor == 'postgresql':
+        with connexion.cursor() as cursor:
+            cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+            return cursor.fetchone()[0]
+
+    # Hors PostgreSQL (développement, tests) : pas de transactions concurrentes
+    dernier = (
+        JournalModification.objects.using(using)
+        .order_by('-txid').values_list('txid', flat=True).first()
+    )
+    return (dernier or 0) + 1
+
+
+class JournalPurge(Exception):
+    """Le curseur demandé est sous la limite de la dernière purge du journal."""
+
+    def __init__(self, depuis, limite):
+        self.depuis = depuis
+        self.limite = limite
+        super().__init__(
+            f"Journal purgé jusqu'au txid {limite} : le curseur {depuis} n'est plus "
+            f"lisible, une copie complète est nécessaire."
+        )
+
+
+def limite_purge(using):
+    """Plus petit curseur encore lisible dans le journal de `using` (0 si jamais purgé)."""
+    return (
+        CurseurJournal.objects.using(using)
+        .filter(consommateur=CurseurJournal.PURGE)
+        .values_list('txid', flat=True).first()
+    ) or 0
+
+
+def acquitter(using, consommateur, curseur):
+    """
+    Enregistre dans `using` que `consommateur` a appliqué le journal de cette
+    base jusqu'à `curseur` (exclu). À appeler après avoir sauvé le curseur.
+    """
+    CurseurJournal.objects.using(using).update_or_create(
+        consommateur=consommateur, defaults={'txid': curseur},
+    )
+
+
+def purger_journal(using, conserver=timedelta(days=7), oublier=timedelta(days=30), dry_run=False, taille_lot=10000):
+    """
+    Supprime les lignes du journal de `using` sous le plus petit curseur
+    acquitté. Les lignes de moins de `conserver` sont gardées quoi qu'il
+    arrive (caisses qui n'acquittent pas leur version de catalogue, paquets
+    exportés pas encore importés) ; un consommateur muet depuis `oublier`
+    ne bloque plus la purge et repartira d'une copie complète.
+
+    Retourne (limite, nombre de lignes supprimées).
+    """
+    maintenant = timezone.now()
+    journal = JournalModification.objects.using(using)
+
+    candidats = [filigrane(using)]
+    candidats += (
+        CurseurJournal.objects.using(using)
+        .exclude(consommateur=CurseurJournal.PURGE)
+        .filter(updated_at__gte=maintenant - oublier)
+        .values_list('txid', flat=True)
+    )
+    recent = journal.filter(date__gte=maintenant - conserver).order_by('txid').values_list('txid', flat=True).first()
+    if recent is not None:
+        candidats.append(recent)
+    limite = min(candidats)
+
+    if limite <= limite_purge(using):
+        return limite_purge(using), 0
+    if dry_run:
+        return limite, journal.filter(txid__lt=limite).count()
+
+    # La limite est posée avant la suppression : un lecteur concurrent sous la
+    # limite reçoit JournalPurge plutôt qu'un journal à trous
+    CurseurJournal.objects.using(using).update_or_create(
+        consommateur=CurseurJournal.PURGE, defaults={'txid': limite},
+    )
+    supprimes = 0
+    while True:
+        seqs = list(journal.filter(txid__lt=limite).values_list('seq', flat=True)[:taille_lot])
+        if not seqs:
+            break
+        supprimes += JournalModification.objects.using(using).filter(seq__in=seqs).delete()[0]
+    return limite, supprimes
+
+
+def lire_journal(using, depuis, tables=None, synchro=False, pharmacie=None):
+    """
+    Changements validés dans `using` depuis le curseur `depuis`.
+
+    Retourne (changements, nouveau_curseur) où changements vaut
+    {table: {'upsert': {ids}, 'delete': {ids}}} : seul l'état final de chaque
+    objet compte (créé puis supprimé => suppression).
+
+    `tables` limite la lecture à ces tables ; `synchro=True` inclut aussi les
+    écritures de la synchronisation (exclues par défaut, voir sans_journal) ;
+    `pharmacie` ne garde, pour les tables de MODELES_PAR_PHARMACIE, que les
+    lignes de cette pharmacie (les tables globales restent lues en entier).
+
+    Lève JournalPurge si `depuis` est sous la limite de la dernière purge.
+    """
+    limite = limite_purge(using)
+    if depuis < limite:
+        raise JournalPurge(depuis, limite)
+    jusqua = filigrane(using)
+    entrees = JournalModification.objects.using(using).filter(txid__gte=depuis, txid__lt=jusqua)
+    if tables is not None:
+        entrees = entrees.filter(table__in=tables)
+    if not synchro:
+        entrees = entrees.filter(synchro=False)
+    if pharmacie is not None:
+        tables_pharmacie = [apps.get_model(label)._meta.db_table for label in MODELES_PAR_PHARMACIE]
+        entrees = entrees.filter(
+            ~Q(table__in=tables_pharmacie) | Q(pharmacie_id=getattr(pharmacie, 'pk', pharmacie))
+        )
+    entrees = entrees.order_by('seq').values_list('table', 'objet_id', 'operation')
+
+    changements = defaultdict(lambda: {'upsert': set(), 'delete': set()})
+    for table, objet_id, operation in entrees.iterator(chunk_size=5000):
+        table_changements = changements[table]
+        if operation == 'D':
+            table_changements['upsert'].discard(objet_id)
+            table_changements['delete'].add(objet_id)
+        else:
+            table_changements['delete'].discard(objet_id)
+            table_changements['upsert'].add(objet_id)
+
+    return dict(changements), jusqua
+
+
+def sans_journal(using):
+    """
+    À appeler dans une transaction : les écritures suivantes de la
+    synchronisation sont journalisées avec synchro = true et ignorées par
+    lire_journal (sinon elles repartiraient vers la base d'origine au
+    prochain passage).
+    """
+    connexion = connections[using]
+    if connexion.vendor == 'postgresql':
+        with connexion.cursor() as cursor:
+            cursor.execute("SELECT set_config('pharmacie.synchronisation', 'on', true)")
+
+
+_synchro = threading.local()
+
+
+@contextmanager
+def suppressions_synchro():
+    """
+    Suppressions faites par la synchronisation (ou un paquet) dans ce
+    thread : les signaux post_delete qui tiennent des compteurs à jour
+    (Client.total_depense, VenteJournaliere) ne s'appliquent pas. Les
+    compteurs de la source arrivent avec les lignes synchronisées, et les
+    cumuls journaliers sont reconstruits après coup (reconstruire_jours) ;
+    les décrémenter ici les compterait deux fois.
+    """
+    _synchro.niveau = getattr(_synchro, 'niveau', 0) + 1
+    try:
+        yield
+    finally:
+        _synchro.niveau -= 1
+
+
+def en_suppression_synchro():
+    return getattr(_synchro, 'niveau', 0) > 0
+
+
+def par_paquets(valeurs, taille=500):
+    """Découpe un itérable (même un générateur) en listes de `taille` éléments."""
+    iterateur = iter(valeurs)
+    while True:
+        paquet = list(islice(iterateur, taille))
+        if not paquet:
+            return
+        yield paquet
+
+
+def groupes_uniques(model):
+    """
+    Colonnes (attname) de chaque contrainte d'unicité du modèle, hors clé
+    primaire : champs unique=True, UniqueConstraint sans condition et
+    unique_together.
+    """
+    groupes = [(f.attname,) for f in model._meta.fields if f.unique and not f.primary_key]
+    ensembles = [c.fields for c in model._meta.constraints
+                 if isinstance(c, UniqueConstraint) and c.fields and c.condition is None]
+    ensembles += list(model._meta.unique_together)
+    for champs in ensembles:
+        groupes.append(tuple(model._meta.get_field(nom).attname for nom in champs))
+    return groupes
+
+
+def conflits_uniques(model, using, objets, taille=500):
+    """
+    pk des `objets` dont la valeur d'une contrainte d'unicité est déjà prise
+    dans `using` par une autre ligne, ou par un autre objet du même lot.
+
+    Seules les valeurs candidates du lot sont recherchées (requêtes __in par
+    paquets) : le coût dépend de la taille du lot, pas de celle de la table.
+    """
+    conflits = set()
+    for colonnes in groupes_uniques(model):
+        candidats = {}
+        for obj in objets:
+            valeur = tuple(getattr(obj, colonne) for colonne in colonnes)
+            if None in valeur:
+                continue  # NULL n'entre pas en conflit
+            if valeur in candidats and candidats[valeur] != obj.pk:
+                conflits.add(obj.pk)
+            else:
+                candidats[valeur] = obj.pk
+
+        for paquet in par_paquets(candidats, taille):
+            if len(colonnes) == 1:
+                filtre = Q(**{f'{colonnes[0]}__in': [valeur[0] for valeur in paquet]})
+            else:
+                filtre = Q()
+                for valeur in paquet:
+                    filtre |= Q(**dict(zip(colonnes, valeur)))
+            existants = model.objects.using(using).filter(filtre).values_list('pk', *colonnes)
+            for pk, *valeur in existants:
+                proprietaire = candidats.get(tuple(valeur))
+                if proprietaire is not None and proprietaire != pk:
+                    conflits.add(proprietaire)
+    return conflits
+
+
+def dependances(modeles):
+    """{modèle: modèles de la liste vers lesquels il a une clé étrangère}."""
+    presents = set(modeles)
+    return {
+        modele: {
+            champ.related_model for champ in modele._meta.fields
+            if champ.is_relation and champ.many_to_one
+            and champ.related_model in presents and champ.related_model is not modele
+        }
+        for modele in modeles
+    }
+
+
+def executer_par_dependances(modeles, tache, max_workers=4):
+    """
+    Exécute `tache(modele)` pour chaque modèle sur un pool de threads, un
+    modèle ne démarrant qu'une fois tous ses parents (clés étrangères)
+    terminés. Chaque thread a sa propre connexion Django, fermée après
+    chaque tâche.
+
+    Retourne {modèle: résultat}. Si une tâche échoue, ses descendants ne
+    sont pas lancés, les branches indépendantes continuent, et la première
+    erreur est relevée à la fin.
+    """
+    attentes = dependances(modeles)
+    resultats = {}
+    erreurs = []
+    bloques = set()
+
+    def executer(modele):
+        try:
+            return tache(modele)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        en_cours = {}
+
+        def lancer_prets():
+            for modele in modeles:
+                if modele in resultats or modele in bloques or modele in en_cours.values():
+                    continue
+                if attentes[modele] & bloques:
+                    bloques.add(modele)
+                elif attentes[modele] <= resultats.keys():
+                    en_cours[pool.submit(executer, modele)] = modele
+
+        lancer_prets()
+        while en_cours:
+            termines, _ = wait(en_cours, return_when=FIRST_COMPLETED)
+            for future in termines:
+                modele = en_cours.pop(future)
+                try:
+                    resultats[modele] = future.result()
+                except Exception as e:
+                    erreurs.append(e)
+                    bloques.add(modele)
+            lancer_prets()
+
+    if erreurs:
+        raise erreurs[0]
+    if len(resultats) < len(modeles):
+        restants = ', '.join(m.__name__ for m in modeles if m not in resultats)
+        raise ValueError(f"Dépendances circulaires entre : {restants}")
+    return resultats
+
+
+@contextmanager
+def conserver_dates(model):
+    """
+    Désactive auto_now / auto_now_add pendant la copie : bulk_create appelle
+    pre_save et remplacerait date_vente, updated_at... par l'heure de la
+    synchro. Chaque modèle n'est traité que par un seul thread à la fois.
+    """
+    champs = [
+        (champ, champ.auto_now, champ.auto_now_add)
+        for champ in model._meta.concrete_fields
+        if getattr(champ, 'auto_now', False) or getattr(champ, 'auto_now_add', False)
+    ]
+    for champ, _, _ in champs:
+        champ.auto_now = champ.auto_now_add = False
+    try:
+        yield
+    finally:
+        for champ, auto_now, auto_now_add in champs:
+            champ.auto_now, champ.auto_now_add = auto_now, auto_now_add
+
+
+def upsert(model, using, objets, taille_lot=500):
+    """
+    Écrit `objets` dans `using` par paquets d'INSERT ... ON CONFLICT (id)
+    DO UPDATE (bulk_create update_conflicts) : un aller-retour par paquet.
+
+    Si un paquet viole une autre contrainte d'unicité, les lignes fautives
+    sont écartées (conflits_uniques) et le reste est réécrit.
+    Retourne (nombre de lignes écrites, pk écartés).
+    """
+    pk = model._meta.pk.name
+    champs = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+
+    def ecrire(paquet):
+        with transaction.atomic(using=using):
+            sans_journal(using)
+            model.objects.using(using).bulk_create(
+                paquet, update_conflicts=True, unique_fields=[pk], update_fields=champs,
+            )
+
+    ecrits = 0
+    ecartes = set()
+    with conserver_dates(model):
+        for paquet in par_paquets(objets, taille_lot):
+            try:
+                ecrire(paquet)
+            except IntegrityError:
+                conflits = conflits_uniques(model, using, paquet)
+                if not conflits:
+                    raise
+                ecartes |= conflits
+                paquet = [obj for obj in paquet if obj.pk not in conflits]
+                if paquet:
+                    ecrire(paquet)
+            ecrits += len(paquet)
+    return ecrits, ecartes
+
+
+class MesuresSync:
+    """
+    Compteurs d'un modèle pour le rapport de synchronisation : lignes lues,
+    créées, mises à jour, supprimées, inchangées, en conflit, plus la durée,
+    le nombre de requêtes et le volume SQL envoyé sur chaque base.
+    """
+    COMPTEURS = ('lus', 'crees', 'mis_a_jour', 'supprimes', 'inchanges', 'conflits')
+
+    def __init__(self, modele):
+        self.modele = modele.__name__
+        for compteur in self.COMPTEURS:
+            setattr(self, compteur, 0)
+        self.requetes = defaultdict(int)
+        self.octets_envoyes = defaultdict(int)
+        self.duree = 0.0
+
+    @contextmanager
+    def mesurer(self, *aliases):
+        """Compte les requêtes passées sur `aliases` par le thread courant."""
+        def compteur(alias):
+            def compter(execute, sql, params, many, context):
+                self.requetes[alias] += 1
+                self.octets_envoyes[alias] += len(sql) + len(repr(params))
+                return execute(sql, params, many, context)
+            return compter
+
+        debut = time.monotonic()
+        with ExitStack() as pile:
+            for alias in set(aliases):
+                pile.enter_context(connections[alias].execute_wrapper(compteur(alias)))
+            try:
+                yield self
+            finally:
+                self.duree += time.monotonic() - debut
+
+    def en_dict(self):
+        rapport = {'modele': self.modele}
+        rapport.update((compteur, getattr(self, compteur)) for compteur in self.COMPTEURS)
+        rapport.update({
+            'duree': round(self.duree, 3),
+            'requetes': dict(self.requetes),
+            'octets_envoyes': dict(self.octets_envoyes),
+        })
+        return rapport
@@ -0,0 +1,34 @@
+# pharmacie/taux.py
+"""
+Taux de change courant, mis en cache par processus.
+
+Tous les calculs de prix en CDF passent par `taux_actuel()` au lieu de
+faire `TauxChange.objects.latest('date')` à chaque appel. Le cache est
+vidé dès qu'un TauxChange est enregistré ou supprimé (voir signals.py) ;
+la durée de vie limite l'écart entre processus gunicorn.
+"""
+import time
+
+from django.conf import settings
+
+DUREE_CACHE = getattr(settings, 'TAUX_CHANGE_CACHE_SECONDES', 60)
+
+_cache = {'taux': None, 'expire': 0.0}
+
+
+def taux_actuel(cache=True):
+    """Retourne le dernier taux (Decimal) ou None si aucun taux n'est défini."""
+    maintenant = time.monotonic()
+    if cache and _cache['expire'] > maintenant:
+        return _cache['taux']
+
+    from .models import TauxChange
+
+    taux = TauxChange.objects.order_by('-date').values_list('taux', flat=True).first()
+    _cache['taux'] = taux
+    _cache['expire'] = maintenant + DUREE_CACHE
+    return taux
+
+
+def invalider_taux_actuel():
+    _cache['expire'] = 0.0
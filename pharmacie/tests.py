@@ -35,4 +35,1201 @@ class ReceptionTest(TestCase):
 
         # Vérifiez que l'état de la commande a été modifié
         commande = CommandeProduit.objects.get(id=self.commande.id)
-        self.assertEqual(commande.etat, "confirmee")
\ No newline at end of file
+        self.assertEqual(commande.etat, "confirmee")
+
+from decimal import Decimal
+from datetime import date, timedelta
+from io import StringIO
+from django.utils import timezone
+from django.core.management import call_command
+from .models import TauxChange, LotProduitPharmacie, TacheRecalcul
+
+
+def creer_pharmacie(nom="Pharmacie Test"):
+    return Pharmacie.objects.create(
+        nom_pharm=nom,
+        ville_pharm="Kinshasa",
+        commune_pharm="Gombe",
+        adresse_pharm="Avenue Test",
+        ni="NI-001",
+        telephone="0990000000",
+    )
+
+
+def creer_produit_pharmacie(pharmacie, produit_fabricant, code_barre, quantite=0):
+    return ProduitPharmacie.objects.create(
+        pharmacie=pharmacie,
+        produit_fabricant=produit_fabricant,
+        code_barre=code_barre,
+        nom_medicament=produit_fabricant.nom,
+        localisation="A0",
+        conditionnement="boîte",
+        date_peremption=date(2030, 1, 1),
+        categorie="Test",
+        alerte_quantite=5,
+        quantite=quantite,
+        prix_achat=0,
+        marge_beneficiaire=Decimal('50.00'),
+    )
+
+
+class RecalculPrixTauxTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.fabricant = Fabricant.objects.create(nom="Fabricant", pays_origine="Inde")
+        self.usd = ProduitFabricant.objects.create(
+            fabricant=self.fabricant, nom="Produit USD", prix_achat=Decimal('2'),
+            devise='USD', nombre_plaquettes_par_boite=4,
+        )
+        self.cdf = ProduitFabricant.objects.create(
+            fabricant=self.fabricant, nom="Produit CDF", prix_achat=Decimal('1000'),
+            devise='CDF', nombre_plaquettes_par_boite=10,
+        )
+        self.produit_usd = creer_produit_pharmacie(self.pharmacie, self.usd, "USD-1")
+        self.produit_cdf = creer_produit_pharmacie(self.pharmacie, self.cdf, "CDF-1")
+        self.lot_usd = LotProduitPharmacie.objects.create(
+            produit=self.produit_usd, quantite=10, date_peremption=date(2030, 1, 1)
+        )
+
+    def test_seules_les_lignes_usd_sont_recalculees(self):
+        cdf_avant = ProduitPharmacie.objects.get(pk=self.produit_cdf.pk).updated_at
+
+        TauxChange.objects.create(taux=Decimal('2800'))
+        call_command('traiter_taches_recalcul', '--une-fois', stdout=StringIO())
+
+        produit_usd = ProduitPharmacie.objects.get(pk=self.produit_usd.pk)
+        self.assertEqual(produit_usd.prix_achat, Decimal('1400.00'))
+        self.assertEqual(produit_usd.prix_vente, Decimal('2100.00'))
+
+        lot = LotProduitPharmacie.objects.get(pk=self.lot_usd.pk)
+        self.assertEqual(lot.prix_achat, Decimal('1400.00'))
+        self.assertEqual(lot.prix_vente, Decimal('2100.00'))
+
+        produit_cdf = ProduitPharmacie.objects.get(pk=self.produit_cdf.pk)
+        self.assertEqual(produit_cdf.prix_achat, Decimal('100.00'))
+        self.assertEqual(produit_cdf.updated_at, cdf_avant)
+
+    def test_resultat_compte_les_lignes_modifiees(self):
+        from .recalcul_prix import recalculer_prix_apres_taux
+
+        resultat = recalculer_prix_apres_taux(Decimal('3000'))
+        self.assertEqual(resultat['produits'], 1)
+        self.assertEqual(resultat['lots'], 1)
+
+        # Même taux : rien à réécrire
+        resultat = recalculer_prix_apres_taux(Decimal('3000'))
+        self.assertEqual(resultat['produits'], 0)
+        self.assertEqual(resultat['lots'], 0)
+        self.assertIn('duree', resultat)
+
+    def test_reprise_apres_echec_continue_au_paquet_suivant(self):
+        from .recalcul_prix import recalculer_prix_apres_taux
+
+        for i in range(2, 4):
+            creer_produit_pharmacie(self.pharmacie, self.usd, f"USD-{i}")
+        points = []
+
+        def progression(traites, total, reprise):
+            if reprise['paquets'] == 2:
+                raise RuntimeError("coupure")
+            points.append(reprise)
+
+        with self.assertRaises(RuntimeError):
+            recalculer_prix_apres_taux(Decimal('3200'), taille_lot=1, progression=progression)
+        # Seul le premier paquet est validé, le second est annulé avec son point de reprise
+        usd = ProduitPharmacie.objects.filter(produit_fabricant=self.usd)
+        self.assertEqual(usd.filter(prix_achat=Decimal('1600.00')).count(), 1)
+
+        resultat = recalculer_prix_apres_taux(Decimal('3200'), taille_lot=1, reprise=points[-1])
+        self.assertEqual(resultat['produits'], 2)
+        self.assertEqual(usd.filter(prix_achat=Decimal('1600.00')).count(), 3)
+
+
+class TacheRecalculTest(TestCase):
+    def setUp(self):
+        self.fabricant = Fabricant.objects.create(nom="Fabricant", pays_origine="Inde")
+        self.produit = ProduitFabricant.objects.create(
+            fabricant=self.fabricant, nom="Produit USD", prix_achat=Decimal('2'), devise='USD',
+        )
+
+    def test_enregistrer_un_taux_planifie_une_seule_tache(self):
+        premier = TauxChange.objects.create(taux=Decimal('2800'))
+        second = TauxChange.objects.create(taux=Decimal('2900'))
+
+        self.assertEqual(premier.tache_recalcul.id, second.tache_recalcul.id)
+        tache = TacheRecalcul.objects.get()
+        self.assertEqual(tache.statut, 'en_attente')
+        self.assertEqual(tache.cible_id, second.id)
+
+    def test_worker_termine_la_tache(self):
+        self.produit.prix_achat = Decimal('3')
+        self.produit.save()
+        tache = self.produit.tache_recalcul
+
+        call_command('traiter_taches_recalcul', '--une-fois', stdout=StringIO())
+
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'terminee')
+        self.assertEqual(tache.progression, 100)
+        self.assertEqual(tache.resultat['produits'], 0)
+
+    def test_worker_reprend_une_tache_abandonnee(self):
+        tache = TacheRecalcul.planifier('produit_fabricant', self.produit.id)
+        TacheRecalcul.objects.filter(pk=tache.pk).update(
+            statut='en_cours', updated_at=timezone.now() - timedelta(hours=1),
+        )
+
+        call_command('traiter_taches_recalcul', '--une-fois', stdout=StringIO())
+
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'terminee')
+
+    def test_relancer_une_tache_echouee(self):
+        tache = TacheRecalcul.planifier('produit_fabricant', self.produit.id)
+        TacheRecalcul.objects.filter(pk=tache.pk).update(
+            statut='echouee', erreur="Échec après 1 paquet(s) validé(s)",
+            resultat={'reprise': {'etape': 'produits', 'pk': None, 'traites': 0, 'paquets': 1}},
+        )
+        tache.refresh_from_db()
+
+        self.assertEqual(tache.relancer().pk, tache.pk)
+        self.assertEqual(tache.statut, 'en_attente')
+        self.assertEqual(tache.resultat['reprise']['paquets'], 1)
+
+        call_command('traiter_taches_recalcul', '--une-fois', stdout=StringIO())
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'terminee')
+
+    def test_tache_en_cours_ne_bloque_pas_la_planification(self):
+        tache = TacheRecalcul.planifier('produit_fabricant', self.produit.id)
+        TacheRecalcul.objects.filter(pk=tache.pk).update(statut='en_cours')
+
+        nouvelle = TacheRecalcul.planifier('produit_fabricant', self.produit.id)
+        self.assertNotEqual(nouvelle.pk, tache.pk)
+        self.assertEqual(TacheRecalcul.planifier('produit_fabricant', self.produit.id).pk, nouvelle.pk)
+
+
+class TauxActuelTest(TestCase):
+    def setUp(self):
+        from .taux import invalider_taux_actuel
+        invalider_taux_actuel()
+        self.fabricant = Fabricant.objects.create(nom="Fabricant", pays_origine="Inde")
+        self.produits = [
+            ProduitFabricant.objects.create(
+                fabricant=self.fabricant, nom=f"Produit {i}", prix_achat=Decimal('2'), devise='USD',
+            )
+            for i in range(5)
+        ]
+
+    def test_taux_lu_une_seule_fois_et_invalide_a_l_enregistrement(self):
+        TauxChange.objects.create(taux=Decimal('2000'))
+        self.assertEqual(self.produits[0].prix_achat_cdf(), Decimal('4000'))
+
+        with self.assertNumQueries(0):
+            for produit in self.produits:
+                self.assertEqual(produit.prix_achat_cdf(), Decimal('4000'))
+
+        taux = TauxChange.objects.get()
+        taux.taux = Decimal('2500')
+        taux.save()
+        self.assertEqual(self.produits[0].prix_achat_cdf(), Decimal('5000'))
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from comptes.models import User
+from .models import VenteProduit, VenteLigne, Client
+
+
+class VenteStockTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.user = User.objects.create_user("caissier", "secret", pharmacie=self.pharmacie)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+        fabricant = Fabricant.objects.create(nom="Fabricant", pays_origine="Inde")
+        self.produits = []
+        for i in range(6):
+            pf = ProduitFabricant.objects.create(
+                fabricant=fabricant, nom=f"Produit {i}", prix_achat=Decimal('100'),
+            )
+            produit = creer_produit_pharmacie(self.pharmacie, pf, f"CB-{i}", quantite=10)
+            LotProduitPharmacie.objects.create(produit=produit, quantite=4, date_peremption=date(2030, 1, 1))
+            LotProduitPharmacie.objects.create(produit=produit, quantite=6, date_peremption=date(2031, 1, 1))
+            self.produits.append(produit)
+
+    def vendre(self, lignes):
+        return self.api.post('/api/ventes/', {'lignes': lignes}, format='json')
+
+    def test_vente_decremente_produits_et_lots_fifo(self):
+        produit = self.produits[0]
+        reponse = self.vendre([
+            {'produit': str(produit.id), 'quantite': 3},
+            {'produit': str(produit.id), 'quantite': 2},
+        ])
+        self.assertEqual(reponse.status_code, 201, reponse.data)
+
+        produit.refresh_from_db()
+        self.assertEqual(produit.quantite, 5)
+        lots = list(produit.lots.order_by('date_peremption').values_list('quantite', flat=True))
+        self.assertEqual(lots, [0, 5])
+
+        vente = VenteProduit.objects.get()
+        self.assertEqual(vente.montant_total, Decimal('750.00'))
+        self.assertEqual(VenteLigne.objects.filter(vente=vente).count(), 2)
+
+    def test_stock_insuffisant_ne_modifie_rien(self):
+        reponse = self.vendre([
+            {'produit': str(self.produits[0].id), 'quantite': 2},
+            {'produit': str(self.produits[1].id), 'quantite': 11},
+        ])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(ProduitPharmacie.objects.get(pk=self.produits[0].pk).quantite, 10)
+        self.assertFalse(VenteProduit.objects.exists())
+
+    def test_nombre_de_requetes_independant_du_panier(self):
+        def compter(produits):
+            with CaptureQueriesContext(connection) as requetes:
+                reponse = self.vendre([{'produit': str(p.id), 'quantite': 1} for p in produits])
+            self.assertEqual(reponse.status_code, 201, reponse.data)
+            return len(requetes)
+
+        compter(self.produits)  # crée les cumuls du jour pour tous les produits
+        self.assertEqual(compter(self.produits[:2]), compter(self.produits))
+
+
+class StatsClientTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.user = User.objects.create_user("caissier", "secret", pharmacie=self.pharmacie)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.client_pharmacie = Client.objects.create(
+            pharmacie=self.pharmacie, nom_complet="Client Fidèle", telephone="0991112233"
+        )
+        pf = ProduitFabricant.objects.create(
+            fabricant=Fabricant.objects.create(nom="Fabricant", pays_origine="Inde"),
+            nom="Produit", prix_achat=Decimal('100'),
+        )
+        self.produit = creer_produit_pharmacie(self.pharmacie, pf, "CB-1", quantite=50)
+
+    def vendre(self, quantite):
+        reponse = self.api.post('/api/ventes/', {
+            'client': str(self.client_pharmacie.id),
+            'lignes': [{'produit': str(self.produit.id), 'quantite': quantite}],
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201, reponse.data)
+        return VenteProduit.objects.get(pk=reponse.data['id'])
+
+    def test_vente_puis_annulation(self):
+        premiere = self.vendre(2)
+        seconde = self.vendre(1)
+
+        self.client_pharmacie.refresh_from_db()
+        self.assertEqual(self.client_pharmacie.total_depense, Decimal('450.00'))
+        self.assertEqual(self.client_pharmacie.dernier_achat, seconde.date_vente)
+        # Les ventes ne donnent pas de points (seuls les ClientPurchase en donnent)
+        self.assertEqual(self.client_pharmacie.score_fidelite, 0)
+
+        seconde.delete()
+        self.client_pharmacie.refresh_from_db()
+        self.assertEqual(self.client_pharmacie.total_depense, Decimal('300.00'))
+        self.assertEqual(self.client_pharmacie.dernier_achat, premiere.date_vente)
+
+    def test_commande_de_reconstruction(self):
+        vente = self.vendre(3)
+        Client.objects.filter(pk=self.client_pharmacie.pk).update(
+            total_depense=0, score_fidelite=7, dernier_achat=None
+        )
+
+        call_command('recalculer_stats_clients', stdout=StringIO())
+
+        self.client_pharmacie.refresh_from_db()
+        self.assertEqual(self.client_pharmacie.total_depense, Decimal('450.00'))
+        self.assertEqual(self.client_pharmacie.score_fidelite, 7)  # inchangé
+        self.assertEqual(self.client_pharmacie.dernier_achat, vente.date_vente)
+
+
+from .models import VenteJournaliere
+
+
+class VenteJournaliereTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.user = User.objects.create_user("directeur", "secret", pharmacie=self.pharmacie, role='directeur')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        pf = ProduitFabricant.objects.create(
+            fabricant=Fabricant.objects.create(nom="Fabricant", pays_origine="Inde"),
+            nom="Paracétamol", prix_achat=Decimal('100'),
+        )
+        # prix_achat 100, marge 50 % => prix_vente 150
+        self.produit = creer_produit_pharmacie(self.pharmacie, pf, "CB-1", quantite=50)
+
+    def vendre(self, quantite):
+        reponse = self.api.post('/api/ventes/', {
+            'lignes': [{'produit': str(self.produit.id), 'quantite': quantite}],
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201, reponse.data)
+        return VenteProduit.objects.get(pk=reponse.data['id'])
+
+    def test_statistiques_servies_par_le_cumul(self):
+        self.vendre(2)
+        self.vendre(3)
+        self.assertEqual(VenteJournaliere.objects.count(), 1)
+
+        reponse = self.api.get('/api/statistiques-du-jour/')
+        self.assertEqual(reponse.data['chiffre_affaire'], Decimal('750.00'))
+        self.assertEqual(reponse.data['benefice'], Decimal('250.00'))
+        self.assertEqual(reponse.data['produit_plus_vendu'], "Paracétamol")
+        # Montant encaissé, lu sur le cumul
+        self.assertEqual(reponse.data['total_ventes'], Decimal('750.00'))
+
+        reponse = self.api.get('/api/rapport-general/', {'periode': 'mois'})
+        self.assertEqual(reponse.data['chiffre_affaire'], Decimal('750.00'))
+
+    def test_annulation_et_reconstruction(self):
+        self.vendre(2)
+        vente = self.vendre(3)
+        vente.delete()
+
+        cumul = VenteJournaliere.objects.get()
+        self.assertEqual(cumul.quantite, 2)
+        self.assertEqual(cumul.chiffre_affaire, Decimal('300.00'))
+
+        VenteJournaliere.objects.all().delete()
+        call_command('reconstruire_ventes_journalieres', stdout=StringIO())
+
+        cumul = VenteJournaliere.objects.get()
+        self.assertEqual(cumul.quantite, 2)
+        self.assertEqual(cumul.benefice, Decimal('100.00'))
+        self.assertEqual(cumul.nombre_lignes, 1)
+
+    def test_ventes_importees_recalculent_le_cumul(self):
+        self.vendre(2)
+        vente = self.vendre(3)
+        chemin = os.path.join(tempfile.mkdtemp(), 'paquet.tar')
+        self.addCleanup(shutil.rmtree, os.path.dirname(chemin))
+        call_command('exporter_paquet_sync', sortie=chemin, stdout=StringIO())
+
+        # Base qui reçoit les ventes par le paquet : ni ventes ni cumul
+        VenteProduit.objects.all().delete()
+        VenteJournaliere.objects.all().delete()
+        call_command('importer_paquet_sync', chemin, stdout=StringIO())
+        cumul = VenteJournaliere.objects.get()
+        self.assertEqual((cumul.quantite, cumul.nombre_lignes), (5, 2))
+
+        # Ligne supprimée à la source : le jour est recalculé sans elle
+        ligne = VenteLigne.objects.get(vente=vente)
+        JournalModification.objects.create(
+            table='pharmacie_venteligne', objet_id=ligne.pk, operation='D', txid=10 ** 6,
+            pharmacie_id=self.pharmacie.pk,
+        )
+        call_command('exporter_paquet_sync', sortie=chemin, depuis=10 ** 6, stdout=StringIO())
+        call_command('importer_paquet_sync', chemin, stdout=StringIO())
+        self.assertEqual(VenteJournaliere.objects.get().quantite, 2)
+
+    def test_benefice_fige_sur_le_cout_des_lots(self):
+        # 4 unités à 80 puis 6 à 120 (FIFO), le reste du stock sans lot à 100
+        LotProduitPharmacie.objects.create(
+            produit=self.produit, quantite=4, prix_achat=Decimal('80'), date_peremption=date(2030, 1, 1))
+        LotProduitPharmacie.objects.create(
+            produit=self.produit, quantite=6, prix_achat=Decimal('120'), date_peremption=date(2031, 1, 1))
+
+        vente = self.vendre(5)
+        ligne = VenteLigne.objects.get(vente=vente)
+        # (4 * 80 + 1 * 120) / 5
+        self.assertEqual(ligne.cout_unitaire, Decimal('88.00'))
+        self.assertEqual(VenteJournaliere.objects.get().benefice, Decimal('310.00'))
+
+        # Un changement de prix ultérieur ne réécrit pas le passé
+        ProduitPharmacie.objects.filter(pk=self.produit.pk).update(prix_achat=Decimal('140'))
+        VenteJournaliere.objects.all().delete()
+        call_command('reconstruire_ventes_journalieres', stdout=StringIO())
+        self.assertEqual(VenteJournaliere.objects.get().benefice, Decimal('310.00'))
+
+
+import base64
+from datetime import timedelta
+from django.utils import timezone
+
+
+class HistoriqueVentesTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.user = User.objects.create_user("caissier", "secret", pharmacie=self.pharmacie, role='comptable')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        pf = ProduitFabricant.objects.create(
+            fabricant=Fabricant.objects.create(nom="Fabricant", pays_origine="Inde"),
+            nom="Paracétamol", prix_achat=Decimal('100'),
+        )
+        produit = creer_produit_pharmacie(self.pharmacie, pf, "CB-1", quantite=10)
+        self.api.post('/api/ventes/', {
+            'lignes': [{'produit': str(produit.id), 'quantite': 1}],
+        }, format='json')
+
+    def test_filtre_par_jours_inclus(self):
+        aujourd_hui = timezone.localdate()
+        hier = aujourd_hui - timedelta(days=1)
+
+        reponse = self.api.get('/api/historique-ventes/', {
+            'date_debut': aujourd_hui.isoformat(), 'date_fin': aujourd_hui.isoformat(),
+        })
+        self.assertEqual(len(reponse.data['ventes']), 1)
+
+        reponse = self.api.get('/api/historique-ventes/', {'date_fin': hier.isoformat()})
+        self.assertEqual(len(reponse.data['ventes']), 0)
+
+        # Date invalide : ignorée
+        reponse = self.api.get('/api/historique-ventes/', {'date_debut': '2024-13-45'})
+        self.assertEqual(len(reponse.data['ventes']), 1)
+
+    def test_pagination_par_curseur(self):
+        produit = ProduitPharmacie.objects.get()
+        for _ in range(4):
+            self.api.post('/api/ventes/', {
+                'lignes': [{'produit': str(produit.id), 'quantite': 1}],
+            }, format='json')
+
+        vues = []
+        params = {'flux': 'ventes', 'page_size': 2}
+        while True:
+            reponse = self.api.get('/api/historique-ventes/', params)
+            self.assertNotIn('depenses', reponse.data)
+            vues += [v['id'] for v in reponse.data['ventes']]
+            if not reponse.data['suivant_ventes']:
+                break
+            params['curseur_ventes'] = reponse.data['suivant_ventes']
+
+        attendues = VenteProduit.objects.order_by('-date_vente', '-id').values_list('id', flat=True)
+        self.assertEqual(vues, [str(pk) for pk in attendues])
+
+        # Curseur altéré : 400 au lieu d'une erreur SQL
+        for brut in ('["abc", "x"]', '["2024-01-01T00:00:00+00:00", "x"]', '[1]', 'pas du json'):
+            curseur = base64.urlsafe_b64encode(brut.encode()).decode()
+            reponse = self.api.get('/api/historique-ventes/', {'flux': 'ventes', 'curseur_ventes': curseur})
+            self.assertEqual(reponse.status_code, 400)
+
+        reponse = self.api.get('/api/historique-ventes/')
+        self.assertEqual(reponse.data['totaux']['ventes'], Decimal('750.00'))
+
+    def test_nombre_de_requetes_constant(self):
+        def compter(page_size):
+            with CaptureQueriesContext(connection) as requetes:
+                self.api.get('/api/historique-ventes/', {'page_size': page_size})
+            return len(requetes)
+
+        produit = ProduitPharmacie.objects.get()
+        for _ in range(3):
+            self.api.post('/api/ventes/', {
+                'lignes': [{'produit': str(produit.id), 'quantite': 1}],
+            }, format='json')
+        self.assertEqual(compter(1), compter(10))
+
+
+import csv
+import json
+from .models import Depense
+
+
+class ExportHistoriqueTest(TestCase):
+    setUp = HistoriqueVentesTest.setUp
+
+    def contenu(self, reponse):
+        self.assertEqual(reponse.status_code, 200)
+        return b''.join(reponse.streaming_content).decode('utf-8-sig')
+
+    def test_export_csv_et_ndjson(self):
+        Depense.objects.create(pharmacie=self.pharmacie, categorie='transport', montant=Decimal('20'), cree_par=self.user)
+
+        lignes = list(csv.reader(self.contenu(self.api.get('/api/export/ventes/')).splitlines()))
+        self.assertEqual(lignes[0][:3], ['vente', 'date_vente', 'utilisateur'])
+        self.assertEqual(len(lignes), 2)
+        self.assertEqual(lignes[1][4], "Paracétamol")
+
+        texte = self.contenu(self.api.get('/api/export/depenses/', {'type': 'ndjson'}))
+        depenses = [json.loads(l) for l in texte.splitlines()]
+        self.assertEqual(depenses[0]['montant'], '20.00')
+        self.assertEqual(depenses[0]['utilisateur'], "caissier")
+
+    def test_filtres(self):
+        autre = User.objects.create_user("autre", "secret", pharmacie=self.pharmacie)
+        texte = self.contenu(self.api.get('/api/export/ventes/', {'type': 'ndjson', 'utilisateur': autre.id}))
+        self.assertEqual(texte, '')
+
+        reponse = self.api.get('/api/export/ventes/', {'date_debut': 'hier'})
+        self.assertEqual(reponse.status_code, 400)
+        reponse = self.api.get('/api/export/ventes/', {'type': 'xlsx'})
+        self.assertEqual(reponse.status_code, 400)
+        for flux in ('ventes', 'depenses'):
+            reponse = self.api.get(f'/api/export/{flux}/', {'utilisateur': 'abc'})
+            self.assertEqual(reponse.status_code, 400)
+
+
+import uuid
+from .models import JournalModification, CurseurJournal
+from .synchronisation import lire_journal, filigrane
+
+
+class JournalModificationTest(TestCase):
+    def journaliser(self, operation, objet_id, txid, table='pharmacie_venteproduit'):
+        JournalModification.objects.create(table=table, objet_id=objet_id, operation=operation, txid=txid)
+
+    def test_etat_final_par_objet(self):
+        cree, modifie, supprime = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        self.journaliser('I', cree, 10)
+        self.journaliser('I', supprime, 10)
+        self.journaliser('U', modifie, 11, table='pharmacie_client')
+        self.journaliser('D', supprime, 12)
+
+        changements, curseur = lire_journal('default', 0)
+        self.assertEqual(changements['pharmacie_venteproduit'], {'upsert': {cree}, 'delete': {supprime}})
+        self.assertEqual(changements['pharmacie_client']['upsert'], {modifie})
+        self.assertEqual(curseur, 13)
+
+    def test_curseur(self):
+        self.journaliser('I', uuid.uuid4(), 10)
+        _, curseur = lire_journal('default', 0)
+
+        changements, _ = lire_journal('default', curseur)
+        self.assertEqual(changements, {})
+
+        nouveau = uuid.uuid4()
+        self.journaliser('U', nouveau, curseur)
+        changements, _ = lire_journal('default', curseur)
+        self.assertEqual(changements['pharmacie_venteproduit']['upsert'], {nouveau})
+        self.assertEqual(filigrane('default'), curseur + 1)
+
+    def test_filtre_pharmacie(self):
+        a, b = uuid.uuid4(), uuid.uuid4()
+        lot_a, lot_b, taux, vente_b = uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        for table, objet_id, operation, pharmacie_id in [
+            ('pharmacie_lotproduitpharmacie', lot_a, 'D', a),
+            ('pharmacie_lotproduitpharmacie', lot_b, 'D', b),
+            ('pharmacie_venteproduit', vente_b, 'U', b),
+            ('pharmacie_tauxchange', taux, 'U', None),
+        ]:
+            JournalModification.objects.create(
+                table=table, objet_id=objet_id, operation=operation, txid=10, pharmacie_id=pharmacie_id,
+            )
+
+        # Les tables globales restent lues, les tables par pharmacie sont filtrées
+        changements, _ = lire_journal('default', 0, pharmacie=a)
+        self.assertEqual(changements['pharmacie_lotproduitpharmacie']['delete'], {lot_a})
+        self.assertEqual(changements['pharmacie_tauxchange']['upsert'], {taux})
+        self.assertNotIn('pharmacie_venteproduit', changements)
+
+    def test_purge_sous_le_plus_petit_curseur_acquitte(self):
+        from .synchronisation import acquitter, purger_journal, JournalPurge
+
+        ancien = timezone.now() - timedelta(days=10)
+        for txid in (10, 20, 30):
+            JournalModification.objects.create(
+                table='pharmacie_client', objet_id=uuid.uuid4(), operation='U', txid=txid, date=ancien,
+            )
+        acquitter('default', 'local_vers_remote:a', 20)
+        acquitter('default', 'local_vers_remote:b', 31)
+
+        self.assertEqual(purger_journal('default'), (20, 1))
+        self.assertEqual(sorted(JournalModification.objects.values_list('txid', flat=True)), [20, 30])
+        with self.assertRaises(JournalPurge):
+            lire_journal('default', 15)
+        self.assertEqual(len(lire_journal('default', 20)[0]['pharmacie_client']['upsert']), 2)
+
+        # Le journal récent est gardé même quand tout est acquitté
+        self.journaliser('U', uuid.uuid4(), 30)
+        acquitter('default', 'local_vers_remote:a', 31)
+        self.assertEqual(purger_journal('default'), (30, 1))
+
+
+from .synchronisation import conflits_uniques
+
+
+class ConflitsUniquesTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        pf = ProduitFabricant.objects.create(
+            fabricant=Fabricant.objects.create(nom="Fabricant", pays_origine="Inde"),
+            nom="Paracétamol", prix_achat=Decimal('100'),
+        )
+        self.existant = creer_produit_pharmacie(self.pharmacie, pf, "CB-1")
+        self.pf = pf
+
+    def test_code_barre_deja_pris(self):
+        meme_ligne = ProduitPharmacie(id=self.existant.id, code_barre="CB-1")
+        autre_ligne = ProduitPharmacie(id=uuid.uuid4(), code_barre="CB-1")
+        nouveau = ProduitPharmacie(id=uuid.uuid4(), code_barre="CB-2")
+        doublon = ProduitPharmacie(id=uuid.uuid4(), code_barre="CB-2")
+
+        with self.assertNumQueries(1):
+            conflits = conflits_uniques(ProduitPharmacie, 'default', [meme_ligne, autre_ligne, nouveau, doublon])
+        self.assertEqual(conflits, {autre_ligne.id, doublon.id})
+
+    def test_contrainte_composee(self):
+        Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0812345678")
+        meme_numero = Client(id=uuid.uuid4(), pharmacie=self.pharmacie, telephone="0812345678")
+        autre_numero = Client(id=uuid.uuid4(), pharmacie=self.pharmacie, telephone="0899999999")
+
+        conflits = conflits_uniques(Client, 'default', [meme_numero, autre_numero])
+        self.assertEqual(conflits, {meme_numero.id})
+
+
+import threading
+from comptes.models import Pharmacie
+from .synchronisation import executer_par_dependances
+
+
+class OrdonnancementSyncTest(TestCase):
+    MODELES = [VenteLigne, VenteProduit, ProduitPharmacie, Client, Pharmacie, ProduitFabricant, Fabricant]
+
+    def test_parents_avant_enfants(self):
+        termines = []
+        verrou = threading.Lock()
+
+        def tache(modele):
+            with verrou:
+                for parent in (f.related_model for f in modele._meta.fields if f.many_to_one):
+                    if parent in self.MODELES:
+                        self.assertIn(parent, termines)
+                termines.append(modele)
+            return modele.__name__
+
+        resultats = executer_par_dependances(self.MODELES, tache, max_workers=3)
+        self.assertEqual(set(resultats), set(self.MODELES))
+
+    def test_echec_bloque_les_descendants(self):
+        lances = []
+
+        def tache(modele):
+            lances.append(modele)
+            if modele is ProduitPharmacie:
+                raise RuntimeError("réseau")
+
+        with self.assertRaises(RuntimeError):
+            executer_par_dependances(self.MODELES, tache)
+        self.assertNotIn(VenteLigne, lances)
+        self.assertIn(Client, lances)
+
+
+from .synchronisation import upsert
+
+
+class UpsertTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+
+    def test_insertion_mise_a_jour_et_conflit(self):
+        existant = Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+        ancienne_date = timezone.now() - timedelta(days=3)
+
+        modifie = Client(id=existant.id, pharmacie=self.pharmacie, nom_complet="A modifié",
+                         telephone="0811111111", created_at=ancienne_date, updated_at=ancienne_date)
+        nouveau = Client(id=uuid.uuid4(), pharmacie=self.pharmacie, nom_complet="B",
+                         telephone="0822222222", created_at=ancienne_date, updated_at=ancienne_date)
+        doublon = Client(id=uuid.uuid4(), pharmacie=self.pharmacie, nom_complet="C",
+                         telephone="0811111111", created_at=ancienne_date, updated_at=ancienne_date)
+
+        ecrits, ecartes = upsert(Client, 'default', [modifie, nouveau, doublon])
+
+        self.assertEqual((ecrits, ecartes), (2, {doublon.id}))
+        self.assertEqual(Client.objects.get(pk=existant.id).nom_complet, "A modifié")
+        # Les dates de la source sont conservées (pas d'auto_now)
+        self.assertEqual(Client.objects.get(pk=nouveau.id).updated_at, ancienne_date)
+        self.assertTrue(Client._meta.get_field('updated_at').auto_now)
+
+
+import os
+import shutil
+import gzip
+import io
+import tarfile
+import tempfile
+from django.core.management.base import CommandError
+
+
+class PaquetSyncTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier)
+        self.chemin = os.path.join(self.dossier, 'paquet.tar')
+
+    def test_aller_retour(self):
+        client = Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+        date_creation = Client.objects.get(pk=client.pk).created_at
+        call_command('exporter_paquet_sync', sortie=self.chemin, stdout=StringIO())
+
+        Client.objects.all().delete()
+        call_command('importer_paquet_sync', self.chemin, stdout=StringIO())
+
+        restaure = Client.objects.get(pk=client.pk)
+        self.assertEqual(restaure.nom_complet, "A")
+        self.assertEqual(restaure.created_at, date_creation)
+
+    def test_paquet_ancien_n_ecrase_pas_les_donnees_recentes(self):
+        client = Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+        call_command('exporter_paquet_sync', sortie=self.chemin, stdout=StringIO())
+
+        # Modification reçue (synchro en direct) après l'export du paquet
+        client.nom_complet = "B"
+        client.save()
+        sortie = StringIO()
+        call_command('importer_paquet_sync', self.chemin, stdout=sortie)
+
+        self.assertEqual(Client.objects.get(pk=client.pk).nom_complet, "B")
+        self.assertIn("pharmacie.Client : 0 écrit(s), 0 supprimé(s), 1 déjà à jour", sortie.getvalue())
+
+    def test_delta_avec_suppression(self):
+        supprime = Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+        JournalModification.objects.create(
+            table='pharmacie_client', objet_id=supprime.pk, operation='D', txid=5, pharmacie_id=self.pharmacie.pk,
+        )
+
+        call_command('exporter_paquet_sync', sortie=self.chemin, depuis=1, stdout=StringIO())
+        with tarfile.open(self.chemin) as archive:
+            self.assertEqual(archive.getnames(), ['manifest.json', 'pharmacie.client.ndjson.gz'])
+
+        call_command('importer_paquet_sync', self.chemin, stdout=StringIO())
+        self.assertFalse(Client.objects.filter(pk=supprime.pk).exists())
+
+    def test_suppressions_limitees_a_la_pharmacie_du_paquet(self):
+        autre = creer_pharmacie("Autre pharmacie")
+        client_autre = Client.objects.create(pharmacie=autre, nom_complet="B", telephone="0822222222")
+        JournalModification.objects.create(
+            table='pharmacie_client', objet_id=client_autre.pk, operation='D', txid=5, pharmacie_id=autre.pk,
+        )
+
+        call_command('exporter_paquet_sync', sortie=self.chemin, depuis=1,
+                     pharmacie=str(self.pharmacie.pk), stdout=StringIO())
+        call_command('importer_paquet_sync', self.chemin, stdout=StringIO())
+        self.assertTrue(Client.objects.filter(pk=client_autre.pk).exists())
+
+    def test_vente_supprimee_puis_synchronisee_retiree_une_seule_fois(self):
+        client = Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+        vente = VenteProduit.objects.create(pharmacie=self.pharmacie, client=client, montant_total=Decimal('100'))
+        # Source : vente supprimée, total du client déjà diminué (300 -> 200)
+        Client.objects.filter(pk=client.pk).update(total_depense=Decimal('200'), updated_at=timezone.now())
+        for table, objet_id, operation in [
+            ('pharmacie_client', client.pk, 'U'), ('pharmacie_venteproduit', vente.pk, 'D'),
+        ]:
+            JournalModification.objects.create(
+                table=table, objet_id=objet_id, operation=operation, txid=5, pharmacie_id=self.pharmacie.pk,
+            )
+        call_command('exporter_paquet_sync', sortie=self.chemin, depuis=1, stdout=StringIO())
+
+        # Cible : la vente existe encore et le client est à 300
+        Client.objects.filter(pk=client.pk).update(
+            total_depense=Decimal('300'), updated_at=timezone.now() - timedelta(days=1),
+        )
+        call_command('importer_paquet_sync', self.chemin, stdout=StringIO())
+
+        self.assertFalse(VenteProduit.objects.filter(pk=vente.pk).exists())
+        self.assertEqual(Client.objects.get(pk=client.pk).total_depense, Decimal('200'))
+
+    def test_paquet_corrompu_refuse(self):
+        Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+        call_command('exporter_paquet_sync', sortie=self.chemin, stdout=StringIO())
+
+        # Réécrit l'archive avec un fichier de données altéré
+        altere = os.path.join(self.dossier, 'altere.tar')
+        with tarfile.open(self.chemin) as source, tarfile.open(altere, 'w') as cible:
+            for membre in source.getmembers():
+                contenu = source.extractfile(membre).read()
+                if membre.name == 'pharmacie.client.ndjson.gz':
+                    contenu = gzip.compress(b'{"pk": "x", "fields": {}}\n')
+                    membre.size = len(contenu)
+                cible.addfile(membre, io.BytesIO(contenu))
+
+        with self.assertRaises(CommandError):
+            call_command('importer_paquet_sync', altere, stdout=StringIO())
+
+
+from .synchronisation import MesuresSync
+
+
+class MesuresSyncTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+
+    def test_compte_requetes_et_duree(self):
+        mesures = MesuresSync(Client)
+        with mesures.mesurer('default'):
+            Client.objects.create(pharmacie=self.pharmacie, nom_complet="A", telephone="0811111111")
+            list(Client.objects.all())
+        mesures.crees = 1
+
+        rapport = mesures.en_dict()
+        self.assertEqual(rapport['modele'], 'Client')
+        self.assertEqual(rapport['crees'], 1)
+        self.assertEqual(rapport['requetes']['default'], 2)
+        self.assertGreater(rapport['octets_envoyes']['default'], 0)
+        self.assertGreaterEqual(rapport['duree'], 0)
+
+        # Hors du bloc, plus rien n'est compté
+        Client.objects.count()
+        self.assertEqual(mesures.requetes['default'], 2)
+        json.dumps(rapport)
+
+
+class RechercheProduitsTest(TestCase):
+    def setUp(self):
+        self.pharmacie = creer_pharmacie()
+        self.user = User.objects.create_user("caissier", "secret", pharmacie=self.pharmacie, role='comptable')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.fabricant = Fabricant.objects.create(nom="Pharmakina", pays_origine="RDC")
+        for i, nom in enumerate(["Amoxicilline 500", "Paracétamol 500", "Paracétamol 1000", "Ibuprofène"]):
+            pf = ProduitFabricant.objects.create(fabricant=self.fabricant, nom=nom, prix_achat=Decimal('100'))
+            creer_produit_pharmacie(self.pharmacie, pf, f"61{i}000", quantite=10)
+        autre = creer_pharmacie("Autre")
+        creer_produit_pharmacie(autre, pf, "99999", quantite=10)
+
+    def test_recherche_pharmacie(self):
+        reponse = self.api.get('/api/produits-pharmacie/recherche/', {'q': 'para'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([p['nom_medicament'] for p in reponse.data], ["Paracétamol 1000", "Paracétamol 500"])
+
+        # Préfixe : seuls les noms / codes qui commencent par le terme, code exact en tête
+        reponse = self.api.get('/api/produits-pharmacie/recherche/', {'q': '61', 'mode': 'prefixe', 'limite': 2})
+        self.assertEqual(len(reponse.data), 2)
+        reponse = self.api.get('/api/produits-pharmacie/recherche/', {'q': '612000', 'mode': 'prefixe'})
+        self.assertEqual(reponse.data[0]['nom_medicament'], "Paracétamol 1000")
+        reponse = self.api.get('/api/produits-pharmacie/recherche/', {'q': '500', 'mode': 'prefixe'})
+        self.assertEqual(reponse.data, [])
+
+        # Jamais les produits d'une autre pharmacie
+        reponse = self.api.get('/api/produits-pharmacie/recherche/', {'q': '99999'})
+        self.assertEqual(reponse.data, [])
+
+    def test_parametres_invalides(self):
+        self.assertEqual(self.api.get('/api/produits-pharmacie/recherche/').status_code, 400)
+        reponse = self.api.get('/api/produits-fabricants/recherche/', {'q': 'x', 'mode': 'regex'})
+        self.assertEqual(reponse.status_code, 400)
+
+    def test_recherche_catalogue(self):
+        reponse = self.api.get('/api/produits-fabricants/recherche/', {'q': 'ibu'})
+        self.assertEqual([p['nom'] for p in reponse.data], ["Ibuprofène"])
+        self.assertEqual(reponse.data[0]['fabricant_nom'], "Pharmakina")
+
+    def test_recherche_fabricant_sans_doublon(self):
+        Fabricant.objects.create(nom="Autre labo", pays_origine="Inde")
+        reponse = self.api.get('/api/fabricants/', {'search': 'para'})
+        self.assertEqual(reponse.data['count'], 1)
+        self.assertEqual(reponse.data['results'][0]['nombre_produits'], 4)
+
+        reponse = self.api.get('/api/fabricants/')
+        self.assertEqual(reponse.data['count'], 2)
+        self.assertEqual(sorted(f['nombre_produits'] for f in reponse.data['results']), [0, 4])
+
+
+class CaisseCatalogueTest(TestCase):
+    setUp = RechercheProduitsTest.setUp
+
+    def test_scan(self):
+        produit = ProduitPharmacie.objects.get(code_barre="610000")
+        LotProduitPharmacie.objects.create(produit=produit, quantite=0, date_peremption=date(2026, 1, 1))
+        proche = LotProduitPharmacie.objects.create(produit=produit, quantite=3, date_peremption=date(2027, 1, 1))
+        LotProduitPharmacie.objects.create(produit=produit, quantite=7, date_peremption=date(2029, 1, 1))
+
+        with self.assertNumQueries(1):
+            reponse = self.api.get('/api/produits-pharmacie/scan/610000/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['nom_medicament'], "Amoxicilline 500")
+        self.assertEqual(Decimal(reponse.data['prix_vente']), Decimal('150.00'))
+        self.assertEqual(reponse.data['lot']['id'], proche.id)
+        self.assertEqual(reponse.data['lot']['quantite'], 3)
+
+        self.assertIsNone(self.api.get('/api/produits-pharmacie/scan/611000/').data['lot'])
+        # Code inconnu ou d'une autre pharmacie
+        self.assertEqual(self.api.get('/api/produits-pharmacie/scan/99999/').status_code, 404)
+
+    def test_catalogue_versionne(self):
+        complet = self.api.get('/api/produits-pharmacie/catalogue/').data
+        self.assertTrue(complet['complet'])
+        self.assertEqual(len(complet['produits']), 4)
+
+        # Journal tel que l'écrivent les triggers PostgreSQL (modification locale,
+        # écriture reçue par la synchro, suppression, autre table, autre pharmacie)
+        modifie = ProduitPharmacie.objects.get(code_barre="610000")
+        recu = ProduitPharmacie.objects.get(code_barre="611000")
+        autre = ProduitPharmacie.objects.get(code_barre="99999")
+        supprime = uuid.uuid4()
+        version = complet['version']
+        for table, objet_id, operation, synchro, pharmacie_id in [
+            ('pharmacie_produitpharmacie', modifie.id, 'U', False, self.pharmacie.id),
+            ('pharmacie_produitpharmacie', recu.id, 'U', True, self.pharmacie.id),
+            ('pharmacie_produitpharmacie', supprime, 'D', False, self.pharmacie.id),
+            ('pharmacie_client', uuid.uuid4(), 'I', False, self.pharmacie.id),
+            ('pharmacie_produitpharmacie', autre.id, 'U', False, autre.pharmacie_id),
+            ('pharmacie_produitpharmacie', uuid.uuid4(), 'D', False, autre.pharmacie_id),
+        ]:
+            JournalModification.objects.create(
+                table=table, objet_id=objet_id, operation=operation, txid=version,
+                synchro=synchro, pharmacie_id=pharmacie_id,
+            )
+
+        delta = self.api.get('/api/produits-pharmacie/catalogue/', {'version': version}).data
+        self.assertFalse(delta['complet'])
+        self.assertEqual({p['id'] for p in delta['produits']}, {modifie.id, recu.id})
+        self.assertEqual(delta['supprimes'], [str(supprime)])
+
+        suivant = self.api.get('/api/produits-pharmacie/catalogue/', {'version': delta['version']}).data
+        self.assertEqual((suivant['produits'], suivant['supprimes']), ([], []))
+
+        # La synchro ne renvoie pas ce qu'elle a elle-même reçu
+        changements, _ = lire_journal('default', version, pharmacie=self.pharmacie)
+        self.assertEqual(changements['pharmacie_produitpharmacie']['upsert'], {modifie.id})
+
+        self.assertEqual(
+            self.api.get('/api/produits-pharmacie/catalogue/', {'version': 'x'}).status_code, 400)
+        self.assertEqual(
+            self.api.get('/api/produits-pharmacie/catalogue/', {'version': version + 100}).status_code, 400)
+
+        # Version antérieure à la purge du journal : catalogue complet
+        CurseurJournal.objects.create(consommateur=CurseurJournal.PURGE, txid=version + 1)
+        self.assertTrue(self.api.get('/api/produits-pharmacie/catalogue/', {'version': version}).data['complet'])
+
+
+class ChampsDynamiquesTest(TestCase):
+    setUp = RechercheProduitsTest.setUp
+
+    def test_selection_de_champs(self):
+        reponse = self.api.get('/api/produits-pharmacie/', {'fields': 'id,nom_medicament,prix_vente,inconnu'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.data), 4)
+        self.assertEqual(set(reponse.data[0]), {'id', 'nom_medicament', 'prix_vente'})
+
+        # Sans ?fields= : liste explicite, inchangée
+        reponse = self.api.get('/api/produits-pharmacie/')
+        self.assertIn('marge_beneficiaire', reponse.data[0])
+        self.assertIn('updated_at', reponse.data[0])
+
+        reponse = self.api.get('/api/produits-fabricants/', {'fields': 'nom,prix_achat_cdf'})
+        self.assertEqual(set(reponse.data['results'][0]), {'nom', 'prix_achat_cdf'})
+
+    def test_lots_sans_requete_par_lot(self):
+        for produit in ProduitPharmacie.objects.filter(pharmacie=self.pharmacie):
+            LotProduitPharmacie.objects.create(produit=produit, quantite=1, date_peremption=date(2030, 1, 1))
+        with self.assertNumQueries(1):
+            reponse = self.api.get('/api/lots/')
+        self.assertEqual(len(reponse.data), 4)
+        self.assertEqual(reponse.data[0]['pharmacie_id'], str(self.pharmacie.id))
+
+
+class RapportPeremptionTest(TestCase):
+    def setUp(self):
+        RechercheProduitsTest.setUp(self)
+        aujourdhui = timezone.localdate()
+        produit = ProduitPharmacie.objects.get(code_barre="610000")
+        for jours, quantite in [(-3, 2), (0, 1), (7, 4), (8, 5), (45, 6), (90, 7), (2, 0)]:
+            LotProduitPharmacie.objects.create(
+                produit=produit, quantite=quantite, prix_achat=Decimal('10'),
+                date_peremption=aujourdhui + timedelta(days=jours),
+            )
+
+    def test_tranches_en_une_requete(self):
+        with self.assertNumQueries(1):
+            reponse = self.api.get('/api/lotss/peremption/')
+        tranches = {t['tranche']: t for t in reponse.data['tranches']}
+        self.assertEqual(list(tranches), ['perimes', 'j7', 'j30', 'j60'])
+        self.assertEqual(
+            [(t['lots'], t['quantite']) for t in tranches.values()],
+            [(1, 2), (2, 5), (1, 5), (1, 6)],
+        )
+        self.assertEqual(tranches['j7']['valeur_achat'], Decimal('50'))
+        # Sans prix de lot, prix du produit (150 = 100 + 50 %)
+        self.assertEqual(tranches['j30']['valeur_vente'], Decimal('750'))
+
+    def test_detail_pagine(self):
+        with self.assertNumQueries(2):
+            reponse = self.api.get('/api/lotss/peremption/j7/', {'page_size': 1})
+        self.assertEqual(reponse.data['count'], 2)
+        self.assertEqual(reponse.data['results'][0]['quantite'], 1)
+        self.assertIsNotNone(reponse.data['next'])
+        self.assertEqual(self.api.get('/api/lotss/peremption/j90/').status_code, 404)
+
+
+class AlertesStockTest(TestCase):
+    def setUp(self):
+        RechercheProduitsTest.setUp(self)
+        # alerte_quantite = 5 : 2 => danger, 5 => warning, 10 => pas d'alerte
+        quantites = {"610000": 5, "611000": 2, "612000": 10, "613000": 0}
+        for code, quantite in quantites.items():
+            ProduitPharmacie.objects.filter(code_barre=code).update(quantite=quantite)
+
+    def test_liste_triee_par_urgence(self):
+        with self.assertNumQueries(2):
+            reponse = self.api.get('/api/produits-alerte/')
+        self.assertEqual(reponse.data['count'], 3)
+        self.assertEqual(
+            [(p['nom_medicament'], p['niveau_alerte']) for p in reponse.data['results']],
+            [("Ibuprofène", 'danger'), ("Paracétamol 500", 'danger'), ("Amoxicilline 500", 'warning')],
+        )
+
+    def test_mode_compte(self):
+        with self.assertNumQueries(1):
+            reponse = self.api.get('/api/produits-alerte/', {'compte': 1})
+        self.assertEqual(reponse.data, {'total': 3, 'danger': 2, 'warning': 1})
+
+
+class ReceptionGroupeeTest(TestCase):
+    def setUp(self):
+        RechercheProduitsTest.setUp(self)
+        self.commande = CommandeProduit.objects.create(pharmacie=self.pharmacie, fabricant=self.fabricant)
+        self.quinine = ProduitFabricant.objects.create(
+            fabricant=self.fabricant, nom="Quinine", prix_achat=Decimal('60'), nombre_plaquettes_par_boite=10,
+        )
+        self.lignes = [
+            CommandeProduitLigne.objects.create(
+                commande=self.commande, produit_fabricant=pf, quantite_commandee=5, prix_achat=pf.prix_achat,
+            )
+            for pf in [*ProduitFabricant.objects.filter(nom__in=["Amoxicilline 500", "Ibuprofène"]), self.quinine]
+        ]
+
+    def confirmer(self, lignes):
+        return self.api.post('/api/reception/confirm/', {
+            'commande': str(self.commande.id),
+            'lignes': [{'ligne_commande': str(ligne.id), 'quantite_recue': 3} for ligne in lignes],
+        }, format='json')
+
+    def test_stock_produits_et_lots(self):
+        reponse = self.confirmer(self.lignes)
+        self.assertEqual(reponse.status_code, 201)
+
+        amoxicilline = ProduitPharmacie.objects.get(code_barre="610000")
+        self.assertEqual(amoxicilline.quantite, 13)
+        self.assertEqual((amoxicilline.prix_achat, amoxicilline.prix_vente), (Decimal('100.00'), Decimal('150.00')))
+
+        # Produit jamais reçu : créé avec 3 boîtes × 10 plaquettes
+        quinine = ProduitPharmacie.objects.get(pharmacie=self.pharmacie, produit_fabricant=self.quinine)
+        self.assertEqual(quinine.quantite, 30)
+        self.assertEqual((quinine.prix_achat, quinine.prix_vente), (Decimal('6.00'), Decimal('8.10')))
+
+        lot = LotProduitPharmacie.objects.get(produit=quinine)
+        self.assertEqual((lot.quantite, lot.prix_achat), (30, Decimal('6.00')))
+        self.assertTrue(lot.numero_lot.startswith("lot-"))
+        self.assertEqual(ReceptionLigne.objects.filter(reception__commande=self.commande).count(), 3)
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.etat, 'confirmee')
+
+    def test_requetes_independantes_du_nombre_de_lignes(self):
+        with CaptureQueriesContext(connection) as une:
+            self.confirmer(self.lignes[:1])
+        with CaptureQueriesContext(connection) as trois:
+            self.confirmer(self.lignes)
+        self.assertEqual(len(une), len(trois) - 1)  # + bulk_create des produits manquants
+
+    def test_ligne_d_une_autre_commande(self):
+        autre = CommandeProduit.objects.create(pharmacie=self.pharmacie, fabricant=self.fabricant)
+        ligne = CommandeProduitLigne.objects.create(
+            commande=autre, produit_fabricant=self.quinine, quantite_commandee=1, prix_achat=Decimal('60'),
+        )
+        reponse = self.confirmer([ligne])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertFalse(ProduitPharmacie.objects.filter(produit_fabricant=self.quinine).exists())
+
+
+from .identifiants import identifiant_ordonne, generer_numero_lot, ALPHABET
+
+
+class IdentifiantsTest(TestCase):
+    def test_uniques_et_ordonnes_sans_requete(self):
+        with self.assertNumQueries(0):
+            ids = [identifiant_ordonne() for _ in range(5000)]
+        self.assertEqual(len(set(ids)), 5000)
+        self.assertEqual(ids, sorted(ids))
+        self.assertTrue(all(len(i) == 26 and set(i) <= set(ALPHABET) for i in ids))
+
+    def test_lot_sans_sondage_de_la_base(self):
+        pharmacie = creer_pharmacie()
+        fabricant = Fabricant.objects.create(nom="Fabricant", pays_origine="Inde")
+        pf = ProduitFabricant.objects.create(fabricant=fabricant, nom="Produit", prix_achat=Decimal('10'))
+        produit = creer_produit_pharmacie(pharmacie, pf, "CB-1")
+        with self.assertNumQueries(1):
+            lot = LotProduitPharmacie.objects.create(
+                produit=produit, quantite=1, date_peremption=date(2030, 1, 1),
+            )
+        self.assertTrue(lot.numero_lot.startswith("lot-"))
+
+        lots = [
+            LotProduitPharmacie(produit=produit, numero_lot=generer_numero_lot(), quantite=1, date_peremption=date(2030, 1, 1))
+            for _ in range(100)
+        ]
+        with self.assertNumQueries(1):
+            LotProduitPharmacie.objects.bulk_create(lots)
+
+
+from .taux import taux_actuel
+
+
+class CommandeFournisseurTest(TestCase):
+    def setUp(self):
+        RechercheProduitsTest.setUp(self)
+        TauxChange.objects.create(taux=Decimal('2800'))
+        self.produits = [
+            ProduitFabricant.objects.create(
+                fabricant=self.fabricant, nom=f"Produit {i}", prix_achat=Decimal('1.5'), devise='USD',
+            )
+            for i in range(6)
+        ]
+
+    def commander(self, produits):
+        return self.api.post('/api/commandes-produits/', {
+            'fabricant': str(self.fabricant.id),
+            'lignes': [{'produit_fabricant': str(p.id), 'quantite_commandee': 2} for p in produits],
+        }, format='json')
+
+    def test_requetes_constantes_et_prix_convertis(self):
+        taux_actuel()  # taux en cache, comme en production
+        with CaptureQueriesContext(connection) as deux:
+            self.assertEqual(self.commander(self.produits[:2]).status_code, 201)
+        with CaptureQueriesContext(connection) as quatre:
+            self.assertEqual(self.commander(self.produits[2:]).status_code, 201)
+        self.assertEqual(len(deux), len(quatre))
+
+        ligne = CommandeProduitLigne.objects.get(produit_fabricant=self.produits[0])
+        self.assertEqual(ligne.prix_achat, Decimal('4200.00'))
+
+    def test_produit_deja_commande_aujourdhui(self):
+        self.commander(self.produits[:2])
+        reponse = self.commander([self.produits[3], self.produits[1]])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual([e['produit'] for e in reponse.data['lignes']], ["Produit 1"])
+        self.assertEqual(CommandeProduit.objects.count(), 1)
+
+    def test_produit_inconnu(self):
+        reponse = self.api.post('/api/commandes-produits/', {
+            'fabricant': str(self.fabricant.id),
+            'lignes': [{'produit_fabricant': str(uuid.uuid4()), 'quantite_commandee': 1}],
+        }, format='json')
+        self.assertEqual(reponse.status_code, 400)
+
+
+class HistoriqueMouvementsTest(TestCase):
+    def setUp(self):
+        ReceptionGroupeeTest.setUp(self)
+        self.user.username = "magasinier"
+        self.user.save()
+
+    def test_quantites_recues_et_derniere_reception(self):
+        ReceptionGroupeeTest.confirmer(self, self.lignes[:1])
+        ReceptionGroupeeTest.confirmer(self, self.lignes[:2])
+        autre = CommandeProduit.objects.create(pharmacie=self.pharmacie, fabricant=self.fabricant)
+        CommandeProduitLigne.objects.create(
+            commande=autre, produit_fabricant=self.quinine, quantite_commandee=1, prix_achat=Decimal('60'),
+        )
+
+        with self.assertNumQueries(3):  # count, commandes, lignes préchargées
+            reponse = self.api.get('/api/historique-mouvements/')
+        self.assertEqual(reponse.data['count'], 2)
+        recente, commande = reponse.data['results']
+        self.assertEqual(recente['id'], str(autre.id))
+        self.assertIsNone(recente['date_reception'])
+        self.assertEqual(recente['produits'][0]['quantite_recue'], 0)
+
+        self.assertEqual(commande['utilisateur_reception'], "magasinier")
+        recues = {p['produit']: p['quantite_recue'] for p in commande['produits']}
+        self.assertEqual(recues, {"Amoxicilline 500": 6, "Ibuprofène": 3, "Quinine": 0})
@@ -20,6 +20,7 @@ from .views import (
     CommandeDetailView,
     CommandeProduitListView,
     TauxChangeViewSet,
+    TacheRecalculViewSet,
     produits_en_alerte,
     #ProduitsAlerteAPIView,
     RequisitionViewSet,
@@ -28,6 +29,7 @@ from .views import (
     rapport_general,
     historique_mouvements,
     HistoriqueVentesAPIView,
+    ExportHistoriqueAPIView,
     MeView, 
     reset_requisitions,
     delete_all_requisitions,
@@ -56,6 +58,7 @@ router = DefaultRouter()
 
 router.register(r'fabricants', FabricantViewSet)
 router.register(r'taux-change', TauxChangeViewSet)
+router.register(r'taches-recalcul', TacheRecalculViewSet)
 router.register(r'produits-fabricants', ProduitFabricantViewSet)
 router.register(r'produits-pharmacie', ProduitPharmacieViewSet, basename='produit-pharmacie')
 router.register(r'commandes-produits', CommandeProduitViewSet)
@@ -100,6 +103,7 @@ urlpatterns = [
     path('api/rapport-general/', rapport_general),
     path('api/historique-mouvements/', historique_mouvements, name='historique-mouvements'),
     path('api/historique-ventes/', HistoriqueVentesAPIView.as_view(), name='historique-ventes'),
+    path('api/export/<str:flux>/', ExportHistoriqueAPIView.as_view(), name='export-historique'),
 
     # Liste des produits d'une pharmacies
     path('api/commandes-produitss/', CommandeProduitListView.as_view(), name='liste-commandes-produits'),
@@ -3,7 +3,9 @@ import subprocess
 import os
 import string
 import platform
-from ctypes import windll
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
 
 def get_usb_path():
     """Détecte automatiquement le chemin de la clé USB multi-OS"""
@@ -28,6 +30,7 @@ def get_usb_path():
         
         elif system == "Windows":
             # Détection Windows
+            from ctypes import windll  # n'existe que sous Windows
             drives = []
             bitmask = windll.kernel32.GetLogicalDrives()
             for letter in string.ascii_uppercase:
@@ -59,4 +62,20 @@ def get_usb_path():
         if os.path.exists(path):
             return path
     
-    return None  # Aucune clé détectée
\ No newline at end of file
+    return None  # Aucune clé détectée
+
+def intervalle_jours(date_debut=None, date_fin=None):
+    """
+    Convertit des jours (bornes incluses) en intervalle semi-ouvert
+    [début 00:00, lendemain de la fin 00:00[ dans le fuseau local.
+
+    À utiliser à la place de `champ__date__gte/lte` : un filtre
+    `champ__gte=debut, champ__lt=fin` reste indexable sur (pharmacie, champ).
+    Une borne absente vaut None.
+    """
+    debut = fin = None
+    if date_debut:
+        debut = timezone.make_aware(datetime.combine(date_debut, time.min))
+    if date_fin:
+        fin = timezone.make_aware(datetime.combine(date_fin + timedelta(days=1), time.min))
+    return debut, fin
@@ -7,7 +7,8 @@ from django.shortcuts import get_object_or_404
 
 from django.db.models import Count
 from rest_framework import viewsets, filters
-from django.db.models import Count
+from django.db.models import Count, Exists, OuterRef, Q, Subquery, IntegerField
+from django.db.models.functions import Coalesce
 from .models import Fabricant
 from .serializers import FabricantDashboardSerializer, FabricantDetailSerializer
 from comptes.pagination import StandardResultsSetPagination
@@ -15,12 +16,23 @@ from comptes.pagination import StandardResultsSetPagination
 class FabricantViewSet(viewsets.ModelViewSet):
     queryset = Fabricant.objects.all()
     pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['nom', 'produits__nom']
 
     def get_queryset(self):
         if self.action == 'list':
-            return Fabricant.objects.annotate(nombre_produits=Count('produits'))
+            # ⚡ Sous-requêtes corrélées au lieu d'un JOIN + GROUP BY sur tous les produits :
+            # une ligne par fabricant, même quand la recherche porte sur les produits
+            nombre_produits = (
+                ProduitFabricant.objects.filter(fabricant=OuterRef('pk'))
+                .order_by().values('fabricant').annotate(n=Count('id')).values('n')
+            )
+            qs = Fabricant.objects.annotate(
+                nombre_produits=Coalesce(Subquery(nombre_produits, output_field=IntegerField()), 0)
+            )
+            # ?search= (mêmes règles que SearchFilter : chaque mot doit correspondre)
+            for terme in self.request.query_params.get('search', '').replace(',', ' ').split():
+                produits = ProduitFabricant.objects.filter(fabricant=OuterRef('pk'), nom__icontains=terme)
+                qs = qs.filter(Q(nom__icontains=terme) | Exists(produits))
+            return qs
         return super().get_queryset()
 
     def get_serializer_class(self):
@@ -35,6 +47,10 @@ from .models import ProduitFabricant
 from .serializers import ProduitFabricantSerializer
 
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.db.models import F
+from . import recherche
 
 # backend/monapp/views.py
 
@@ -49,37 +65,186 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 200
 
 class ProduitFabricantViewSet(viewsets.ModelViewSet):
-    queryset = ProduitFabricant.objects.all()
+    queryset = ProduitFabricant.objects.select_related('fabricant')
     serializer_class = ProduitFabricantSerializer
     pagination_class = StandardResultsSetPagination
     filter_backends = [filters.SearchFilter]
-    search_fields = ['nom', 'fabricant__nom']  # ✅ Utilise les champs indexés
+    search_fields = ['nom', 'fabricant__nom']  # ✅ Index trigrammes (migration 0008)
 
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=['get'])
+    def recherche(self, request):
+        """
+        GET /api/produits-fabricants/recherche/?q=para&mode=prefixe|floue&limite=20
+        Résultats classés (score décroissant), sans pagination.
+        """
+        terme, mode, limite = recherche.parametres(request)
+        produits = recherche.rechercher(
+            ProduitFabricant.objects.all(), ['nom', 'fabricant__nom'], terme, mode, limite,
+        ).values(
+            'id', 'nom', 'fabricant', 'prix_achat', 'devise', 'nombre_plaquettes_par_boite', 'score',
+            fabricant_nom=F('fabricant__nom'),
+        )
+        return Response(list(produits))
+
 
 class TauxChangeViewSet(viewsets.ModelViewSet):
     queryset = TauxChange.objects.all().order_by('-date')  # Le plus récent en haut
     serializer_class = TauxChangeSerializer
     permission_classes = [IsAuthenticated]
+    # ⚡ Le recalcul des prix n'est plus fait ici : la réponse contient
+    # `tache_recalcul`, à suivre via /api/taches-recalcul/<id>/
+
+from .models import TacheRecalcul
+from .serializers import TacheRecalculSerializer
+
+class TacheRecalculViewSet(viewsets.ReadOnlyModelViewSet):
+    """Suivi des tâches de recalcul des prix (statut + progression)."""
+    queryset = TacheRecalcul.objects.all().order_by('-created_at')
+    serializer_class = TacheRecalculSerializer
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=True, methods=['post'])
+    def relancer(self, request, pk=None):
+        """Relance une tâche échouée à partir de son dernier paquet validé."""
+        tache = self.get_object()
+        if tache.statut != 'echouee':
+            return Response({'detail': "Seule une tâche échouée peut être relancée."}, status=400)
+        tache = tache.relancer()
+        return Response(self.get_serializer(tache).data)
 
 #################Enregistrement des nouvelle medicament##############
 from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.db.models import OuterRef, Subquery
+from .models import LotProduitPharmacie
+from .synchronisation import filigrane, lire_journal, par_paquets, JournalPurge
+from .serializers import champs_demandes
+
+
+def colonnes_demandees(qs, request):
+    """Avec ?fields=, ne lit en base que les colonnes demandées."""
+    demandes = champs_demandes(request)
+    if not demandes:
+        return qs
+    colonnes = demandes & {f.name for f in qs.model._meta.concrete_fields}
+    return qs.only(*colonnes) if colonnes else qs.only('pk')
 from .models import ProduitPharmacie
 from .serializers import ProduitPharmacieSerializer
 
+# Champs utiles à la caisse (recherche, scan, catalogue)
+CHAMPS_CAISSE = (
+    'id', 'nom_medicament', 'code_barre', 'prix_vente', 'quantite',
+    'conditionnement', 'localisation', 'date_peremption',
+)
+CHAMPS_LOT = ('id', 'numero_lot', 'date_peremption', 'quantite')
+
 class ProduitPharmacieViewSet(viewsets.ModelViewSet):
     serializer_class = ProduitPharmacieSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         # Filtrer par pharmacie de l'utilisateur connecté
-        return ProduitPharmacie.objects.filter(pharmacie=self.request.user.pharmacie)
+        qs = ProduitPharmacie.objects.filter(pharmacie=self.request.user.pharmacie)
+        if self.action in ('list', 'retrieve'):
+            qs = colonnes_demandees(qs, self.request)
+        return qs
 
     def perform_create(self, serializer):
         serializer.save(pharmacie=self.request.user.pharmacie)
 
+    @action(detail=False, methods=['get'])
+    def recherche(self, request):
+        """
+        GET /api/produits-pharmacie/recherche/?q=amox&mode=prefixe|floue&limite=20
+        Recherche caisse sur nom_medicament et code_barre, meilleur résultat d'abord.
+        """
+        terme, mode, limite = recherche.parametres(request)
+        produits = recherche.rechercher(
+            self.get_queryset(), ['nom_medicament', 'code_barre'], terme, mode, limite,
+        ).values(*CHAMPS_CAISSE, 'score')
+        return Response(list(produits))
+
+    @action(detail=False, methods=['get'], url_path=r'scan/(?P<code>[^/]+)')
+    def scan(self, request, code=None):
+        """
+        GET /api/produits-pharmacie/scan/<code>/ : lecture d'un code-barre à la caisse.
+        Une seule requête (index unique code_barre + lot_produit_peremption_idx).
+        """
+        lot = (
+            LotProduitPharmacie.objects
+            .filter(produit=OuterRef('pk'), quantite__gt=0)
+            .order_by('date_peremption', 'date_entree')
+        )
+        produit = (
+            self.get_queryset().filter(code_barre=code)
+            .annotate(**{f'lot_{champ}': Subquery(lot.values(champ)[:1]) for champ in CHAMPS_LOT})
+            .values(*CHAMPS_CAISSE, *(f'lot_{champ}' for champ in CHAMPS_LOT))
+            .first()
+        )
+        if produit is None:
+            return Response({'detail': "Aucun produit avec ce code-barre."}, status=404)
+
+        # Lot le plus proche de la péremption encore en stock (None si aucun)
+        lot = {champ: produit.pop(f'lot_{champ}') for champ in CHAMPS_LOT}
+        produit['lot'] = lot if lot['id'] else None
+        return Response(produit)
+
+    @action(detail=False, methods=['get'])
+    def catalogue(self, request):
+        """
+        GET /api/produits-pharmacie/catalogue/?version=<n>
+
+        Catalogue caisse versionné : sans `version`, tous les produits de la
+        pharmacie ; avec la `version` reçue au dernier appel, seulement les
+        produits modifiés et les ids supprimés depuis (lus dans
+        JournalModification). La réponse donne la `version` à renvoyer ensuite.
+        """
+        qs = self.get_queryset()
+
+        def complet():
+            nouvelle_version = filigrane(qs.db)
+            return Response({
+                'version': nouvelle_version,
+                'complet': True,
+                'produits': list(qs.order_by('nom_medicament').values(*CHAMPS_CAISSE)),
+                'supprimes': [],
+            })
+
+        version = request.query_params.get('version')
+        # Sans pharmacie, rien à lire dans le journal (il serait lu sans filtre)
+        if version in (None, '') or request.user.pharmacie_id is None:
+            return complet()
+
+        try:
+            version = int(version)
+        except ValueError:
+            return Response({'version': "Entier attendu."}, status=400)
+        if version < 0 or version > filigrane(qs.db):
+            return Response({'version': "Version inconnue, recharger le catalogue complet."}, status=400)
+
+        try:
+            changements, nouvelle_version = lire_journal(
+                qs.db, version, tables=[ProduitPharmacie._meta.db_table], synchro=True,
+                pharmacie=request.user.pharmacie_id,
+            )
+        except JournalPurge:
+            # Caisse restée hors ligne plus longtemps que la rétention du journal
+            return complet()
+        table = changements.get(ProduitPharmacie._meta.db_table, {'upsert': set(), 'delete': set()})
+        produits = []
+        for ids in par_paquets(table['upsert']):
+            produits.extend(qs.filter(pk__in=ids).values(*CHAMPS_CAISSE))
+        return Response({
+            'version': nouvelle_version,
+            'complet': False,
+            'produits': produits,
+            'supprimes': sorted(str(pk) for pk in table['delete']),
+        })
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -265,62 +430,145 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.utils.dateparse import parse_date
+from django.db.models import Prefetch, Sum
+from .models import VenteLigne
 from .serializers import HistoriqueVenteSerializer, HistoriqueDepenseSerializer
+from .pagination import PaginationCurseur
+from .utils import intervalle_jours
+from django.http import StreamingHttpResponse
+from .exports import lignes_ventes, lignes_depenses, flux_csv, flux_ndjson
+import uuid
 
 # views.py
 class HistoriqueVentesAPIView(APIView):
+    """
+    Ventes et dépenses de la pharmacie, du plus récent au plus ancien.
+
+    Les deux flux sont paginés séparément par curseur :
+      - `curseur_ventes` / `curseur_depenses` : valeurs renvoyées dans
+        `suivant_ventes` / `suivant_depenses` (null en fin de liste) ;
+      - `flux=ventes` ou `flux=depenses` pour ne charger qu'un seul flux ;
+      - `page_size` (50 par défaut, 500 max).
+    `totaux` (montants sur toute la période) n'est calculé qu'à la première page.
+    """
     permission_classes = [IsAuthenticated]
 
+    pagination_ventes = PaginationCurseur('date_vente', 'curseur_ventes')
+    pagination_depenses = PaginationCurseur('date_depense', 'curseur_depenses')
+
     def get(self, request):
         pharmacie = request.user.pharmacie
         date_debut = request.GET.get('date_debut')
         date_fin = request.GET.get('date_fin')
+        flux = request.GET.get('flux')
+
+        # Dates invalides ignorées, comme avant
+        try:
+            date_debut = parse_date(date_debut) if date_debut else None
+        except ValueError:
+            date_debut = None
+        try:
+            date_fin = parse_date(date_fin) if date_fin else None
+        except ValueError:
+            date_fin = None
 
-        # DEBUG : pour voir le type de champ
-        # print("Champ date_vente:", VenteProduit._meta.get_field('date_vente'))
+        reponse = {}
 
         # --- VENTES ---
-        ventes = VenteProduit.objects.filter(pharmacie=pharmacie)
+        if flux in (None, 'ventes'):
+            # Intervalle semi-ouvert sur date_vente (et non date_vente__date) :
+            # l'index (pharmacie, date_vente) est utilisé
+            ventes = VenteProduit.objects.filter(pharmacie=pharmacie)
+            debut, fin = intervalle_jours(date_debut, date_fin)
+            if debut:
+                ventes = ventes.filter(date_vente__gte=debut)
+            if fin:
+                ventes = ventes.filter(date_vente__lt=fin)
+
+            if not request.GET.get('curseur_ventes'):
+                reponse.setdefault('totaux', {})['ventes'] = (
+                    ventes.aggregate(total=Sum('montant_total'))['total'] or 0
+                )
 
-        if date_debut:
-            try:
-                parsed_date = parse_date(date_debut)
-                # ✅ Supposons que date_vente est DateTimeField → utilise __date
-                ventes = ventes.filter(date_vente__date__gte=parsed_date)
-            except:
-                pass
+            ventes = ventes.select_related('utilisateur', 'client').prefetch_related(
+                Prefetch('lignes', queryset=VenteLigne.objects.select_related('produit'))
+            )
+            page, suivant = self.pagination_ventes.paginer(ventes, request)
+            reponse['ventes'] = HistoriqueVenteSerializer(page, many=True).data
+            reponse['suivant_ventes'] = suivant
 
-        if date_fin:
-            try:
-                parsed_date = parse_date(date_fin)
-                ventes = ventes.filter(date_vente__date__lte=parsed_date)
-            except:
-                pass
+        # --- DÉPENSES ---
+        if flux in (None, 'depenses'):
+            # date_depense est un DateField : comparaison directe sur le jour
+            depenses = Depense.objects.filter(pharmacie=pharmacie)
+            if date_debut:
+                depenses = depenses.filter(date_depense__gte=date_debut)
+            if date_fin:
+                depenses = depenses.filter(date_depense__lte=date_fin)
+
+            if not request.GET.get('curseur_depenses'):
+                reponse.setdefault('totaux', {})['depenses'] = (
+                    depenses.aggregate(total=Sum('montant'))['total'] or 0
+                )
 
-        ventes = ventes.order_by('-date_vente')
+            page, suivant = self.pagination_depenses.paginer(depenses.select_related('cree_par'), request)
+            reponse['depenses'] = HistoriqueDepenseSerializer(page, many=True).data
+            reponse['suivant_depenses'] = suivant
 
-        # --- DÉPENSES ---
-        depenses = Depense.objects.filter(pharmacie=pharmacie)
+        return Response(reponse)
 
-        if date_debut:
-            parsed_date = parse_date(date_debut)
-            # ✅ date_depense est DateField → pas de __date
-            depenses = depenses.filter(date_depense__gte=parsed_date)
+class ExportHistoriqueAPIView(APIView):
+    """
+    GET /api/export/ventes/ ou /api/export/depenses/
 
-        if date_fin:
-            parsed_date = parse_date(date_fin)
-            depenses = depenses.filter(date_depense__lte=parsed_date)
+    Paramètres : `type` (csv par défaut, ou ndjson), `date_debut`, `date_fin`
+    (jours inclus, AAAA-MM-JJ) et `utilisateur` (id). Le paramètre `format`
+    est réservé par DRF, d'où `type`.
+    """
+    permission_classes = [IsAuthenticated]
 
-        depenses = depenses.order_by('-date_depense')
+    TYPES = {
+        'csv': (flux_csv, 'text/csv; charset=utf-8'),
+        'ndjson': (flux_ndjson, 'application/x-ndjson; charset=utf-8'),
+    }
 
-        # Sérialisation
-        ventes_serialized = HistoriqueVenteSerializer(ventes, many=True).data
-        depenses_serialized = HistoriqueDepenseSerializer(depenses, many=True).data
+    def get(self, request, flux):
+        if flux not in ('ventes', 'depenses'):
+            return Response({"error": "Export inconnu."}, status=404)
 
-        return Response({
-            "ventes": ventes_serialized,
-            "depenses": depenses_serialized,
-        })
+        pharmacie = request.user.pharmacie
+        type_export = request.GET.get('type', 'csv')
+        if type_export not in self.TYPES:
+            return Response({"error": "type doit valoir 'csv' ou 'ndjson'."}, status=400)
+
+        jours = {}
+        for param in ('date_debut', 'date_fin'):
+            valeur = request.GET.get(param)
+            try:
+                jours[param] = parse_date(valeur) if valeur else None
+            except ValueError:
+                jours[param] = None
+            if valeur and jours[param] is None:
+                return Response({"error": f"{param} invalide (format AAAA-MM-JJ)."}, status=400)
+
+        utilisateur_id = request.GET.get('utilisateur')
+        if utilisateur_id:
+            try:
+                utilisateur_id = uuid.UUID(utilisateur_id)
+            except ValueError:
+                return Response({"error": "utilisateur invalide (identifiant UUID attendu)."}, status=400)
+
+        if flux == 'ventes':
+            debut, fin = intervalle_jours(jours['date_debut'], jours['date_fin'])
+            lignes, entetes = lignes_ventes(pharmacie, debut, fin, utilisateur_id)
+        else:
+            lignes, entetes = lignes_depenses(pharmacie, jours['date_debut'], jours['date_fin'], utilisateur_id)
+
+        generateur, content_type = self.TYPES[type_export]
+        reponse = StreamingHttpResponse(generateur(lignes, entetes), content_type=content_type)
+        nom = '_'.join([flux] + [str(j) for j in jours.values() if j])
+        reponse['Content-Disposition'] = f'attachment; filename="{nom}.{type_export}"'
+        return reponse
 
 ##################" Statistique Vente #################"
 class ProduitPharmacieListAPIView(generics.ListAPIView):
@@ -329,7 +577,7 @@ class ProduitPharmacieListAPIView(generics.ListAPIView):
     
     def get_queryset(self):
         pharmacie_id = self.request.query_params.get('pharmacie')
-        return ProduitPharmacie.objects.filter(pharmacie_id=pharmacie_id)
+        return colonnes_demandees(ProduitPharmacie.objects.filter(pharmacie_id=pharmacie_id), self.request)
 
 class PharmacieUserListAPIView(generics.ListAPIView):
     serializer_class = PharmacieSerializer
@@ -483,32 +731,29 @@ from rest_framework.decorators import api_view
 from .models import ProduitPharmacie
 from django.db.models import F
 
+from . import stock
+from .serializers import ProduitAlerteSerializer
+from comptes.pagination import StandardResultsSetPagination
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def produits_en_alerte(request):
+    """
+    Produits en alerte de la pharmacie de l'utilisateur, paginés, les plus
+    urgents d'abord. ?compte=1 : seulement les totaux (badge).
+    """
     # On récupère la pharmacie de l'utilisateur connecté
     user = request.user
-    if not hasattr(user, 'pharmacie'):
+    if not getattr(user, 'pharmacie', None):
         return Response({"detail": "Utilisateur sans pharmacie liée."}, status=403)
 
-    # On filtre les produits de SA pharmacie uniquement
-    produits = ProduitPharmacie.objects.filter(
-        pharmacie=user.pharmacie,
-        quantite__lte=F('alerte_quantite')
-    )
-
-    result = []
-    for p in produits:
-        niveau = 'danger' if p.quantite <= p.alerte_quantite / 2 else 'warning'
-        result.append({
-            'id': p.id,
-            'nom_medicament': p.nom_medicament,
-            'quantite': p.quantite,
-            'alerte_quantite': p.alerte_quantite,
-            'niveau_alerte': niveau
-        })
+    if request.query_params.get('compte'):
+        return Response(stock.compter_alertes(user.pharmacie))
 
-    return Response(result)
+    # ⚡ Niveau calculé en SQL (Case/When), tri par urgence
+    paginator = StandardResultsSetPagination()
+    page = paginator.paginate_queryset(stock.produits_en_alerte(user.pharmacie), request)
+    return paginator.get_paginated_response(ProduitAlerteSerializer(page, many=True).data)
 
 # pharmacie/views.py
 from rest_framework.views import APIView
@@ -522,8 +767,11 @@ from .serializers import ProduitAlerteSerializer,RequisitionSerializer
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from datetime import date
-from django.db.models import Sum, F
-from .models import VenteProduit, VenteLigne
+from django.utils import timezone
+from .statistiques import resume_ventes
+
+# ⚡ Les deux vues ci-dessous lisent le cumul VenteJournaliere (une ligne par
+# jour et par produit) au lieu des lignes de vente brutes.
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -531,41 +779,9 @@ def statistiques_du_jour(request):
     user = request.user
     pharmacie = user.pharmacie  # ou lié via profil
 
-    today = date.today()
-
-    ventes_du_jour = VenteProduit.objects.filter(
-        pharmacie=pharmacie,
-        date_vente__date=today
-    )
-
-    total_ventes = ventes_du_jour.aggregate(total=Sum('montant_total'))['total'] or 0
+    today = timezone.localdate()
 
-    lignes_du_jour = VenteLigne.objects.filter(
-        vente__in=ventes_du_jour
-    )
-
-    chiffre_affaire = lignes_du_jour.aggregate(total=Sum('total'))['total'] or 0
-
-    # Bénéfice = (Prix_vente - Prix_achat) * quantite
-    lignes = lignes_du_jour.annotate(
-        benefice_unitaire=(F('prix_unitaire') - F('produit__prix_achat')) * F('quantite')
-    )
-    benefice = lignes.aggregate(total=Sum('benefice_unitaire'))['total'] or 0
-
-    # Produit le plus vendu
-    produit_plus_vendu = (
-        lignes_du_jour.values('produit__nom_medicament')
-        .annotate(qte=Sum('quantite'))
-        .order_by('-qte')
-        .first()
-    )
-
-    return Response({
-        "chiffre_affaire": chiffre_affaire,
-        "benefice": benefice,
-        "total_ventes": total_ventes,
-        "produit_plus_vendu": produit_plus_vendu['produit__nom_medicament'] if produit_plus_vendu else "Aucun"
-    })
+    return Response(resume_ventes(pharmacie, today, today))
 
 
 ################## Rapport Générale ######################################"
@@ -573,8 +789,7 @@ def statistiques_du_jour(request):
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from datetime import date, timedelta
-from django.db.models import Sum, F
-from .models import VenteProduit, VenteLigne
+from django.utils.dateparse import parse_date
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -583,7 +798,8 @@ def rapport_general(request):
     pharmacie = user.pharmacie  # Assurez-vous que l'utilisateur est lié à une pharmacie
 
     periode = request.GET.get('periode', 'jour')
-    today = date.today()
+    today = timezone.localdate()
+    date_fin = today
 
     if periode == 'jour':
         date_debut = today
@@ -591,41 +807,22 @@ def rapport_general(request):
         date_debut = today - timedelta(days=today.weekday())
     elif periode == 'mois':
         date_debut = today.replace(day=1)
+    elif periode == 'personnalise':
+        try:
+            date_debut = parse_date(request.GET.get('date_debut') or '')
+            date_fin = parse_date(request.GET.get('date_fin') or '') or today
+        except ValueError:
+            date_debut = None
+        if date_debut is None or date_debut > date_fin:
+            return Response({'error': 'Dates invalides (format AAAA-MM-JJ)'}, status=400)
     else:
         return Response({'error': 'Période invalide'}, status=400)
 
-    ventes = VenteProduit.objects.filter(
-        pharmacie=pharmacie,
-        date_vente__date__gte=date_debut,
-        date_vente__date__lte=today
-    )
-
-    total_ventes = ventes.aggregate(total=Sum('montant_total'))['total'] or 0
-
-    lignes = VenteLigne.objects.filter(vente__in=ventes)
-
-    chiffre_affaire = lignes.aggregate(total=Sum('total'))['total'] or 0
-
-    lignes = lignes.annotate(
-        benefice_unitaire=(F('prix_unitaire') - F('produit__prix_achat')) * F('quantite')
-    )
-    benefice = lignes.aggregate(total=Sum('benefice_unitaire'))['total'] or 0
-
-    produit_plus_vendu = (
-        lignes.values('produit__nom_medicament')
-        .annotate(qte=Sum('quantite'))
-        .order_by('-qte')
-        .first()
-    )
-
     return Response({
         "periode": periode,
         "date_debut": date_debut,
-        "date_fin": today,
-        "chiffre_affaire": chiffre_affaire,
-        "benefice": benefice,
-        "total_ventes": total_ventes,
-        "produit_plus_vendu": produit_plus_vendu['produit__nom_medicament'] if produit_plus_vendu else "Aucun"
+        "date_fin": date_fin,
+        **resume_ventes(pharmacie, date_debut, date_fin),
     })
 
 from rest_framework.views import APIView
@@ -654,7 +851,8 @@ class RequisitionViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if hasattr(user, "pharmacie") and user.pharmacie:
-            return Requisition.objects.filter(pharmacie=user.pharmacie)
+            # nom_produit / fabricant_nom / prix_achat sans requête par réquisition
+            return Requisition.objects.filter(pharmacie=user.pharmacie).select_related('produit_fabricant__fabricant')
         return Requisition.objects.none()
 
     def create(self, request, *args, **kwargs):
@@ -730,16 +928,40 @@ def incrementer_demande(request, pk):
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import CommandeProduit
+from django.db.models import OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+from comptes.pagination import StandardResultsSetPagination
+from .models import CommandeProduit, CommandeProduitLigne, ReceptionProduit
 from .serializers import MouvementCommandeSerializer
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def historique_mouvements(request):
+    """
+    Commandes de la pharmacie, les plus récentes d'abord, paginées. Quantités
+    reçues et dernière réception annotées : nombre de requêtes fixe par page.
+    """
     pharmacie = request.user.pharmacie
-    commandes = CommandeProduit.objects.filter(pharmacie=pharmacie).order_by('-date_commande')
-    serializer = MouvementCommandeSerializer(commandes, many=True)
-    return Response(serializer.data)
+    derniere_reception = ReceptionProduit.objects.filter(commande=OuterRef('pk')).order_by('-date_reception')
+    lignes = (
+        CommandeProduitLigne.objects
+        .select_related('produit_fabricant')
+        .annotate(quantite_recue=Coalesce(Sum('receptionligne__quantite_recue'), 0))
+    )
+    commandes = (
+        CommandeProduit.objects
+        .filter(pharmacie=pharmacie)
+        .select_related('fabricant')
+        .annotate(
+            date_reception=Subquery(derniere_reception.values('date_reception')[:1]),
+            utilisateur_reception=Subquery(derniere_reception.values('utilisateur__username')[:1]),
+        )
+        .prefetch_related(Prefetch('lignes', queryset=lignes))
+        .order_by('-date_commande', '-pk')
+    )
+    paginator = StandardResultsSetPagination()
+    page = paginator.paginate_queryset(commandes, request)
+    return paginator.get_paginated_response(MouvementCommandeSerializer(page, many=True).data)
 
 
 from rest_framework.views import APIView
@@ -1034,9 +1256,13 @@ def modifier_prix_produit(request, produit_id):
 
     produit.save()
 
+    # Le recalcul des prix en pharmacie se fait en arrière-plan
+    tache = getattr(produit, 'tache_recalcul', None)
+
     return Response({
         'success': True,
         'message': 'Produit mis à jour',
+        'tache_recalcul': tache.id if tache else None,
         'data': {
             'nom': produit.nom,
             'prix_achat': produit.prix_achat,
@@ -1121,7 +1347,7 @@ class LotProduitPharmacieViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = LotProduitPharmacie.objects.all()
+        queryset = LotProduitPharmacie.objects.select_related('produit')
 
         # ✅ Récupération de la pharmacie (priorité à user.pharmacie, sinon query param)
         pharmacie = getattr(user, 'pharmacie', None)
@@ -1189,8 +1415,31 @@ from django.utils import timezone
 from datetime import timedelta
 import logging
 
+from decimal import Decimal
+from django.db.models import Case, CharField, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+from comptes.pagination import StandardResultsSetPagination
+
 logger = logging.getLogger(__name__)
 
+# (code, libellé, dernier jour de la tranche à partir d'aujourd'hui)
+TRANCHES_PEREMPTION = (
+    ('perimes', 'Périmés', -1),
+    ('j7', 'Dans 7 jours', 7),
+    ('j30', 'Dans 30 jours', 30),
+    ('j60', 'Dans 60 jours', 60),
+)
+
+def bornes_tranche(code, aujourdhui):
+    """(premier jour ou None, dernier jour) de la tranche `code`, bornes incluses."""
+    debut = None
+    for tranche, _, jours in TRANCHES_PEREMPTION:
+        fin = aujourdhui + timedelta(days=jours)
+        if tranche == code:
+            return debut, fin
+        debut = fin + timedelta(days=1)
+    raise KeyError(code)
+
 class LotsProduitPharmacieViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = LotsProduitPharmacieSerializer
@@ -1207,7 +1456,7 @@ class LotsProduitPharmacieViewSet(viewsets.ModelViewSet):
         else:
             return LotProduitPharmacie.objects.none()
 
-        return LotProduitPharmacie.objects.filter(produit__pharmacie=pharmacie)
+        return LotProduitPharmacie.objects.filter(produit__pharmacie=pharmacie).select_related('produit')
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -1251,6 +1500,74 @@ class LotsProduitPharmacieViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    def _lots_en_stock(self):
+        # Les lots vides ne représentent plus de risque de perte
+        return self.get_queryset().filter(quantite__gt=0)
+
+    @action(detail=False, methods=['get'])
+    def peremption(self, request):
+        """
+        GET /api/lotss/peremption/ : lots, quantités et valeur du stock par
+        tranche de péremption (périmés / 7 / 30 / 60 jours), en une requête
+        groupée. Les tranches sont disjointes (j30 = du 8e au 30e jour).
+        """
+        aujourdhui = timezone.localdate()
+        bornes = {code: bornes_tranche(code, aujourdhui) for code, _, _ in TRANCHES_PEREMPTION}
+        tranche = Case(
+            *[When(date_peremption__lte=fin, then=Value(code)) for code, (_, fin) in bornes.items()],
+            default=Value(None), output_field=CharField(),
+        )
+        prix_achat = Coalesce('prix_achat', 'produit__prix_achat')
+        prix_vente = Coalesce('prix_vente', 'produit__prix_vente')
+        lignes = (
+            self._lots_en_stock()
+            .filter(date_peremption__lte=bornes['j60'][1])
+            .annotate(tranche=tranche)
+            .order_by()
+            .values('tranche')
+            .annotate(
+                lots=Count('id'),
+                stock=Sum('quantite'),
+                valeur_achat=Sum(F('quantite') * prix_achat, output_field=DecimalField(max_digits=14, decimal_places=2)),
+                valeur_vente=Sum(F('quantite') * prix_vente, output_field=DecimalField(max_digits=14, decimal_places=2)),
+            )
+        )
+        par_tranche = {ligne.pop('tranche'): ligne for ligne in lignes}
+
+        tranches = []
+        for code, libelle, _ in TRANCHES_PEREMPTION:
+            debut, fin = bornes[code]
+            ligne = par_tranche.get(code, {})
+            tranches.append({
+                'tranche': code,
+                'libelle': libelle,
+                'debut': debut,
+                'fin': fin,
+                'lots': ligne.get('lots', 0),
+                'quantite': ligne.get('stock') or 0,
+                'valeur_achat': ligne.get('valeur_achat') or Decimal('0'),
+                'valeur_vente': ligne.get('valeur_vente') or Decimal('0'),
+            })
+        return Response({'date': aujourdhui, 'tranches': tranches})
+
+    @action(detail=False, methods=['get'], url_path=r'peremption/(?P<tranche>[a-z0-9]+)')
+    def peremption_lots(self, request, tranche=None):
+        """
+        GET /api/lotss/peremption/<tranche>/?page=1 : lots en stock d'une
+        tranche, paginés, du plus proche de la péremption au plus lointain.
+        """
+        if tranche not in {code for code, _, _ in TRANCHES_PEREMPTION}:
+            return Response({'detail': "Tranche inconnue."}, status=404)
+        debut, fin = bornes_tranche(tranche, timezone.localdate())
+        lots = self._lots_en_stock().filter(date_peremption__lte=fin)
+        if debut is not None:
+            lots = lots.filter(date_peremption__gte=debut)
+        lots = lots.order_by('date_peremption', 'id')
+
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(lots, request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
 ############# PUBLICITE MEDICAMENT #####################
 # views.py
 from datetime import date